@@ -4,7 +4,7 @@ import json
 import sqlite3
 import pandas as pd
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import jieba
 import difflib
@@ -13,17 +13,314 @@ from datetime import datetime
 import time
 from io import StringIO
 import traceback
-from simple_date_utils import parse_date
+from simple_date_utils import parse_date, parse_date_values, parse_time_values, get_parse_stats, merge_parse_stats, reset_parse_stats
+from simple_number_utils import parse_number, parse_number_values
 import hashlib
 import subprocess
 import platform
 import socket
+import threading
+import logging
+import uuid
+import base64
+import unicodedata
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
 
 # 增加Flask请求大小限制
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 设置为100MB
 CORS(app)
 
+# 日志：分级输出到stderr（Electron读取），可选写入轮转日志文件
+#---------------------------------
+LOG_LEVEL = os.environ.get('BACKEND_LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('BACKEND_LOG_FILE')  # 为空时不写日志文件
+LOG_FILE_MAX_BYTES = int(os.environ.get('BACKEND_LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_FILE_BACKUP_COUNT = int(os.environ.get('BACKEND_LOG_BACKUP_COUNT', 3))
+ROW_LOG_LIMIT = int(os.environ.get('BACKEND_ROW_LOG_LIMIT', 20))  # 每个文件每类逐行诊断最多输出的条数
+
+logger = logging.getLogger("backend")
+# 进度行固定为 "Progress: 12.50%" 格式，不受日志级别影响，Electron按此格式解析
+progress_logger = logging.getLogger("backend.progress")
+
+row_log_lock = threading.Lock()
+row_log_counts = {}  # 分类 -> 当前文件已出现的逐行诊断次数
+
+
+def configure_logging(level=None, log_file=None):
+    """
+    配置日志输出
+
+    stderr上普通日志以级别开头，进度行只输出消息本身；
+    指定log_file时同时写入按大小轮转的日志文件（仅主进程，工作进程只写stderr）。
+    """
+    import multiprocessing
+    from logging.handlers import RotatingFileHandler
+
+    level = (level or LOG_LEVEL).upper()
+    log_file = log_file if log_file is not None else LOG_FILE
+
+    for target in (logger, progress_logger):
+        for handler in list(target.handlers):
+            target.removeHandler(handler)
+            handler.close()
+        target.propagate = False
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    logger.addHandler(stream_handler)
+    progress_handler = logging.StreamHandler(sys.stderr)
+    progress_handler.setFormatter(logging.Formatter("%(message)s"))
+    progress_logger.addHandler(progress_handler)
+
+    if log_file and multiprocessing.parent_process() is None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT, encoding="utf-8"
+            )
+            file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            logger.addHandler(file_handler)
+            progress_logger.addHandler(file_handler)
+        except OSError as e:
+            logger.warning("无法打开日志文件 %s: %s", log_file, e)
+
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    progress_logger.setLevel(logging.INFO)
+
+
+def log_event(event, **fields):
+    """以一行JSON记录结构化事件（如每块的处理摘要）"""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
+
+
+def log_progress(percent, label="Progress"):
+    """输出进度行，格式固定为 "<label>: 12.50%" """
+    progress_logger.info("%s: %.2f%%", label, percent)
+
+
+def log_row_event(category, message, *args):
+    """
+    逐行诊断（转换错误、超大整数、逐行插入重试等）
+
+    只在DEBUG级别输出，每个文件每类最多ROW_LOG_LIMIT条，默认关闭时只有一次级别判断的开销。
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    with row_log_lock:
+        count = row_log_counts.get(category, 0) + 1
+        row_log_counts[category] = count
+    if count <= ROW_LOG_LIMIT:
+        logger.debug(message, *args)
+    elif count == ROW_LOG_LIMIT + 1:
+        logger.debug("%s: 已输出 %d 条逐行诊断，其余省略", category, ROW_LOG_LIMIT)
+
+
+def reset_row_log_counts():
+    """开始处理新文件时重置逐行诊断计数"""
+    with row_log_lock:
+        row_log_counts.clear()
+
+
+configure_logging()
+
+# 性能指标：按阶段累计次数、耗时和行数，通过/api/metrics查看，并附加到任务的最终统计中
+#---------------------------------
+metrics_lock = threading.Lock()
+stage_metrics = {}  # (阶段, 标签元组) -> {"count", "seconds", "rows", "max_seconds"}
+metrics_started_at = time.time()
+
+
+def record_stage(stage, seconds, rows=0, **labels):
+    """累计一次阶段耗时，labels用于区分同一阶段的子类（如转换的目标类型）"""
+    key = (stage, tuple(sorted(labels.items())))
+    with metrics_lock:
+        entry = stage_metrics.get(key)
+        if entry is None:
+            entry = stage_metrics[key] = {"count": 0, "seconds": 0.0, "rows": 0, "max_seconds": 0.0}
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["rows"] += rows
+        if seconds > entry["max_seconds"]:
+            entry["max_seconds"] = seconds
+
+
+@contextmanager
+def time_stage(stage, rows=0, **labels):
+    """计时一个代码块并计入阶段指标"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, rows, **labels)
+
+
+def _timed_chunks(chunks, stage="read"):
+    """计时从迭代器取出每一块的耗时（即读取耗时），块为DataFrame或 (DataFrame, ...) 元组"""
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        df = chunk[0] if isinstance(chunk, tuple) else chunk
+        record_stage(stage, time.perf_counter() - start, len(df))
+        yield chunk
+
+
+def metrics_snapshot():
+    """当前累计指标的副本，键为 (阶段, 标签元组)"""
+    with metrics_lock:
+        return {key: dict(entry) for key, entry in stage_metrics.items()}
+
+
+def parse_stats_delta(before, after=None):
+    """日期时间批量解析统计在两次读取之间的增量"""
+    after = get_parse_stats() if after is None else after
+    return {kind: {name: value - before.get(kind, {}).get(name, 0) for name, value in stats.items()}
+            for kind, stats in after.items()}
+
+
+def merge_metrics(snapshot, parse_stats=None):
+    """合并其他进程（并行导入的工作进程）的阶段指标和解析统计增量"""
+    if parse_stats:
+        merge_parse_stats(parse_stats)
+    with metrics_lock:
+        for key, delta in snapshot.items():
+            entry = stage_metrics.setdefault(key, {"count": 0, "seconds": 0.0, "rows": 0, "max_seconds": 0.0})
+            entry["count"] += delta["count"]
+            entry["seconds"] += delta["seconds"]
+            entry["rows"] += delta["rows"]
+            entry["max_seconds"] = max(entry["max_seconds"], delta["max_seconds"])
+
+
+def metrics_delta(before, after=None):
+    """两次快照之间的增量（max_seconds取后一次的值）"""
+    after = metrics_snapshot() if after is None else after
+    delta = {}
+    for key, entry in after.items():
+        base = before.get(key, {"count": 0, "seconds": 0.0, "rows": 0})
+        if entry["count"] > base["count"]:
+            delta[key] = {
+                "count": entry["count"] - base["count"],
+                "seconds": entry["seconds"] - base["seconds"],
+                "rows": entry["rows"] - base["rows"],
+                "max_seconds": entry["max_seconds"]
+            }
+    return delta
+
+
+def format_metrics(snapshot):
+    """
+    转为可JSON序列化的列表
+
+    Returns:
+        list[dict]: stage、labels、count、seconds、rows、rows_per_second、avg_ms、max_ms
+    """
+    result = []
+    for (stage, labels), entry in sorted(snapshot.items()):
+        seconds = entry["seconds"]
+        result.append({
+            "stage": stage,
+            "labels": dict(labels),
+            "count": entry["count"],
+            "seconds": round(seconds, 6),
+            "rows": entry["rows"],
+            "rows_per_second": round(entry["rows"] / seconds, 1) if seconds > 0 and entry["rows"] else None,
+            "avg_ms": round(seconds / entry["count"] * 1000, 3) if entry["count"] else None,
+            "max_ms": round(entry["max_seconds"] * 1000, 3)
+        })
+    return result
+
+
+def format_prometheus_metrics(snapshot, parse_stats):
+    """转为Prometheus文本格式"""
+    def label_text(stage, labels):
+        pairs = [("stage", stage)] + list(labels)
+        escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    lines = [
+        "# HELP backend_stage_seconds_total Total time spent in each stage",
+        "# TYPE backend_stage_seconds_total counter",
+    ]
+    lines += [f"backend_stage_seconds_total{label_text(s, l)} {e['seconds']:.6f}" for (s, l), e in sorted(snapshot.items())]
+    lines += ["# HELP backend_stage_calls_total Number of timed calls per stage",
+              "# TYPE backend_stage_calls_total counter"]
+    lines += [f"backend_stage_calls_total{label_text(s, l)} {e['count']}" for (s, l), e in sorted(snapshot.items())]
+    lines += ["# HELP backend_stage_rows_total Rows handled per stage",
+              "# TYPE backend_stage_rows_total counter"]
+    lines += [f"backend_stage_rows_total{label_text(s, l)} {e['rows']}" for (s, l), e in sorted(snapshot.items())]
+    lines += ["# HELP backend_stage_max_seconds Longest single call per stage",
+              "# TYPE backend_stage_max_seconds gauge"]
+    lines += [f"backend_stage_max_seconds{label_text(s, l)} {e['max_seconds']:.6f}" for (s, l), e in sorted(snapshot.items())]
+
+    lines += ["# HELP backend_parse_values_total Date/time values parsed by path",
+              "# TYPE backend_parse_values_total counter"]
+    for kind, stats in sorted(parse_stats.items()):
+        lines.append(f'backend_parse_values_total{{kind="{kind}",path="fast"}} {stats["fast_values"]}')
+        lines.append(f'backend_parse_values_total{{kind="{kind}",path="fallback"}} {stats["fallback_values"]}')
+    lines += ["# HELP backend_parse_seconds_total Date/time parsing time by path",
+              "# TYPE backend_parse_seconds_total counter"]
+    for kind, stats in sorted(parse_stats.items()):
+        lines.append(f'backend_parse_seconds_total{{kind="{kind}",path="fast"}} {stats["fast_seconds"]:.6f}')
+        lines.append(f'backend_parse_seconds_total{{kind="{kind}",path="fallback"}} {stats["fallback_seconds"]:.6f}')
+    lines.append("# HELP backend_uptime_seconds Seconds since metrics started")
+    lines.append("# TYPE backend_uptime_seconds gauge")
+    lines.append(f"backend_uptime_seconds {time.time() - metrics_started_at:.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    """清零阶段指标和日期时间解析统计"""
+    global metrics_started_at
+    with metrics_lock:
+        stage_metrics.clear()
+        metrics_started_at = time.time()
+    reset_parse_stats()
+
+
+def collect_job_metrics(metrics_before, parse_before, started):
+    """任务开始以来的指标增量，附加到任务的最终统计中（同时运行的其他任务的指标也会计入）"""
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "stages": format_metrics(metrics_delta(metrics_before)),
+        "parse": parse_stats_delta(parse_before)
+    }
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    在cProfile下运行func，统计文件写入数据目录下的profiles目录
+
+    只统计当前进程，并行导入时工作进程中的读取和转换不在其中。
+
+    Returns:
+        (func的返回值, dict): 统计文件路径和按累计耗时排序的前30个函数
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+
+    profile_dir = os.path.join(get_data_dir(), "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"{func.__name__}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.prof")
+    profiler.dump_stats(path)
+    summary = StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+    logger.info("性能分析结果已写入: %s", path)
+    return result, {"path": path, "summary": summary.getvalue()}
+
 # 验证模块 - 新增
 #---------------------------------
 def get_hardware_id():
@@ -219,51 +516,562 @@ default_template = {
 
 templates["默认模板"] = default_template.copy()
 
+
+# 持久化设置存储：模板、同义词和最近文件保存在数据目录下的SQLite文件中
+#---------------------------------
+SETTINGS_DB_NAME = "settings.db"
+
+settings_lock = threading.RLock()
+settings_loaded = False
+
+
+def get_data_dir():
+    """数据目录：BACKEND_DATA_DIR环境变量指定的目录（Electron传入userData目录），默认为用户主目录下的隐藏目录"""
+    data_dir = os.environ.get('BACKEND_DATA_DIR') or os.path.join(os.path.expanduser("~"), ".bank_statement_merger")
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def get_settings_db_path():
+    """设置文件路径：数据目录下的settings.db"""
+    return os.path.join(get_data_dir(), SETTINGS_DB_NAME)
+
+
+def _connect_settings():
+    conn = sqlite3.connect(get_settings_db_path(), timeout=30)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS templates (
+        name TEXT PRIMARY KEY,
+        definition TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        is_default INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS recent_files (
+        path TEXT PRIMARY KEY,
+        used_at REAL NOT NULL
+    )
+    """)
+    return conn
+
+
+def ensure_settings_loaded():
+    """
+    首次使用时从设置文件加载模板、模板版本和最近文件（只加载一次）
+    
+    设置文件中没有模板时写入内置的默认模板。
+    """
+    global settings_loaded, default_template, recent_files, templates_generation
+
+    if settings_loaded:
+        return
+    with settings_lock:
+        if settings_loaded:
+            return
+        try:
+            conn = _connect_settings()
+            try:
+                rows = conn.execute(
+                    "SELECT name, definition, version, is_default FROM templates ORDER BY rowid"
+                ).fetchall()
+                if rows:
+                    templates.clear()
+                    for name, definition, version, is_default in rows:
+                        templates[name] = json.loads(definition)
+                        template_versions[name] = version
+                        if is_default:
+                            default_template = templates[name].copy()
+                else:
+                    with conn:
+                        for name in templates:
+                            template_versions[name] = template_versions.get(name, 0) + 1
+                            _write_template(conn, name)
+                # 模板已替换，清空按旧模板计算的缓存
+                with mapping_lock:
+                    mapping_indexes.clear()
+                    mapping_memo.clear()
+                    templates_generation += 1
+                recent_files = [row[0] for row in conn.execute(
+                    "SELECT path FROM recent_files ORDER BY used_at DESC LIMIT ?", (MAX_RECENT_FILES,)
+                )]
+            finally:
+                conn.close()
+            logger.info("已加载设置: %d 个模板, %d 个最近文件", len(templates), len(recent_files))
+        except (sqlite3.Error, OSError, ValueError) as e:
+            # 设置文件不可用时继续使用内存中的默认值
+            logger.error("加载设置失败，使用默认模板: %s", e)
+        settings_loaded = True
+
+
+def _write_template(conn, name, is_default=False):
+    conn.execute(
+        "INSERT INTO templates (name, definition, version, is_default, updated_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET definition = excluded.definition, version = excluded.version, "
+        "is_default = excluded.is_default, updated_at = excluded.updated_at",
+        (name, json.dumps(templates[name], ensure_ascii=False), template_versions.get(name, 0),
+         int(is_default), datetime.now().isoformat())
+    )
+    if is_default:
+        conn.execute("UPDATE templates SET is_default = 0 WHERE name != ?", (name,))
+
+
+def persist_template(name, is_default=None):
+    """
+    在一个事务中保存模板；模板已被删除时从设置文件中删除
+    
+    Args:
+        is_default: 为None时保持原有的默认模板标记
+    """
+    with settings_lock:
+        try:
+            conn = _connect_settings()
+            try:
+                with conn:
+                    if name not in templates:
+                        conn.execute("DELETE FROM templates WHERE name = ?", (name,))
+                        return
+                    if is_default is None:
+                        row = conn.execute("SELECT is_default FROM templates WHERE name = ?", (name,)).fetchone()
+                        is_default = bool(row and row[0])
+                    _write_template(conn, name, is_default)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error("保存模板失败 %s: %s", name, e)
+
+
+def persist_recent_file(file_path):
+    """记录最近使用的文件，只保留最近MAX_RECENT_FILES个"""
+    with settings_lock:
+        try:
+            conn = _connect_settings()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO recent_files (path, used_at) VALUES (?, ?)",
+                                 (file_path, time.time()))
+                    conn.execute(
+                        "DELETE FROM recent_files WHERE path NOT IN "
+                        "(SELECT path FROM recent_files ORDER BY used_at DESC LIMIT ?)",
+                        (MAX_RECENT_FILES,)
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error("保存最近文件失败: %s", e)
+
+
+@app.before_request
+def load_settings_before_request():
+    ensure_settings_loaded()
+#---------------------------------
+
 def create_database(db_path):
     """Create a new SQLite database with the standard schema"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = get_connection(db_path, write=True)
+    try:
+        cursor = conn.cursor()
 
-    # Create main table with standard columns - 修改ID和row_number为TEXT类型
-    columns = [
-        "ID TEXT PRIMARY KEY",  # 改为TEXT类型
-        "记账日期 TEXT",
-        "记账时间 TEXT",
-        "账户名 TEXT",
-        "账号 TEXT",
-        "开户行 TEXT",
-        "币种 TEXT",
-        "借贷 TEXT",
-        "交易金额 REAL",
-        "交易渠道 TEXT",
-        "网点名称 TEXT",
-        "附言 TEXT",
-        "余额 REAL",
-        "对手账户名 TEXT",
-        "对手账号 TEXT",
-        "对手开户行 TEXT",
-        "source_file TEXT",
-        "row_number TEXT"  # 改为TEXT类型
-    ]
+        # Create main table with standard columns - 修改ID和row_number为TEXT类型
+        columns = [
+            "ID TEXT PRIMARY KEY",  # 改为TEXT类型
+            "记账日期 TEXT",
+            "记账时间 TEXT",
+            "账户名 TEXT",
+            "账号 TEXT",
+            "开户行 TEXT",
+            "币种 TEXT",
+            "借贷 TEXT",
+            "交易金额 REAL",
+            "交易渠道 TEXT",
+            "网点名称 TEXT",
+            "附言 TEXT",
+            "余额 REAL",
+            "对手账户名 TEXT",
+            "对手账号 TEXT",
+            "对手开户行 TEXT",
+            "source_file TEXT",
+            "row_number TEXT"  # 改为TEXT类型
+        ]
     
-    cursor.execute(f"CREATE TABLE IF NOT EXISTS transactions ({', '.join(columns)})")
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS transactions ({', '.join(columns)})")
     
-    # 创建带新列的rejected_rows表，确保row_number为TEXT类型
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS rejected_rows (
-        id INTEGER PRIMARY KEY,
-        source_file TEXT,
-        row_number TEXT,
-        column_name TEXT,
-        target_column TEXT,
-        original_value TEXT,
-        raw_data TEXT,
-        reason TEXT
-    )
-    """)
+        # 被拒绝行：原始行、表头和单元格错误分表保存，旧版rejected_rows表在此迁移
+        ensure_rejected_storage(cursor)
     
-    conn.commit()
-    conn.close()
+        # 统计汇总表，由触发器增量维护
+        ensure_stats_tables(conn)
+    
+        # 导入台账：记录每个已导入文件的指纹，用于跳过未变化的文件和只导入追加的行
+        ensure_ingest_ledger(cursor)
+    
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# SQLite写入配置：合并期间使用，合并结束后恢复持久化设置
+# cache_size为负数时单位为KiB
+SQLITE_INGEST_PROFILES = {
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "temp_store": "DEFAULT",
+        "mmap_size": 0
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -262144,  # 256MB
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456  # 256MB
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -1048576,  # 1GB
+        "temp_store": "MEMORY",
+        "mmap_size": 1073741824  # 1GB
+    }
+}
+DEFAULT_INGEST_PROFILE = "balanced"
+
+# 合并结束后恢复的持久化设置
+SQLITE_DURABLE_PRAGMAS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL"
+}
+
+
+def apply_sqlite_pragmas(conn, pragmas):
+    """依次设置PRAGMA，返回读取到的实际生效值"""
+    applied = {}
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+        row = conn.execute(f"PRAGMA {name}").fetchone()
+        applied[name] = row[0] if row else None
+    return applied
+
+
+def apply_ingest_profile(conn, profile_name):
+    """
+    为合并过程应用指定的SQLite写入配置
+    
+    Returns:
+        dict: 配置名称和实际生效的PRAGMA值
+    """
+    pragmas = SQLITE_INGEST_PROFILES[profile_name]
+    applied = apply_sqlite_pragmas(conn, pragmas)
+    logger.info("应用写入配置 %s: %s", profile_name, applied)
+    return {"name": profile_name, "pragmas": applied}
+
+
+def restore_durable_settings(conn, attempts=20):
+    """
+    合并结束后合并WAL并恢复回滚日志和完全同步
+
+    退出WAL需要独占数据库：先关闭连接池中该数据库的空闲只读连接，仍有连接在使用时稍后重试。
+    """
+    error = None
+    for attempt in range(attempts):
+        try:
+            conn.commit()
+            if isinstance(conn, PooledConnection):
+                close_database_connections(conn.db_key, include_writer=False)
+            if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            applied = apply_sqlite_pragmas(conn, SQLITE_DURABLE_PRAGMAS)
+            if str(applied["journal_mode"]).lower() == SQLITE_DURABLE_PRAGMAS["journal_mode"].lower():
+                return
+            error = f"journal_mode仍为{applied['journal_mode']}"
+        except sqlite3.Error as e:
+            error = e
+        time.sleep(0.1)
+    logger.error("恢复数据库持久化设置失败: %s", error)
+
+
+# 数据库连接池
+# 每个数据库（按绝对路径）保留少量空闲的只读连接和一个写连接。连接的PRAGMA只在创建时设置一次，
+# 页缓存在请求之间得以保留；所有写操作都通过写连接进行，同一时间只有一个线程持有写连接。
+# get_connection返回的连接调用close()即归还连接池；数据库文件被替换（inode变化）后旧连接不再复用。
+#---------------------------------
+POOL_MAX_IDLE = int(os.environ.get('BACKEND_POOL_SIZE', 4))  # 每个数据库保留的空闲只读连接数
+POOL_IDLE_SECONDS = float(os.environ.get('BACKEND_POOL_IDLE_SECONDS', 300))  # 空闲超过该时间的连接被关闭
+POOL_WRITE_TIMEOUT = float(os.environ.get('BACKEND_POOL_WRITE_TIMEOUT', 60))  # 等待写连接的最长时间（秒）
+
+# 连接池连接的PRAGMA（按连接生效），cache_size为负数时单位为KiB
+SQLITE_POOL_PRAGMAS = {
+    "cache_size": -32768,  # 32MB
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,  # 256MB
+    "busy_timeout": 30000
+}
+
+db_pools = {}
+db_pools_lock = threading.Lock()
+pool_checkouts = threading.local()  # 当前线程借出的连接，请求结束时兜底归还
+
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接：close()归还连接池，close_handle()才真正关闭"""
+
+    def close(self):
+        release_connection(self)
+
+    def close_handle(self):
+        sqlite3.Connection.close(self)
+
+
+def _db_identity(db_path):
+    """数据库文件的标识，文件被删除重建后会变化"""
+    try:
+        stat = os.stat(db_path)
+        return (stat.st_dev, stat.st_ino)
+    except OSError:
+        return None
+
+
+def _new_pool(identity):
+    return {
+        "identity": identity,
+        "idle": [],  # [(连接, 归还时间)]
+        "in_use": 0,
+        "writer": None,
+        "writer_lock": threading.RLock(),
+        "writer_depth": 0,
+        "writer_released_at": time.time(),
+        "stats": {"created": 0, "reused": 0, "closed": 0, "read_checkouts": 0,
+                  "write_checkouts": 0, "write_wait_seconds": 0.0}
+    }
+
+
+def _open_pooled_connection(db_path, write):
+    conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False, factory=PooledConnection)
+    for name, value in SQLITE_POOL_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    if not write:
+        conn.execute("PRAGMA query_only = ON")
+    conn.db_key = db_path
+    conn.is_writer = write
+    return conn
+
+
+def _evict_idle_connections(now):
+    """关闭空闲超时的连接，删除没有连接的连接池（调用时持有db_pools_lock）"""
+    for key in list(db_pools):
+        pool = db_pools[key]
+        keep = []
+        for conn, released_at in pool["idle"]:
+            if now - released_at > POOL_IDLE_SECONDS:
+                conn.close_handle()
+                pool["stats"]["closed"] += 1
+            else:
+                keep.append((conn, released_at))
+        pool["idle"] = keep
+        if (pool["writer"] is not None and pool["writer_depth"] == 0
+                and now - pool["writer_released_at"] > POOL_IDLE_SECONDS
+                and pool["writer_lock"].acquire(blocking=False)):
+            try:
+                pool["writer"].close_handle()
+                pool["writer"] = None
+                pool["stats"]["closed"] += 1
+            finally:
+                pool["writer_lock"].release()
+        if not pool["idle"] and pool["in_use"] == 0 and pool["writer"] is None:
+            del db_pools[key]
+
+
+def _get_pool(db_path, now):
+    """取得数据库的连接池，数据库文件被替换时丢弃旧的空闲连接（调用时持有db_pools_lock）"""
+    _evict_idle_connections(now)
+    identity = _db_identity(db_path)
+    pool = db_pools.get(db_path)
+    if pool is None:
+        pool = db_pools[db_path] = _new_pool(identity)
+    elif pool["identity"] != identity:
+        for conn, _ in pool["idle"]:
+            conn.close_handle()
+            pool["stats"]["closed"] += 1
+        pool["idle"] = []
+        pool["identity"] = identity
+        if pool["writer"] is not None and pool["writer_depth"] == 0 and pool["writer_lock"].acquire(blocking=False):
+            try:
+                pool["writer"].close_handle()
+                pool["writer"] = None
+                pool["stats"]["closed"] += 1
+            finally:
+                pool["writer_lock"].release()
+    return pool
+
+
+def get_connection(db_path, write=False):
+    """
+    从连接池借出数据库连接，用完调用close()归还
+
+    只读连接设置了query_only；write为True时返回数据库唯一的写连接，同一线程可以重复借出，
+    其他线程等待至多POOL_WRITE_TIMEOUT秒，超时抛出sqlite3.OperationalError。
+    """
+    db_path = os.path.abspath(db_path)
+    if write:
+        with db_pools_lock:
+            pool = _get_pool(db_path, time.time())
+            pool["in_use"] += 1
+        wait_start = time.perf_counter()
+        if not pool["writer_lock"].acquire(timeout=POOL_WRITE_TIMEOUT):
+            with db_pools_lock:
+                pool["in_use"] -= 1
+            raise sqlite3.OperationalError(f"等待数据库写连接超时（{POOL_WRITE_TIMEOUT}秒）: {db_path}")
+        with db_pools_lock:
+            pool["stats"]["write_checkouts"] += 1
+            pool["stats"]["write_wait_seconds"] += time.perf_counter() - wait_start
+            try:
+                if pool["writer"] is None or pool["identity"] != _db_identity(db_path):
+                    if pool["writer"] is not None:
+                        pool["writer"].close_handle()
+                        pool["writer"] = None
+                        pool["stats"]["closed"] += 1
+                    pool["writer"] = _open_pooled_connection(db_path, True)
+                    pool["identity"] = _db_identity(db_path)
+                    pool["stats"]["created"] += 1
+                elif pool["writer_depth"] == 0:
+                    pool["stats"]["reused"] += 1
+            except Exception:
+                # 打开写连接失败时归还计数并释放写锁，否则其他线程会一直等待
+                pool["in_use"] -= 1
+                pool["writer_lock"].release()
+                raise
+            pool["writer_depth"] += 1
+            conn = pool["writer"]
+    else:
+        with db_pools_lock:
+            pool = _get_pool(db_path, time.time())
+            pool["in_use"] += 1
+            pool["stats"]["read_checkouts"] += 1
+            if pool["idle"]:
+                conn = pool["idle"].pop()[0]
+                pool["stats"]["reused"] += 1
+            else:
+                conn = None
+                pool["stats"]["created"] += 1
+        if conn is None:
+            try:
+                conn = _open_pooled_connection(db_path, False)
+            except Exception:
+                with db_pools_lock:
+                    pool["in_use"] -= 1
+                raise
+
+    checkouts = getattr(pool_checkouts, "conns", None)
+    if checkouts is None:
+        checkouts = pool_checkouts.conns = []
+    checkouts.append(conn)
+    return conn
+
+
+def release_connection(conn):
+    """归还连接：未提交的事务回滚（与直接关闭连接一致），空闲连接超过POOL_MAX_IDLE时关闭"""
+    checkouts = getattr(pool_checkouts, "conns", None)
+    if checkouts and conn in checkouts:
+        checkouts.remove(conn)
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+    except sqlite3.Error:
+        pass
+
+    with db_pools_lock:
+        pool = db_pools.get(conn.db_key)
+        if conn.is_writer:
+            if pool is None or pool["writer"] is not conn:
+                conn.close_handle()
+                return
+            pool["writer_depth"] -= 1
+            pool["in_use"] -= 1
+            if pool["writer_depth"] == 0:
+                # 合并时可能改过cache_size等设置，恢复连接池的默认值
+                try:
+                    for name, value in SQLITE_POOL_PRAGMAS.items():
+                        conn.execute(f"PRAGMA {name} = {value}")
+                except sqlite3.Error:
+                    pool["writer"] = None
+                    conn.close_handle()
+                pool["writer_released_at"] = time.time()
+            pool["writer_lock"].release()
+            return
+
+        if pool is None:
+            conn.close_handle()
+            return
+        pool["in_use"] -= 1
+        if len(pool["idle"]) < POOL_MAX_IDLE and pool["identity"] == _db_identity(conn.db_key):
+            pool["idle"].append((conn, time.time()))
+        else:
+            conn.close_handle()
+            pool["stats"]["closed"] += 1
+
+
+def close_database_connections(db_path=None, include_writer=True):
+    """关闭数据库（不指定时为全部数据库）的空闲连接，include_writer为False时保留写连接，返回关闭的连接数"""
+    closed = 0
+    with db_pools_lock:
+        keys = [os.path.abspath(db_path)] if db_path else list(db_pools)
+        for key in keys:
+            pool = db_pools.get(key)
+            if pool is None:
+                continue
+            count = len(pool["idle"])
+            for conn, _ in pool["idle"]:
+                conn.close_handle()
+            pool["idle"] = []
+            if (include_writer and pool["writer"] is not None and pool["writer_depth"] == 0
+                    and pool["writer_lock"].acquire(blocking=False)):
+                try:
+                    pool["writer"].close_handle()
+                    pool["writer"] = None
+                    count += 1
+                finally:
+                    pool["writer_lock"].release()
+            pool["stats"]["closed"] += count
+            closed += count
+            if pool["in_use"] == 0 and pool["writer"] is None:
+                del db_pools[key]
+    return closed
+
+
+def connection_pool_stats():
+    """连接池统计：每个数据库的空闲连接数、借出数、写连接状态和累计计数"""
+    with db_pools_lock:
+        databases = {
+            key: {
+                "idle": len(pool["idle"]),
+                "in_use": pool["in_use"],
+                "writer_open": pool["writer"] is not None,
+                "writer_busy": pool["writer_depth"] > 0,
+                **{name: round(value, 4) if isinstance(value, float) else value
+                   for name, value in pool["stats"].items()}
+            }
+            for key, pool in db_pools.items()
+        }
+    return {
+        "max_idle": POOL_MAX_IDLE,
+        "idle_seconds": POOL_IDLE_SECONDS,
+        "write_timeout": POOL_WRITE_TIMEOUT,
+        "databases": databases
+    }
+
+
+@app.teardown_request
+def release_request_connections(exc=None):
+    """请求中未归还的连接（如提前返回时漏掉close）在请求结束时归还，避免写连接被一直占用"""
+    checkouts = getattr(pool_checkouts, "conns", None)
+    while checkouts:
+        conn = checkouts[-1]
+        logger.warning("请求结束时连接未归还，已自动归还: %s", conn.db_key)
+        release_connection(conn)
+#---------------------------------
 
 
 def update_recent_files(file_path):
@@ -274,30 +1082,131 @@ def update_recent_files(file_path):
     recent_files.insert(0, file_path)
     if len(recent_files) > MAX_RECENT_FILES:
         recent_files = recent_files[:MAX_RECENT_FILES]
+    persist_recent_file(file_path)
 
 
-def get_column_similarity(col_name, template_columns):
-    """Calculate similarity between column name and template column names"""
-    scores = {}
+# 列名匹配索引
+#---------------------------------
+MAPPING_CANDIDATES = 10  # 每个列名参与相似度计算的候选同义词数
+MAPPING_MEMO_SIZE = 10000
+
+mapping_lock = threading.Lock()
+mapping_indexes = {}  # {模板名称: (模板版本, 索引)}
+mapping_memo = OrderedDict()  # {(模板名称, 模板版本, 列名): (模板列, 相似度)}
+template_versions = {}  # {模板名称: 版本号}，模板或同义词修改后递增，随模板一起持久化
+templates_generation = 0  # 任一模板修改后递增，用于目标类型缓存
+
+_HEADER_NOISE = re.compile(r'[\s_\-()（）\[\]【】/\\.:：]+')
+
+
+def normalize_header(name):
+    """列名规范化：全角转半角、转小写、去掉空白和常见标点"""
+    return _HEADER_NOISE.sub('', unicodedata.normalize('NFKC', str(name)).lower())
+
+
+def _header_grams(normalized):
+    """单字和相邻两字，用于倒排索引"""
+    return set(normalized) | {normalized[i:i + 2] for i in range(len(normalized) - 1)}
+
+
+def build_mapping_index(template_columns):
+    """
+    为模板预先建立列名匹配索引
+    
+    Returns:
+        dict: exact（原始名称 -> 模板列）、normalized（规范化名称 -> 模板列）、
+        names（[(模板列, 名称)]）、grams（字词 -> 名称下标列表）、columns（模板列顺序）
+    """
+    index = {"exact": {}, "normalized": {}, "names": [], "grams": {}, "columns": list(template_columns)}
     for template_col, details in template_columns.items():
-        synonyms = details["synonyms"]
+        for name in details.get("synonyms", []) + [template_col]:
+            index["exact"].setdefault(name, template_col)
+            normalized = normalize_header(name)
+            if normalized:
+                index["normalized"].setdefault(normalized, template_col)
+            name_idx = len(index["names"])
+            index["names"].append((template_col, name))
+            for gram in _header_grams(normalized):
+                index["grams"].setdefault(gram, []).append(name_idx)
+    return index
+
+
+def match_column(index, col_name):
+    """
+    在索引中查找最相似的模板列
+    
+    先查原始名称和规范化名称的精确匹配，再用倒排索引选出共享字词最多的候选同义词，
+    只对候选计算difflib相似度。没有共享字词的同义词相似度为0，不影响结果。
+    
+    Returns:
+        (template_col, similarity)
+    """
+    if not index["columns"]:
+        return None, 0
+    if col_name in index["exact"]:
+        return index["exact"][col_name], 1.0
+    normalized = normalize_header(col_name)
+    if normalized in index["normalized"]:
+        return index["normalized"][normalized], 1.0
+
+    overlap = {}
+    for gram in _header_grams(normalized):
+        for name_idx in index["grams"].get(gram, ()):
+            overlap[name_idx] = overlap.get(name_idx, 0) + len(gram)
+    candidates = sorted(overlap, key=lambda i: (-overlap[i], i))[:MAPPING_CANDIDATES]
+
+    scores = {}
+    for name_idx in candidates:
+        template_col, name = index["names"][name_idx]
+        score = difflib.SequenceMatcher(None, col_name, name).ratio()
+        scores[template_col] = max(scores.get(template_col, 0), score)
+
+    # 相似度相同时取模板中靠前的列
+    best_col = max(index["columns"], key=lambda col: scores.get(col, 0))
+    return best_col, scores.get(best_col, 0)
+
+
+def bump_template_version(template_name):
+    """模板或同义词修改后调用，使该模板的匹配索引、匹配缓存和目标类型缓存失效"""
+    global templates_generation
 
-        # Check for exact match
-        if col_name in synonyms or col_name == template_col:
-            return template_col, 1.0
+    with mapping_lock:
+        template_versions[template_name] = template_versions.get(template_name, 0) + 1
+        templates_generation += 1
+        mapping_indexes.pop(template_name, None)
+        for key in [k for k in mapping_memo if k[0] == template_name]:
+            del mapping_memo[key]
 
-        # Calculate string similarity
-        best_score = 0
-        for synonym in synonyms + [template_col]:
-            # Use difflib for string similarity
-            score = difflib.SequenceMatcher(None, col_name, synonym).ratio()
-            best_score = max(best_score, score)
 
-        scores[template_col] = best_score
+def suggest_template_column(template_name, col_name):
+    """按 (模板版本, 列名) 缓存的列名匹配，返回 (template_col, similarity)"""
+    with mapping_lock:
+        version = template_versions.get(template_name, 0)
+        key = (template_name, version, col_name)
+        if key in mapping_memo:
+            mapping_memo.move_to_end(key)
+            return mapping_memo[key]
+        cached = mapping_indexes.get(template_name)
+        index = cached[1] if cached and cached[0] == version else None
 
-    # Find the best match
-    best_match = max(scores.items(), key=lambda x: x[1])
-    return best_match[0], best_match[1]
+    if index is None:
+        index = build_mapping_index(templates[template_name])
+    result = match_column(index, col_name)
+
+    with mapping_lock:
+        # 计算期间模板被修改时不写入缓存
+        if template_versions.get(template_name, 0) == version:
+            mapping_indexes[template_name] = (version, index)
+            mapping_memo[key] = result
+            while len(mapping_memo) > MAPPING_MEMO_SIZE:
+                mapping_memo.popitem(last=False)
+    return result
+
+
+def get_column_similarity(col_name, template_columns):
+    """Calculate similarity between column name and template column names"""
+    return match_column(build_mapping_index(template_columns), col_name)
+#---------------------------------
 
 
 def detect_column_type(series):
@@ -325,18 +1234,58 @@ def detect_column_type(series):
     # Otherwise, it's text
     return "text"
 
-def convert_value(value, target_type):
-    """
-    转换一个值到目标数据类型，使用Babel库处理金融数字格式
+def _parse_int_with_babel(value):
+    """使用Babel解析整数（parse_number无法识别的格式），依次尝试英语、中文区域格式和手动清理"""
+    from babel.numbers import parse_decimal
     
-    Args:
-        value: 要转换的原始值
-        target_type: 目标数据类型 ("int", "float", "date", "time", "text")
+    try:
+        # 默认使用英语区域格式 (如 "1,234.56")
+        return int(parse_decimal(value, locale='en_US'))
+    except:
+        # 如果Babel解析失败，尝试使用其他区域格式
+        try:
+            # 尝试中文区域格式
+            return int(parse_decimal(value, locale='zh_CN'))
+        except:
+            # 如果还是失败，尝试直接清除常见的分隔符
+            cleaned_value = value.replace(',', '').replace(' ', '')
+            return int(float(cleaned_value))
+
+
+def _parse_float_with_babel(value):
+    """使用Babel解析浮点数（parse_number无法识别的格式），依次尝试英语、中文区域格式和手动清理"""
+    from babel.numbers import parse_decimal
+    
+    try:
+        # 首先尝试英语区域格式
+        return float(parse_decimal(value, locale='en_US'))
+    except:
+        try:
+            # 尝试中文区域格式
+            return float(parse_decimal(value, locale='zh_CN'))
+        except:
+            # 如果Babel解析失败，尝试手动清理常见分隔符
+            cleaned_value = value.replace(',', '').replace(' ', '')
+            try:
+                # 处理特殊的百分比格式
+                if cleaned_value.endswith('%'):
+                    return float(cleaned_value.rstrip('%')) / 100
+                return float(cleaned_value)
+            except ValueError:
+                raise ValueError(f"无法将值 '{value}' 转换为浮点数")
+
+
+def convert_value(value, target_type):
+    """
+    转换一个值到目标数据类型，数字先用parse_number解析金融格式，无法识别时再使用Babel库
+    
+    Args:
+        value: 要转换的原始值
+        target_type: 目标数据类型 ("int", "float", "date", "time", "text")
         
     Returns:
         转换后的值，如果转换失败则抛出异常
     """
-    from babel.numbers import parse_decimal
     import pandas as pd
     import sys
     import math
@@ -354,25 +1303,16 @@ def convert_value(value, target_type):
         if target_type == "int":
             # 尝试转换为整数
             try:
-                # 使用Babel解析数字，支持各种格式的金融数字
-                # 默认使用英语区域格式 (如 "1,234.56")
-                try:
-                    parsed_value = parse_decimal(value, locale='en_US')
+                # 常见格式（正负号、千分位、全角数字）直接精确解析
+                parsed_value = parse_number(value, allow_markers=False)
+                if parsed_value is not None:
                     int_value = int(parsed_value)
-                except:
-                    # 如果Babel解析失败，尝试使用其他区域格式
-                    try:
-                        # 尝试中文区域格式
-                        parsed_value = parse_decimal(value, locale='zh_CN') 
-                        int_value = int(parsed_value)
-                    except:
-                        # 如果还是失败，尝试直接清除常见的分隔符
-                        cleaned_value = value.replace(',', '').replace(' ', '')
-                        int_value = int(float(cleaned_value))
+                else:
+                    int_value = _parse_int_with_babel(value)
                 
                 # 检查是否是大整数，如果是，则返回字符串
                 if abs(int_value) > 9223372036854775807:  # SQLite INTEGER最大值
-                    print(f"警告：整数值 {int_value} 太大，将以字符串形式存储", file=sys.stderr, flush=True)
+                    log_row_event("big_int", "整数值 %s 太大，将以字符串形式存储", int_value)
                     return str(int_value)  # 返回不带分隔符的字符串形式
                 return int_value
             except ValueError as e:
@@ -391,24 +1331,11 @@ def convert_value(value, target_type):
                     raise ValueError(f"无法将值 '{value}' 转换为整数: 没有有效数字")
         
         elif target_type == "float":
-            # 尝试使用Babel解析金融格式的浮点数
-            try:
-                # 首先尝试英语区域格式
-                return float(parse_decimal(value, locale='en_US'))
-            except:
-                try:
-                    # 尝试中文区域格式
-                    return float(parse_decimal(value, locale='zh_CN'))
-                except:
-                    # 如果Babel解析失败，尝试手动清理常见分隔符
-                    cleaned_value = value.replace(',', '').replace(' ', '')
-                    try:
-                        # 处理特殊的百分比格式
-                        if cleaned_value.endswith('%'):
-                            return float(cleaned_value.rstrip('%')) / 100
-                        return float(cleaned_value)
-                    except ValueError:
-                        raise ValueError(f"无法将值 '{value}' 转换为浮点数")
+            # 括号负数、百分号、借贷标记、全角数字等金融格式直接精确解析
+            parsed_value = parse_number(value)
+            if parsed_value is not None:
+                return float(parsed_value)
+            return _parse_float_with_babel(value)
         
         elif target_type == "date":
             # 处理可能带有小数点的日期值（如"20210610.0"）
@@ -477,6 +1404,7 @@ def get_templates():
     return jsonify({
         "status": "success",
         "templates": templates,
+        "template_versions": {name: template_versions.get(name, 0) for name in templates},
         "default_template": list(templates.keys())[0] if templates else None
     })
 
@@ -498,12 +1426,18 @@ def save_template():
         return jsonify({"status": "error", "message": "Missing template name or data"}), 400
 
     templates[template_name] = template_data
+    bump_template_version(template_name)
 
     if is_default:
         global default_template
         default_template = template_data.copy()
+    persist_template(template_name, is_default=True if is_default else None)
 
-    return jsonify({"status": "success", "message": f"Template '{template_name}' saved"})
+    return jsonify({
+        "status": "success",
+        "message": f"Template '{template_name}' saved",
+        "version": template_versions[template_name]
+    })
 
 
 @app.route('/api/templates/<name>', methods=['DELETE'])
@@ -516,6 +1450,8 @@ def delete_template(name):
         
     if name in templates:
         del templates[name]
+        bump_template_version(name)
+        persist_template(name)
         return jsonify({"status": "success", "message": f"Template '{name}' deleted"})
     return jsonify({"status": "error", "message": f"Template '{name}' not found"}), 404
 
@@ -536,7 +1472,11 @@ def get_recent_files():
 
 @app.route('/api/analyze-file', methods=['POST'])
 def analyze_file():
-    """Analyze a single Excel file and detect columns"""
+    """
+    Analyze a single Excel file and detect columns
+    
+    传入sheets或sheet_pattern时分析选中的每个工作表，结果见analyze_workbook。
+    """
     # 验证请求
     validation = verify_request()
     if validation:
@@ -549,790 +1489,4355 @@ def analyze_file():
     if not file_path:
         return jsonify({"status": "error", "message": "Missing file path"}), 400
 
+    selection, error = parse_sheet_selection(data)
+    if error:
+        return jsonify(error[0]), error[1]
+
     try:
-        # Read Excel file
-        df = pd.read_excel(file_path, nrows=100)  # Read only first 100 rows for analysis
-
-        # Get column information
-        columns = []
-        for col in df.columns:
-            col_name = str(col).strip()
-            col_type = detect_column_type(df[col])
-
-            # Map to template column if template is provided
-            template_column = None
-            similarity = 0
-            if template_name and template_name in templates:
-                template = templates[template_name]
-                template_column, similarity = get_column_similarity(col_name, template)
-
-            columns.append({
-                "original_name": col_name,
-                "detected_type": col_type,
-                "mapped_to": template_column if similarity > 0.6 else None,
-                "similarity": similarity,
-                "sample_values": df[col].dropna().head(5).tolist()
-            })
+        if selection is not None:
+            return jsonify(dict(status="success", **analyze_workbook(file_path, template_name, selection)))
 
-        return jsonify({
-            "status": "success",
-            "file_name": os.path.basename(file_path),
-            "total_rows": len(df),
-            "columns": columns
-        })
+        # Read Excel file
+        df = read_sample(file_path)  # Read only first 100 rows for analysis
+        result = analyze_sample(df, file_path, template_name)
+        return jsonify(dict(status="success", **result))
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-@app.route('/api/process-files', methods=['POST'])
-def process_files():
-    """Process multiple Excel files and merge them into a database"""
-    # 验证请求
-    validation = verify_request()
-    if validation:
-        return jsonify(validation[0]), validation[1]
-        
-    data = request.json
-    file_paths = data.get('file_paths', [])
-    db_path = data.get('db_path')
-    column_mappings = data.get('column_mappings', {})
+ANALYZE_SAMPLE_ROWS = 100
+ANALYZE_WORKERS = 4  # 批量分析时同时读取的文件数
 
-    if not file_paths or not db_path:
-        return jsonify({"status": "error", "message": "Missing file paths or database path"}), 400
 
-    try:
-        # Create database
-        create_database(db_path)
-        conn = sqlite3.connect(db_path, timeout=60)  # 增加连接超时时间
-        cursor = conn.cursor()
+def analyze_sample(df, file_path, template_name=None):
+    """
+    根据样本数据检测列类型，并匹配模板列
+    
+    Returns:
+        dict: file_name、total_rows（样本行数）、columns
+    """
+    columns = []
+    for col in df.columns:
+        col_name = str(col).strip()
+        col_type = detect_column_type(df[col])
 
-        total_processed = 0
-        total_rejected = 0
-        file_stats = []
+        # Map to template column if template is provided
+        template_column = None
+        similarity = 0
+        if template_name and template_name in templates:
+            template_column, similarity = suggest_template_column(template_name, col_name)
 
-        for file_idx, file_path in enumerate(file_paths):
-            try:
-                # 检查文件是否存在
-                if not os.path.exists(file_path):
-                    file_stats.append({
-                        "file_name": os.path.basename(file_path),
-                        "error": "文件不存在"
-                    })
-                    continue
-                
-                # 检查文件大小
-                file_size = os.path.getsize(file_path)
-                print(f"处理文件: {os.path.basename(file_path)}, 大小: {file_size/(1024*1024):.2f} MB", 
-                      file=sys.stderr, flush=True)
-                
-                # 尝试读取Excel文件
-                try:
-                    # 大文件分块处理
-                    if file_size > 50 * 1024 * 1024:  # 50MB
-                        print(f"大文件处理模式: {os.path.basename(file_path)}", file=sys.stderr, flush=True)
-                        
-                        try:
-                            # 分块读取大文件
-                            chunk_size = 5000  # 每次读取5000行
-                            xls = pd.ExcelFile(file_path)
-                            sheet_name = xls.sheet_names[0]  # 假设处理第一个sheet
-                            
-                            # 先读取一行获取列名
-                            header_df = pd.read_excel(file_path, sheet_name=sheet_name, nrows=1)
-                            columns = header_df.columns.tolist()
-                            
-                            # 估算总行数
-                            approx_total_rows = max(int(file_size / 2000), 1000)  # 粗略估计
-                            chunks_processed = 0
-                            all_mapped_data = []
-                            all_rejected_rows = []
-                            
-                            # 逐块读取处理
-                            skip_rows = 1  # 跳过标题行
-                            total_rejected = 0  # 追踪被拒绝的行总数
-                            
-                            while True:
-                                try:
-                                    chunk_df = pd.read_excel(
-                                        file_path, 
-                                        sheet_name=sheet_name,
-                                        skiprows=range(1, skip_rows) if skip_rows > 1 else None,
-                                        nrows=chunk_size,
-                                        names=columns if skip_rows > 1 else None
-                                    )
-                                    
-                                    # 如果没有数据了，跳出循环
-                                    if chunk_df.empty:
-                                        break
-                                        
-                                    chunk_results = process_dataframe_chunk(
-                                        chunk_df, file_path, skip_rows-1, column_mappings
-                                    )
-                                    
-                                    # 确保结果包含正确的键
-                                    if "mapped_data" not in chunk_results or "rejected_rows" not in chunk_results:
-                                        print(f"警告: process_dataframe_chunk返回格式不正确", file=sys.stderr, flush=True)
-                                        if isinstance(chunk_results, dict):
-                                            print(f"结果包含的键: {list(chunk_results.keys())}", file=sys.stderr, flush=True)
-                                        else:
-                                            print(f"结果类型: {type(chunk_results)}", file=sys.stderr, flush=True)
-                                        continue
-                                    
-                                    current_mapped = chunk_results.get("mapped_data", [])
-                                    current_rejected = chunk_results.get("rejected_rows", [])
-                                    
-                                    # 打印当前块的结果统计
-                                    print(f"块 {chunks_processed+1}: 映射行数={len(current_mapped)}, 拒绝行数={len(current_rejected)}", 
-                                        file=sys.stderr, flush=True)
-                                    
-                                    all_mapped_data.extend(current_mapped)
-                                    all_rejected_rows.extend(current_rejected)
-                                    total_rejected += len(current_rejected)
-                                    
-                                    # 每处理5个块提交一次事务
-                                    chunks_processed += 1
-                                    if chunks_processed % 5 == 0:
-                                        # 插入已处理的数据
-                                        if all_mapped_data or all_rejected_rows:
-                                            print(f"提交数据块: 映射行={len(all_mapped_data)}, 拒绝行={len(all_rejected_rows)}", 
-                                                file=sys.stderr, flush=True)
-                                            insert_data_to_db(conn, cursor, all_mapped_data, all_rejected_rows)
-                                            conn.commit()
-                                        
-                                        # 清空临时列表以释放内存
-                                        all_mapped_data = []
-                                        all_rejected_rows = []
-                                        
-                                        # 报告进度
-                                        rows_processed = skip_rows + len(chunk_df) - 1
-                                        print(f"已处理: {rows_processed} 行 ({chunks_processed} 块)", 
-                                            file=sys.stderr, flush=True)
-                                    
-                                    # 更新下一块的起始行
-                                    skip_rows += len(chunk_df)
-                                    
-                                except Exception as chunk_error:
-                                    print(f"处理数据块错误: {str(chunk_error)}", file=sys.stderr, flush=True)
-                                    traceback.print_exc(file=sys.stderr)
-                                    # 尝试继续处理下一块
-                                    skip_rows += chunk_size
-                                    if skip_rows > approx_total_rows * 2:  # 防止无限循环
-                                        break
-                            
-                            # 处理剩余数据
-                            if all_mapped_data or all_rejected_rows:
-                                print(f"提交最终数据块: 映射行={len(all_mapped_data)}, 拒绝行={len(all_rejected_rows)}", 
-                                    file=sys.stderr, flush=True)
-                                insert_data_to_db(conn, cursor, all_mapped_data, all_rejected_rows)
-                                conn.commit()
-                            
-                            # 构建文件处理统计
-                            total_rows = skip_rows - 1
-                            processed_rows = total_rows - total_rejected
-                            rejected_rows = total_rejected
-                            
-                            print(f"大文件处理完成. 总行数: {total_rows}, 处理行数: {processed_rows}, 拒绝行数: {rejected_rows}", 
-                                file=sys.stderr, flush=True)
-                        except Exception as big_file_error:
-                            print(f"大文件处理失败: {str(big_file_error)}", file=sys.stderr, flush=True)
-                            traceback.print_exc(file=sys.stderr)
-                            raise big_file_error
-                    else:
-                        # 小文件直接处理
-                        df = pd.read_excel(file_path)
-                        
-                        # 使用标准处理逻辑
-                        results = process_dataframe_chunk(df, file_path, 0, column_mappings)
-                        mapped_data = results["mapped_data"]
-                        rejected_rows = results["rejected_rows"]
-                        
-                        # 插入数据
-                        insert_data_to_db(conn, cursor, mapped_data, rejected_rows)
-                        
-                        # 记录统计信息
-                        total_rows = len(df)
-                        processed_rows = len(mapped_data)
-                        rejected_rows = len(rejected_rows)
-                        
-                    # 更新统计信息
-                    total_processed += processed_rows
-                    total_rejected += rejected_rows
-                    
-                    file_stats.append({
-                        "file_name": os.path.basename(file_path),
-                        "total_rows": total_rows,
-                        "processed_rows": processed_rows,
-                        "rejected_rows": rejected_rows
-                    })
-                
-                except pd.errors.ParserError as excel_error:
-                    error_msg = f"Excel解析错误: {str(excel_error)}"
-                    print(error_msg, file=sys.stderr, flush=True)
-                    file_stats.append({
-                        "file_name": os.path.basename(file_path),
-                        "error": error_msg
-                    })
-                    continue
-                except Exception as excel_error:
-                    error_msg = f"读取Excel文件失败: {str(excel_error)}"
-                    print(error_msg, file=sys.stderr, flush=True)
-                    traceback.print_exc(file=sys.stderr)
-                    file_stats.append({
-                        "file_name": os.path.basename(file_path),
-                        "error": error_msg
-                    })
-                    continue
+        columns.append({
+            "original_name": col_name,
+            "detected_type": col_type,
+            "mapped_to": template_column if similarity > 0.6 else None,
+            "similarity": similarity,
+            "sample_values": df[col].dropna().head(5).tolist()
+        })
 
-                # 提交当前文件的所有更改
-                conn.commit()
+    return {
+        "file_name": os.path.basename(file_path),
+        "total_rows": len(df),
+        "columns": columns
+    }
 
-                # 更新处理进度
-                progress = (file_idx + 1) / len(file_paths) * 100
-                print(f"Progress: {progress:.2f}%", file=sys.stderr, flush=True)
 
-            except Exception as file_error:
-                error_msg = f"处理文件错误: {str(file_error)}"
-                print(error_msg, file=sys.stderr, flush=True)
-                traceback.print_exc(file=sys.stderr)
-                file_stats.append({
-                    "file_name": os.path.basename(file_path),
-                    "error": error_msg
-                })
+def read_sample(file_path, nrows=ANALYZE_SAMPLE_ROWS):
+    """
+    读取文件开头的nrows行
+    
+    xlsx文件用流式读取只解析开头的行，列名和类型规则与pd.read_excel一致；
+    其他格式（如xls）使用pd.read_excel。
+    """
+    if os.path.splitext(file_path)[1].lower() in (".xlsx", ".xlsm"):
+        chunks = iter_excel_chunks(file_path, chunk_size=nrows)
+        try:
+            df = next(chunks, None)
+        finally:
+            chunks.close()
+        if df is not None:
+            return df
+    return pd.read_excel(file_path, nrows=nrows)
 
-        # 最终提交并关闭连接
-        conn.commit()
-        conn.close()
 
-        # 更新最近文件列表
-        update_recent_files(db_path)
+# 工作表选择
+# 不指定时只读取第一个工作表，来源名称（source_file）为文件名，与只支持单个工作表时一致；
+# 指定sheets（"all"或工作表名称列表）或sheet_pattern（正则）时逐个工作表导入，
+# 来源名称为"文件名#工作表"，列映射可以用这个名称为单个工作表单独指定。
+#---------------------------------
+SHEET_SOURCE_SEPARATOR = "#"
 
-        return jsonify({
-            "status": "success",
-            "db_path": db_path,
-            "total_processed": total_processed,
-            "total_rejected": total_rejected,
-            "file_stats": file_stats
-        })
-    except Exception as e:
-        print(f"处理文件过程中发生严重错误: {str(e)}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
-        
-        # 确保关闭数据库连接
-        try:
-            if 'conn' in locals() and conn:
-                conn.close()
-        except:
-            pass
-            
-        return jsonify({
-            "status": "error", 
-            "message": str(e),
-            "details": traceback.format_exc()
-        }), 500
 
-def process_dataframe_chunk(df, file_path, start_row, column_mappings):
-    """处理数据框的一个块，返回映射数据和被拒绝的行"""
-    mapped_data = []
-    rejected_rows = []
-    
-    # 获取此文件的列映射
-    file_name = os.path.basename(file_path)
-    file_mapping = column_mappings.get(file_path, {})
-    if not file_mapping and file_name in column_mappings:
-        file_mapping = column_mappings[file_name]
-    
-    # 如果还没有映射，尝试通过文件名查找
-    if not file_mapping:
-        for path in column_mappings:
-            if path.endswith(file_name):
-                file_mapping = column_mappings[path]
-                break
-    
-    # 调试输出当前的映射情况
-    print(f"文件 {file_name} 的列映射: {file_mapping}", file=sys.stderr, flush=True)
-    
-    # 处理每一行
-    for idx, row in df.iterrows():
+def parse_sheet_selection(data):
+    """
+    解析请求中的工作表选择
+
+    Returns:
+        (selection, error): 不选择工作表时selection为None；否则为 {"names": 名称列表或None, "pattern": 正则或None}，
+        两者都为None表示全部工作表，同时给出时取并集
+    """
+    sheets = data.get('sheets')
+    pattern = data.get('sheet_pattern')
+    if sheets is None and not pattern:
+        return None, None
+
+    names = None
+    if isinstance(sheets, list):
+        names = [str(name) for name in sheets]
+    elif sheets not in (None, "all"):
+        return None, ({"status": "error", "message": "sheets must be \"all\" or a list of sheet names"}, 400)
+    if pattern:
         try:
-            # ========= 修复行号处理 =========
-            # 计算正确的行号（纯数字）
-            row_number = start_row + idx + 1
-            
-            # 确保row_number是字符串，且不是日期格式
-            row_number_str = str(row_number)
-            
-            # 检查是否有"行号"或类似列，如果有直接用它作为row_number的值
-            row_num_candidates = ['row_number', 'rownum', 'row', '行号', '行']
-            for col in row_num_candidates:
-                if col in df.columns and pd.notna(row[col]):
-                    # 确保值是整数或字符串
-                    candidate_value = row[col]
-                    if isinstance(candidate_value, (int, float)) or (isinstance(candidate_value, str) and candidate_value.isdigit()):
-                        row_number_str = str(int(float(candidate_value)))
-                        print(f"使用列 '{col}' 的值作为行号: {row_number_str}", file=sys.stderr, flush=True)
-                        break
-            # ======== 行号处理结束 =========
-            
-            mapped_row = {
-                "ID": None,
-                "记账日期": None,
-                "记账时间": None,
-                "账户名": None,
-                "账号": None,
-                "开户行": None,
-                "币种": None,
-                "借贷": None,
-                "交易金额": None,
-                "交易渠道": None,
-                "网点名称": None,
-                "附言": None,
-                "余额": None,
-                "对手账户名": None,
-                "对手账号": None,
-                "对手开户行": None,
-                "source_file": file_name,
-                "row_number": row_number_str  # 使用处理后的行号字符串
-            }
-    
-            has_data = False
-            row_has_errors = False  # 标记该行是否有转换错误
-            
-            for orig_col, target_col in file_mapping.items():
-                if orig_col in df.columns and target_col:
-                    try:
-                        value = row[orig_col]
-                        # 记录原始值，方便出错时记录
-                        original_value = str(value) if pd.notna(value) else None
-                        
-                        if pd.notna(value) and str(value).strip():
-                            has_data = True
-    
-                        # 获取目标类型
-                        target_type = "text"  # 默认
-                        for template in templates.values():
-                            if target_col in template:
-                                target_type = template[target_col]["type"]
-                                break
-                                
-                        # 如果是ID字段，确保以字符串形式存储
-                        if target_col == "ID" and pd.notna(value):
-                            mapped_row[target_col] = str(value)
-                            continue
-    
-                        # 尝试转换数据类型
-                        mapped_row[target_col] = convert_value(value, target_type)
-                    except Exception as conv_error:
-                        # 详细记录错误信息
-                        error_msg = f"转换错误 行 {row_number_str}, 列 {orig_col}: {str(conv_error)}"
-                        print(error_msg, file=sys.stderr, flush=True)
-                        
-                        # 标记行有错误
-                        row_has_errors = True
-                        
-                        # 创建rejected_row记录，确保包含列名和原始值
-                        try:
-                            # 保证有值的original_value
-                            safe_original_value = original_value if original_value else "null"
-                            
-                            # 将每个出错的字段单独记录，确保row_number是字符串
-                            rejected_rows.append({
-                                "source_file": file_name,
-                                "row_number": row_number_str,  # 确保行号是字符串
-                                "column_name": orig_col,  # 记录原始列名
-                                "target_column": target_col,  # 记录目标列名
-                                "original_value": safe_original_value,  # 原始值
-                                "raw_data": json.dumps(row.to_dict(), default=str),  # 整行数据
-                                "reason": str(conv_error)  # 错误原因
-                            })
-                            
-                            # 打印调试信息
-                            print(f"创建rejected_row: 列={orig_col}, 目标列={target_col}, 原始值={safe_original_value}", 
-                                  file=sys.stderr, flush=True)
-                        except Exception as e:
-                            print(f"创建rejected_row失败: {e}", file=sys.stderr, flush=True)
-                        
-                        # 重置目标列值
-                        mapped_row[target_col] = None
-    
-            # 跳过空行
-            if not has_data:
-                continue
-    
-            # 如果行没有错误，添加到映射数据
-            if not row_has_errors:
-                mapped_data.append(mapped_row)
-            
-        except Exception as row_error:
-            # 处理整行错误
-            try:
-                rejected_rows.append({
-                    "source_file": file_name,
-                    "row_number": str(row_number),  # 确保行号是字符串
-                    "column_name": "整行错误",  # 标记为整行错误
-                    "target_column": "",  # 没有特定目标列
-                    "original_value": "整行处理失败",  # 简单描述
-                    "raw_data": json.dumps(row.to_dict(), default=str),  # 保存原始数据
-                    "reason": str(row_error)  # 错误原因
-                })
-                print(f"整行处理错误: 行={row_number}, 错误={str(row_error)}", file=sys.stderr, flush=True)
-            except Exception as e:
-                print(f"创建整行错误记录失败: {e}", file=sys.stderr, flush=True)
-    
-    # 打印处理结果摘要
-    print(f"处理结果: {file_name} - 映射数据: {len(mapped_data)}行, 被拒绝: {len(rejected_rows)}行", 
-          file=sys.stderr, flush=True)
-    if rejected_rows:
-        print(f"示例被拒绝行: {rejected_rows[0]}", file=sys.stderr, flush=True)
-    
-    return {"mapped_data": mapped_data, "rejected_rows": rejected_rows}
+            re.compile(pattern)
+        except re.error as e:
+            return None, ({"status": "error", "message": f"Invalid sheet_pattern: {e}"}, 400)
+    return {"names": names, "pattern": pattern or None}, None
 
-def insert_data_to_db(conn, cursor, mapped_data, rejected_rows):
-    """将映射数据和被拒绝的行插入数据库"""
-    import math  # 添加math模块导入
-    
-    try:
-        # 插入映射数据
-        if mapped_data and len(mapped_data) > 0:
-            for row in mapped_data:
-                # 确保ID和row_number字段是字符串类型
-                if 'ID' in row and row['ID'] is not None:
-                    row['ID'] = str(row['ID'])
-                if 'row_number' in row and row['row_number'] is not None:
-                    row['row_number'] = str(row['row_number'])
-                
-                # 检查其他字段，将大整数转换为字符串
-                for key in row:
-                    if isinstance(row[key], int) and abs(row[key]) > 9223372036854775807:
-                        row[key] = str(row[key])
-                        print(f"将字段 {key} 的大整数值转换为字符串: {row[key]}", file=sys.stderr, flush=True)
-                
-                # 构建插入查询
-                columns = list(row.keys())
-                values = [row[col] for col in columns]
-                
-                # 使用INSERT OR IGNORE语法，忽略已存在的ID
-                # 这将跳过任何违反唯一约束的插入操作，而不是引发错误
-                placeholders = ", ".join(["?" for _ in columns])
-                insert_query = f"INSERT OR IGNORE INTO transactions ({', '.join(columns)}) VALUES ({placeholders})"
-                
-                try:
-                    cursor.execute(insert_query, values)
-                    # 如果没有插入行（因为ID已存在），可以选择记录一条警告
-                    if cursor.rowcount == 0:
-                        print(f"警告: ID为 {row.get('ID', '未知')} 的记录已存在，已跳过", file=sys.stderr, flush=True)
-                except sqlite3.Error as sql_error:
-                    print(f"SQL错误(插入映射数据): {str(sql_error)}", file=sys.stderr, flush=True)
-                    print(f"问题数据类型: {[type(v) for v in values]}", file=sys.stderr, flush=True)
-                    print(f"问题数据值: {values}", file=sys.stderr, flush=True)
-                    
-                    # 更强的安全类型转换
-                    safe_values = []
-                    for v in values:
-                        if isinstance(v, int) and abs(v) > 9223372036854775807:
-                            safe_values.append(str(v))
-                        elif isinstance(v, float) and (abs(v) > 9223372036854775807 or math.isnan(v) or math.isinf(v)):
-                            safe_values.append(str(v))
-                        else:
-                            safe_values.append(v)
-                    
-                    try:
-                        cursor.execute(insert_query, safe_values)
-                        print("使用安全类型值重试成功", file=sys.stderr, flush=True)
-                    except sqlite3.Error as retry_error:
-                        print(f"使用安全类型重试仍然失败: {str(retry_error)}", file=sys.stderr, flush=True)
-                        
-                        # 最后的尝试：将所有值转换为字符串
-                        try:
-                            all_string_values = [str(v) if v is not None else None for v in values]
-                            cursor.execute(insert_query, all_string_values)
-                            print("使用全字符串类型重试成功", file=sys.stderr, flush=True)
-                        except sqlite3.Error as final_error:
-                            print(f"所有尝试都失败，跳过此行: {str(final_error)}", file=sys.stderr, flush=True)
-                            continue
 
-        # 插入被拒绝的行 - 直接使用当前连接，而不是创建新连接
-        if rejected_rows and len(rejected_rows) > 0:
-            print(f"正在插入 {len(rejected_rows)} 条被拒绝的行...", file=sys.stderr, flush=True)
-            
-            # 确保表存在
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rejected_rows (
-                id INTEGER PRIMARY KEY,
-                source_file TEXT,
-                row_number TEXT,
-                column_name TEXT,
-                target_column TEXT,
-                original_value TEXT,
-                raw_data TEXT,
-                reason TEXT
-            )
-            """)
-            conn.commit()
-            
-            # 执行批量插入
-            for row in rejected_rows:
-                # 确保row_number是字符串
-                if 'row_number' in row and row['row_number'] is not None:
-                    row['row_number'] = str(row['row_number'])
-                
-                # 确保所有必要字段都存在
-                required_fields = [
-                    "source_file", "row_number", "column_name", 
-                    "target_column", "original_value", "raw_data", "reason"
-                ]
-                
-                # 确保所有字段都有值，没有值的用空字符串代替
-                for field in required_fields:
-                    if field not in row or row[field] is None:
-                        row[field] = ""
-                
-                # 确保raw_data是字符串
-                if isinstance(row["raw_data"], (dict, list)):
-                    try:
-                        row["raw_data"] = json.dumps(row["raw_data"], default=str)
-                    except Exception as e:
-                        print(f"序列化raw_data失败: {str(e)}", file=sys.stderr, flush=True)
-                        row["raw_data"] = str(row["raw_data"])
-                
-                # 构建值和占位符
-                values = [
-                    str(row["source_file"]),
-                    str(row["row_number"]),
-                    str(row["column_name"]),
-                    str(row["target_column"]),
-                    str(row["original_value"]),
-                    str(row["raw_data"]),
-                    str(row["reason"])
-                ]
-                
-                try:
-                    # 使用参数化查询避免SQL注入
-                    cursor.execute(
-                        """INSERT INTO rejected_rows 
-                           (source_file, row_number, column_name, target_column, original_value, raw_data, reason) 
-                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                        values
-                    )
-                    print(f"成功插入被拒绝行: {row['column_name']}={row['original_value']}", file=sys.stderr, flush=True)
-                except sqlite3.Error as sql_error:
-                    print(f"插入被拒绝行SQL错误: {str(sql_error)}", file=sys.stderr, flush=True)
-                    print(f"问题数据: {values}", file=sys.stderr, flush=True)
-                    # 尝试一种更安全的插入方法，直接执行SQL
-                    try:
-                        sql = f"""INSERT INTO rejected_rows 
-                                  (source_file, row_number, column_name, target_column, original_value, raw_data, reason)
-                                  VALUES 
-                                  ('{values[0].replace("'", "''")}', 
-                                   '{values[1].replace("'", "''")}', 
-                                   '{values[2].replace("'", "''")}', 
-                                   '{values[3].replace("'", "''")}', 
-                                   '{values[4].replace("'", "''")}', 
-                                   '{values[5].replace("'", "''")}', 
-                                   '{values[6].replace("'", "''")}')"""
-                        cursor.execute(sql)
-                        print("使用替代方法成功插入被拒绝行", file=sys.stderr, flush=True)
-                    except sqlite3.Error as alt_error:
-                        print(f"替代方法也失败: {str(alt_error)}", file=sys.stderr, flush=True)
-                except Exception as e:
-                    print(f"插入被拒绝行时发生未知错误: {str(e)}", file=sys.stderr, flush=True)
-                    print(f"问题数据: {values}", file=sys.stderr, flush=True)
-            
-            # 主连接提交
-            try:
-                conn.commit()
-                print(f"完成插入被拒绝行，提交成功", file=sys.stderr, flush=True)
-            except sqlite3.Error as commit_error:
-                print(f"提交被拒绝行时发生错误: {str(commit_error)}", file=sys.stderr, flush=True)
-                
-    except Exception as e:
-        print(f"插入数据错误: {str(e)}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
-        
-@app.route('/api/query-database', methods=['POST'])
-def query_database():
-    """Query the database with filters and sorting"""
-    # 验证请求
-    validation = verify_request()
-    if validation:
-        return jsonify(validation[0]), validation[1]
-        
-    data = request.json
-    db_path = data.get('db_path')
-    filters = data.get('filters', [])
-    sort_by = data.get('sort_by', None)
-    sort_direction = data.get('sort_direction', 'asc')
-    page = data.get('page', 1)
-    page_size = data.get('page_size', 100)
+def list_sheet_names(file_path):
+    """
+    按工作簿中的顺序列出工作表名称
 
-    if not db_path:
-        return jsonify({"status": "error", "message": "Missing database path"}), 400
+    xlsx只解析压缩包中的workbook.xml，不加载共享字符串，大文件也很快；其他格式使用pd.ExcelFile。
+    """
+    if os.path.splitext(file_path)[1].lower() in (".xlsx", ".xlsm"):
+        import zipfile
+        import xml.etree.ElementTree as ET
 
-    try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        with zipfile.ZipFile(file_path) as archive:
+            root = ET.fromstring(archive.read("xl/workbook.xml"))
+        # 兼容transitional和strict两种命名空间
+        return [element.get("name") for element in root.iter() if element.tag.rsplit("}", 1)[-1] == "sheet"]
+    with pd.ExcelFile(file_path) as excel_file:
+        return list(excel_file.sheet_names)
 
-        # Build query
-        query = "SELECT * FROM transactions"
-        params = []
-
-        # Add filters
-        if filters:
-            filter_conditions = []
-            for f in filters:
-                column = f.get('column')
-                operator = f.get('operator', '=')
-                value = f.get('value')
-
-                if column:
-                    if operator == 'not_null':
-                        filter_conditions.append(f"{column} IS NOT NULL AND {column} != ''")
-                    elif operator == 'contains':
-                        filter_conditions.append(f"{column} LIKE ?")
-                        params.append(f"%{value}%")
-                    elif operator == 'startswith':
-                        filter_conditions.append(f"{column} LIKE ?")
-                        params.append(f"{value}%")
-                    elif operator == 'endswith':
-                        filter_conditions.append(f"{column} LIKE ?")
-                        params.append(f"%{value}")
-                    else:
-                        filter_conditions.append(f"{column} {operator} ?")
-                        params.append(value)
 
-            if filter_conditions:
-                query += " WHERE " + " AND ".join(filter_conditions)
+def select_sheets(file_path, selection, available=None):
+    """
+    Args:
+        available: 可选，已列出的工作表名称，避免重复打开文件
 
-        # Add sorting
-        if sort_by:
-            query += f" ORDER BY {sort_by} {'DESC' if sort_direction.lower() == 'desc' else 'ASC'}"
+    Returns:
+        (sheet_names, missing): 选中的工作表（工作簿中的顺序）和请求中不存在的工作表名称；
+        selection为None时为 ([""], [])，""表示第一个工作表
+    """
+    if selection is None:
+        return [""], []
+    if available is None:
+        available = list_sheet_names(file_path)
+    names = selection.get("names")
+    pattern = re.compile(selection["pattern"]) if selection.get("pattern") else None
+    if names is None and pattern is None:
+        return available, []
 
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM ({query})"
-        cursor.execute(count_query, params)
-        total_count = cursor.fetchone()[0]
+    wanted = set(names or [])
+    selected = [name for name in available if name in wanted or (pattern is not None and pattern.search(name))]
+    missing = [name for name in (names or []) if name not in available]
+    return selected, missing
 
-        # Add pagination
-        offset = (page - 1) * page_size
-        query += f" LIMIT {page_size} OFFSET {offset}"
 
-        # Execute query
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+def sheet_source_name(file_name, sheet_name):
+    """工作表的来源名称，写入source_file并作为导入台账、列映射的键"""
+    return f"{file_name}{SHEET_SOURCE_SEPARATOR}{sheet_name}" if sheet_name else file_name
 
-        # Convert to list of dicts
-        results = []
-        for row in rows:
-            results.append({key: row[key] for key in row.keys()})
 
-        conn.close()
+def analyze_workbook(file_path, template_name=None, selection=None):
+    """
+    分析工作簿中选中的工作表
 
-        return jsonify({
-            "status": "success",
-            "total_count": total_count,
-            "page": page,
-            "page_size": page_size,
-            "results": results
+    选中的工作表用同一个工作簿对象读取样本，共享字符串只解析一次；结果按列名分组，
+    列名相同的工作表只需确认一次映射（组内files为工作表的来源名称）。
+
+    Returns:
+        dict: 第一个选中工作表的analyze_sample结果，另有sheet_names（工作簿中的全部工作表）、
+        sheets（每个工作表的结果）、missing_sheets、groups
+    """
+    available = list_sheet_names(file_path)
+    sheet_names, missing = select_sheets(file_path, selection, available)
+    if not sheet_names:
+        raise ValueError("没有匹配的工作表")
+    file_name = os.path.basename(file_path)
+    with pd.ExcelFile(file_path) as excel_file:
+        samples = excel_file.parse(sheet_name=sheet_names, nrows=ANALYZE_SAMPLE_ROWS)
+
+    sheets = []
+    for sheet_name in sheet_names:
+        source_name = sheet_source_name(file_name, sheet_name)
+        result = analyze_sample(samples[sheet_name], source_name, template_name)
+        sheets.append(dict(result, status="success", sheet_name=sheet_name, file_path=source_name))
+
+    return dict(
+        {key: sheets[0][key] for key in ("total_rows", "columns")},
+        file_name=file_name,
+        sheet_names=available,
+        sheets=sheets,
+        missing_sheets=missing,
+        groups=group_by_header(sheets)
+    )
+#---------------------------------
+
+
+def _analyze_file_task(file_path, template_name, selection=None):
+    """批量分析的工作函数，出错时返回错误信息而不是抛出异常"""
+    try:
+        if selection is not None:
+            return dict(status="success", file_path=file_path, **analyze_workbook(file_path, template_name, selection))
+        df = read_sample(file_path)
+        return dict(status="success", file_path=file_path, **analyze_sample(df, file_path, template_name))
+    except Exception as e:
+        return {"status": "error", "file_path": file_path,
+                "file_name": os.path.basename(file_path), "message": str(e)}
+
+
+def group_by_header(results):
+    """
+    把列名集合相同的文件分为一组，每组只需确认一次映射
+    
+    分析了多个工作表的结果按工作表分组，组内files为工作表的来源名称（"文件名#工作表"）。
+    
+    Returns:
+        list: [{"group_id", "columns", "files", "mapping"}]，按文件数降序
+    """
+    groups = {}
+    entries = [entry for result in results for entry in result.get("sheets", [result])]
+    for result in entries:
+        if result["status"] != "success":
+            continue
+        key = tuple(sorted(c["original_name"] for c in result["columns"]))
+        group = groups.setdefault(key, {
+            "group_id": hashlib.md5(json.dumps(key, ensure_ascii=False).encode('utf-8')).hexdigest()[:12],
+            "columns": [c["original_name"] for c in result["columns"]],
+            "files": [],
+            "mapping": {c["original_name"]: c["mapped_to"] for c in result["columns"]}
+        })
+        group["files"].append(result["file_path"])
+    return sorted(groups.values(), key=lambda g: len(g["files"]), reverse=True)
+
+
+@app.route('/api/analyze-files', methods=['POST'])
+def analyze_files():
+    """
+    Analyze many Excel files concurrently
+    
+    stream为true时以NDJSON逐行返回每个文件的结果（按完成顺序），最后一行为分组汇总；
+    否则一次性返回全部结果和按列名分组的映射。传入sheets或sheet_pattern时按工作表分析和分组。
+    """
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    data = request.json
+    file_paths = data.get('file_paths', [])
+    template_name = data.get('template_name', None)
+    stream = data.get('stream', False)
+
+    if not file_paths:
+        return jsonify({"status": "error", "message": "Missing file paths"}), 400
+
+    try:
+        max_workers = max(int(data.get('max_workers', ANALYZE_WORKERS)), 1)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "max_workers must be an integer"}), 400
+
+    selection, error = parse_sheet_selection(data)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    def iter_results():
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(file_paths)), thread_name_prefix="analyze") as pool:
+            futures = [pool.submit(_analyze_file_task, path, template_name, selection) for path in file_paths]
+            for future in as_completed(futures):
+                yield future.result()
+
+    if not stream:
+        results = list(iter_results())
+        order = {path: i for i, path in enumerate(file_paths)}
+        results.sort(key=lambda r: order[r["file_path"]])
+        return jsonify({"status": "success", "results": results, "groups": group_by_header(results)})
+
+    def generate():
+        results = []
+        for result in iter_results():
+            results.append(result)
+            yield json.dumps(dict(type="file", **result), ensure_ascii=False, default=str) + "\n"
+        yield json.dumps({"type": "summary", "status": "success", "groups": group_by_header(results)},
+                         ensure_ascii=False, default=str) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+# 大文件阈值与流式读取块大小
+LARGE_FILE_THRESHOLD = 50 * 1024 * 1024  # 50MB
+LARGE_FILE_CHUNK_SIZE = 5000
+
+
+def _convert_excel_cell(cell):
+    """按pandas读取Excel时的规则转换单元格值（空值为""，错误值为NaN，整数值的浮点数转为int）"""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    value = cell.value
+    if value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        int_value = int(value)
+        if int_value == value:
+            return int_value
+        return float(value)
+    return value
+
+
+def iter_excel_chunks(file_path, sheet_name=None, chunk_size=LARGE_FILE_CHUNK_SIZE, stats=None, workbook=None):
+    """
+    流式读取Excel工作表，只遍历一次，逐块返回DataFrame
+    
+    使用openpyxl只读模式逐行读取，内存占用与文件大小无关。每个块的列名、空值
+    和类型推断规则与pd.read_excel一致，块内索引从0开始。
+    
+    Args:
+        file_path: Excel文件路径
+        sheet_name: 工作表名称，默认为第一个工作表
+        chunk_size: 每块的行数
+        stats: 可选字典，读取过程中写入 estimated_rows（工作表声明的行数）和 total_rows（实际数据行数）
+        workbook: 可选，已用只读模式打开的openpyxl工作簿（读取同一文件的多个工作表时共用，由调用方关闭）
+        
+    Yields:
+        pd.DataFrame: 数据块
+    """
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+
+    if stats is None:
+        stats = {}
+
+    own_workbook = workbook is None
+    if own_workbook:
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        # 工作表声明的尺寸可能不准确，只用于进度估算
+        stats["estimated_rows"] = max((sheet.max_row or 1) - 1, 0)
+        stats["total_rows"] = 0
+        # 只读模式按声明的尺寸截断行和列，与pandas一样先重置，读取全部实际内容
+        if hasattr(sheet, "reset_dimensions"):
+            sheet.reset_dimensions()
+
+        rows = sheet.iter_rows()
+        header = None
+        width = 0
+        buffer = []
+        pending_blank = []  # 暂存空行，确认后面还有数据时才输出（与pandas一样去掉末尾空行）
+
+        def build_chunk(data_rows):
+            nonlocal width
+            width = max([width, len(header)] + [len(r) for r in data_rows])
+            padded = [r + [""] * (width - len(r)) for r in [header] + data_rows]
+            return TextParser(padded, header=0, skip_blank_lines=False).read()
+
+        for row in rows:
+            converted = [_convert_excel_cell(cell) for cell in row]
+            while converted and converted[-1] == "":
+                converted.pop()
+
+            if header is None:
+                header = converted
+                continue
+
+            if not converted:
+                pending_blank.append(converted)
+                continue
+
+            buffer.extend(pending_blank)
+            pending_blank = []
+            buffer.append(converted)
+
+            while len(buffer) >= chunk_size:
+                chunk_rows, buffer = buffer[:chunk_size], buffer[chunk_size:]
+                stats["total_rows"] += len(chunk_rows)
+                yield build_chunk(chunk_rows)
+
+        if buffer:
+            stats["total_rows"] += len(buffer)
+            yield build_chunk(buffer)
+    finally:
+        if own_workbook:
+            workbook.close()
+
+
+# 大文件每处理多少块提交一次
+LARGE_FILE_BATCH_CHUNKS = 5
+
+# 并行模式下每个文件最多预读的批次数，主进程按文件顺序写入
+PARALLEL_READ_AHEAD_BATCHES = 4
+# 等待工作进程下一条队列消息的最长时间（秒），超时按读取失败处理；打开大工作簿可能需要较长时间
+PARALLEL_QUEUE_STALL_SECONDS = float(os.environ.get('BACKEND_PARALLEL_QUEUE_STALL_SECONDS', 600))
+
+
+class FileIngestError(Exception):
+    """工作进程读取或转换文件失败，消息即file_stats中的错误描述"""
+
+
+# 导入台账
+#---------------------------------
+
+# 文件内容哈希缓存: {(路径, 大小, 修改时间): 哈希}
+CONTENT_HASH_CACHE_SIZE = 64
+content_hash_cache = OrderedDict()
+content_hash_lock = threading.Lock()
+
+
+def file_content_hash(file_path, block_size=1024 * 1024):
+    """文件内容的SHA-256；同一工作簿的多个工作表共用一次计算（按路径、大小和修改时间缓存）"""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with content_hash_lock:
+        if key in content_hash_cache:
+            content_hash_cache.move_to_end(key)
+            return content_hash_cache[key]
+    digest = _file_content_hash(file_path, block_size)
+    with content_hash_lock:
+        content_hash_cache[key] = digest
+        while len(content_hash_cache) > CONTENT_HASH_CACHE_SIZE:
+            content_hash_cache.popitem(last=False)
+    return digest
+
+
+def _file_content_hash(file_path, block_size):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+INGEST_LEDGER_COLUMNS = ["content_hash", "file_size", "mtime", "row_count", "rows_hash", "mapping_hash"]
+
+
+def ensure_ingest_ledger(cursor):
+    """
+    创建导入台账，按文件绝对路径和工作表区分
+
+    旧版台账按文件名区分，不同目录下的同名文件共用一条记录，这里重建为按路径区分。
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_ledger (
+        file_path TEXT,
+        sheet_name TEXT DEFAULT '',
+        file_name TEXT,
+        content_hash TEXT,
+        file_size INTEGER,
+        mtime REAL,
+        row_count INTEGER,
+        rows_hash TEXT,
+        mapping_hash TEXT,
+        ingested_at TEXT,
+        PRIMARY KEY (file_path, sheet_name)
+    )
+    """)
+    primary_key = [row[1] for row in sorted(
+        (row for row in cursor.execute("PRAGMA table_info(ingest_ledger)").fetchall() if row[5]),
+        key=lambda row: row[5]
+    )]
+    if primary_key == ["file_path", "sheet_name"]:
+        return
+    logger.info("迁移导入台账：按文件路径区分")
+    cursor.execute("ALTER TABLE ingest_ledger RENAME TO ingest_ledger_old")
+    ensure_ingest_ledger(cursor)
+    old_columns = set(_table_columns(cursor, "ingest_ledger_old"))
+    sheet_name = "IFNULL(sheet_name, '')" if "sheet_name" in old_columns else "''"
+    cursor.execute(f"""
+    INSERT OR REPLACE INTO ingest_ledger
+        (file_path, sheet_name, file_name, {', '.join(INGEST_LEDGER_COLUMNS)}, ingested_at)
+    SELECT file_path, {sheet_name}, file_name, {', '.join(INGEST_LEDGER_COLUMNS)}, ingested_at
+    FROM ingest_ledger_old WHERE file_path IS NOT NULL
+    """)
+    cursor.execute("DROP TABLE ingest_ledger_old")
+
+
+def get_ledger_entry(cursor, file_path, sheet_name=""):
+    cursor.execute(
+        f"SELECT {', '.join(INGEST_LEDGER_COLUMNS)} FROM ingest_ledger WHERE file_path = ? AND sheet_name = ?",
+        (file_path, sheet_name)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(INGEST_LEDGER_COLUMNS, row))
+
+
+def plan_file_ingest(cursor, file_path, conversion_plan, force=False):
+    """
+    根据台账决定文件（或工作表，由conversion_plan的sheet_name决定）的导入方式
+    
+    - new: 没有台账记录，完整导入
+    - skipped: 大小和修改时间未变，或内容哈希未变，直接跳过
+    - append: 内容变化，读取时校验已导入的行，只导入追加的行（校验失败时改为reingest）
+    - reingest: 列映射变化或强制重新导入，完整导入
+    
+    Returns:
+        dict: action、ledger_entry（append时使用）、file_info（写入台账的文件信息）
+    """
+    stat = os.stat(file_path)
+    file_info = {
+        "file_name": os.path.basename(file_path),
+        "sheet_name": conversion_plan.get("sheet_name", ""),
+        "file_path": os.path.abspath(file_path),
+        "file_size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "mapping_hash": conversion_plan["fingerprint"]
+    }
+    plan = {"action": "new", "ledger_entry": None, "file_info": file_info}
+
+    entry = get_ledger_entry(cursor, file_info["file_path"], file_info["sheet_name"])
+    if entry is None:
+        # 同名文件已从其他路径导入且内容相同（文件被复制或移动），数据已在库中，直接跳过
+        cursor.execute(
+            "SELECT file_path FROM ingest_ledger WHERE file_name = ? AND sheet_name = ? AND file_path != ?",
+            (file_info["file_name"], file_info["sheet_name"], file_info["file_path"])
+        )
+        same_name_paths = [row[0] for row in cursor.fetchall()]
+        if same_name_paths:
+            file_info["content_hash"] = file_content_hash(file_path)
+            for other_path in same_name_paths:
+                other = get_ledger_entry(cursor, other_path, file_info["sheet_name"])
+                if other["content_hash"] == file_info["content_hash"] and other["mapping_hash"] == file_info["mapping_hash"]:
+                    plan["action"] = "skipped"
+                    plan["ledger_entry"] = other
+                    record_ingest_ledger(cursor, plan, {"total_rows": other["row_count"], "rows_hash": other["rows_hash"]})
+                    return plan
+        return plan
+    if force or entry["mapping_hash"] != file_info["mapping_hash"]:
+        plan["action"] = "reingest"
+        return plan
+
+    plan["ledger_entry"] = entry
+    if entry["file_size"] == file_info["file_size"] and entry["mtime"] == file_info["mtime"]:
+        plan["action"] = "skipped"
+        return plan
+
+    file_info["content_hash"] = file_content_hash(file_path)
+    if file_info["content_hash"] == entry["content_hash"]:
+        # 内容相同（例如只修改了时间），只更新台账中的修改时间
+        plan["action"] = "skipped"
+        cursor.execute(
+            "UPDATE ingest_ledger SET mtime = ? WHERE file_path = ? AND sheet_name = ?",
+            (file_info["mtime"], file_info["file_path"], file_info["sheet_name"])
+        )
+        return plan
+
+    plan["action"] = "append"
+    return plan
+
+
+def record_ingest_ledger(cursor, plan, read_stats):
+    """文件导入完成后更新台账"""
+    file_info = plan["file_info"]
+    content_hash = file_info.get("content_hash") or file_content_hash(file_info["file_path"])
+    cursor.execute(
+        "INSERT OR REPLACE INTO ingest_ledger "
+        "(file_path, sheet_name, file_name, content_hash, file_size, mtime, row_count, rows_hash, mapping_hash, ingested_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (file_info["file_path"], file_info["sheet_name"], file_info["file_name"], content_hash,
+         file_info["file_size"], file_info["mtime"], read_stats.get("total_rows", 0),
+         read_stats.get("rows_hash"), file_info["mapping_hash"], datetime.now().isoformat())
+    )
+
+
+def delete_source_rows(cursor, source_file, fts_sync=None):
+    """
+    删除一个来源已写入的数据行和被拒绝行，完整重新导入前调用（不提交，与第一批写入在同一事务中）
+
+    合并期间同步触发器已移除：全文索引只包含rowid不大于fts_sync["start_rowid"]的行，
+    统计表只包含同步位置之前的行，这些行在删除前手动从全文索引和统计表中减去。
+    删除最大的rowid后新写入的行会复用这些rowid，因此同步位置随之降到剩余行的最大rowid。
+
+    Returns:
+        dict: deleted_rows、deleted_rejected
+    """
+    fts_start_rowid = fts_sync.get("start_rowid") if fts_sync else None
+    if fts_start_rowid is not None and not _fts_triggers_complete(cursor):
+        columns = ", ".join(FTS_TEXT_COLUMNS)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+            f"SELECT 'delete', rowid, {columns} FROM transactions WHERE source_file = ? AND rowid <= ?",
+            (source_file, fts_start_rowid)
+        )
+    stats_suspended = not _stats_triggers_complete(cursor)
+    if stats_suspended:
+        sync_rowid = _stats_summary_value(cursor, "sync_rowid")
+        synced_rows = cursor.execute(
+            "SELECT COUNT(*) FROM transactions WHERE source_file = ? AND rowid <= ?", (source_file, sync_rowid)
+        ).fetchone()[0]
+        if synced_rows:
+            cursor.execute(
+                "UPDATE stats_files SET row_count = row_count - ?, dirty = 1 WHERE source_file = ?",
+                (synced_rows, source_file)
+            )
+            for account, count in cursor.execute(
+                "SELECT IFNULL(账号, ''), COUNT(*) FROM transactions WHERE source_file = ? AND rowid <= ? "
+                "GROUP BY IFNULL(账号, '')", (source_file, sync_rowid)
+            ).fetchall():
+                cursor.execute("UPDATE stats_accounts SET row_count = row_count - ? WHERE 账号 = ?", (count, account))
+            cursor.execute("DELETE FROM stats_accounts WHERE row_count <= 0")
+    cursor.execute("DELETE FROM transactions WHERE source_file = ?", (source_file,))
+    deleted_rows = cursor.rowcount
+    max_rowid = cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM transactions").fetchone()[0]
+    if fts_start_rowid is not None and max_rowid < fts_start_rowid:
+        fts_sync["start_rowid"] = max_rowid
+    if stats_suspended and max_rowid < sync_rowid:
+        _set_stats_summary(cursor, "sync_rowid", max_rowid)
+
+    cursor.execute(
+        "DELETE FROM rejected_cells WHERE raw_row_id IN (SELECT id FROM rejected_raw_rows WHERE source_file = ?)",
+        (source_file,)
+    )
+    deleted_rejected = cursor.rowcount
+    cursor.execute("DELETE FROM rejected_raw_rows WHERE source_file = ?", (source_file,))
+    adjust_rejected_count(cursor, -deleted_rejected)
+    logger.info("重新导入 %s：删除之前写入的 %d 行、%d 个被拒绝的单元格", source_file, deleted_rows, deleted_rejected)
+    return {"deleted_rows": deleted_rows, "deleted_rejected": deleted_rejected}
+
+
+def mark_ingest_incomplete(cursor, plan):
+    """
+    在台账中把文件（工作表）标记为导入未完成：清空映射指纹，没有记录时写入只有路径的记录
+
+    导入中途失败或取消时已提交的批次保留在库中，下次合并据此判定为reingest，先删除这些行再完整导入；
+    导入完成后record_ingest_ledger覆盖该标记。
+    """
+    file_info = plan["file_info"]
+    cursor.execute(
+        "INSERT INTO ingest_ledger (file_path, sheet_name, file_name, ingested_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (file_path, sheet_name) DO UPDATE SET mapping_hash = NULL",
+        (file_info["file_path"], file_info["sheet_name"], file_info["file_name"], datetime.now().isoformat())
+    )
+
+
+def guard_ingest_batches(batches, cursor, plan, source_file, read_stats, fts_sync=None):
+    """
+    包装一个来源的批次，在写入第一批之前（与第一批在同一事务中提交）：
+
+    - 用mark_ingest_incomplete在台账中标记导入未完成，中途失败时下次合并会清理并完整重新导入
+    - 完整重新导入时删除该来源之前写入的行
+
+    台账决定的reingest开始时即可确定；追加校验失败改为reingest时，读取方在产生
+    第一批之前就把read_stats["ingest_action"]设为"reingest"。没有任何批次时在最后删除。
+    数据行只按来源名（文件名）区分，其他目录下的同名文件的行也会被删除，因此一并删除
+    它们的台账记录，下次合并时完整导入。
+    """
+    def purge():
+        file_info = plan["file_info"]
+        cursor.execute(
+            "DELETE FROM ingest_ledger WHERE file_name = ? AND sheet_name = ? AND file_path != ?",
+            (file_info["file_name"], file_info["sheet_name"], file_info["file_path"])
+        )
+        if cursor.rowcount:
+            logger.warning("%s 与其他目录下的同名文件共用来源名，它们的行将在下次合并时重新导入", source_file)
+        delete_source_rows(cursor, source_file, fts_sync)
+
+    started = False
+    for batch in batches:
+        if not started:
+            mark_ingest_incomplete(cursor, plan)
+            if read_stats.get("ingest_action", plan["action"]) == "reingest":
+                purge()
+            started = True
+        yield batch
+    if not started and read_stats.get("ingest_action", plan["action"]) == "reingest":
+        mark_ingest_incomplete(cursor, plan)
+        purge()
+#---------------------------------
+
+
+def _normalize_float_text(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _row_hashes(chunk):
+    """
+    每行一个64位哈希，按单元格的字符串形式计算
+    
+    整数值的浮点数按整数处理：列中出现空值时pandas会把整数列读为浮点列，
+    文件追加行后已导入行的哈希不应因此改变。
+    """
+    columns = {}
+    for i in range(chunk.shape[1]):
+        series = chunk.iloc[:, i]
+        if series.dtype.kind == 'f':
+            values = series.to_numpy()
+            text = series.astype(str).to_numpy(dtype=object)
+            integral = np.isfinite(values) & (values == np.floor(values))
+            text[integral] = [str(int(v)) for v in values[integral]]
+        elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ("floating", "mixed-integer-float", "mixed"):
+            text = np.array([_normalize_float_text(v) for v in series.to_numpy()], dtype=object)
+        else:
+            text = series.astype(str).to_numpy(dtype=object)
+        columns[i] = text
+    return pd.util.hash_pandas_object(pd.DataFrame(columns, index=chunk.index), index=False).values
+
+
+class _AppendMismatch(Exception):
+    """文件中已导入的行发生了变化，不能只导入追加的行"""
+
+
+def _iter_new_rows(chunks, read_stats, ledger_entry):
+    """
+    计算文件内容的行哈希，并跳过台账中已导入的行
+    
+    每行按字符串值计算哈希，与表头一起累积为rows_hash。有台账记录时，前row_count行的
+    哈希必须与台账一致，否则抛出_AppendMismatch。行哈希写入read_stats["rows_hash"]。
+    
+    Yields:
+        (chunk_df, start_row): 需要导入的行（保留原索引）和块的起始行号
+    """
+    skip_rows = ledger_entry["row_count"] if ledger_entry else 0
+    hasher = hashlib.sha256()
+    header_hashed = False
+    rows_seen = 0
+
+    for chunk in chunks:
+        if not header_hashed:
+            hasher.update(json.dumps([str(c) for c in chunk.columns], ensure_ascii=False).encode('utf-8'))
+            header_hashed = True
+        row_hashes = _row_hashes(chunk)
+        start_row = rows_seen
+        rows_seen += len(chunk)
+
+        known = min(max(skip_rows - start_row, 0), len(chunk))
+        hasher.update(row_hashes[:known].tobytes())
+        if known and start_row + known == skip_rows:
+            if hasher.hexdigest() != ledger_entry["rows_hash"]:
+                raise _AppendMismatch()
+        hasher.update(row_hashes[known:].tobytes())
+        if known < len(chunk):
+            yield chunk.iloc[known:], start_row
+
+    if rows_seen < skip_rows:
+        raise _AppendMismatch()
+    read_stats["rows_hash"] = hasher.hexdigest()
+
+
+def iter_file_batches(file_path, conversion_plan, read_stats, ledger_entry=None, excel_file=None):
+    """
+    读取并转换一个Excel工作表（conversion_plan的sheet_name，默认第一个），逐批返回 (mapped_data, rejected_rows)
+    
+    小文件整体读取为一批；大文件流式读取，每LARGE_FILE_BATCH_CHUNKS块为一批。
+    读取的总行数写入read_stats["total_rows"]。传入台账记录时只转换追加的行；
+    已导入的行发生变化时改为重新导入整个工作表，read_stats["ingest_action"]记为"reingest"。
+    excel_file为已打开的pd.ExcelFile时用它读取，同一文件的多个工作表只打开一次。
+    """
+    reset_row_log_counts()
+    try:
+        yield from _iter_file_batches(file_path, conversion_plan, read_stats, ledger_entry, excel_file)
+    except _AppendMismatch:
+        logger.warning("%s 已导入的行发生变化，重新导入", conversion_plan["file_name"])
+        read_stats.clear()
+        read_stats["ingest_action"] = "reingest"
+        yield from _iter_file_batches(file_path, conversion_plan, read_stats, None, excel_file)
+
+
+def _check_sheet_header(chunks, conversion_plan):
+    """
+    共用文件列映射的工作表，表头必须包含映射中的全部原始列，否则整个工作表不导入
+
+    只检查第一块；没有表头的空工作表不检查。
+    """
+    required = conversion_plan.get("required_columns")
+    for chunk_idx, chunk in enumerate(chunks):
+        if chunk_idx == 0 and required and len(chunk.columns):
+            present = {str(col).strip() for col in chunk.columns}
+            missing = [col for col in required if str(col).strip() not in present]
+            if missing:
+                raise FileIngestError(
+                    f"工作表 {conversion_plan.get('sheet_name')} 的表头与列映射不匹配，缺少列: {', '.join(map(str, missing))}"
+                )
+        yield chunk
+
+
+def _iter_file_batches(file_path, conversion_plan, read_stats, ledger_entry, excel_file=None):
+    file_size = os.path.getsize(file_path)
+    sheet_name = conversion_plan.get("sheet_name") or None
+    if file_size <= LARGE_FILE_THRESHOLD:
+        # 小文件直接处理
+        read_start = time.perf_counter()
+        df = pd.read_excel(excel_file if excel_file is not None else file_path, sheet_name=sheet_name or 0)
+        record_stage("read", time.perf_counter() - read_start, len(df))
+        read_stats["total_rows"] = len(df)
+        for new_rows, start_row in _iter_new_rows(_check_sheet_header([df], conversion_plan), read_stats, ledger_entry):
+            convert_start = time.perf_counter()
+            results = process_dataframe_chunk(new_rows, conversion_plan, start_row)
+            convert_seconds = time.perf_counter() - convert_start
+            record_stage("convert", convert_seconds, len(new_rows))
+            log_event("chunk", file=conversion_plan["file_name"], chunk=1, start_row=start_row,
+                      rows=len(new_rows), mapped=len(results["mapped_data"]),
+                      rejected=len(results["rejected_rows"]),
+                      seconds=round(convert_seconds, 4))
+            yield results["mapped_data"], results["rejected_rows"]
+        return
+
+    logger.info("大文件处理模式: %s", conversion_plan["file_name"])
+    try:
+        chunks_processed = 0
+        all_mapped_data = []
+        all_rejected_rows = []
+        processed_rows = 0
+        file_rejected = 0  # 当前文件被拒绝的行数
+        
+        # 只遍历一次工作表，逐块读取处理
+        workbook = excel_file.book if excel_file is not None and excel_file.engine == "openpyxl" else None
+        chunks = _timed_chunks(iter_excel_chunks(file_path, sheet_name=sheet_name, chunk_size=LARGE_FILE_CHUNK_SIZE,
+                                                 stats=read_stats, workbook=workbook))
+        chunks = _check_sheet_header(chunks, conversion_plan)
+        for chunk_df, start_row in _iter_new_rows(chunks, read_stats, ledger_entry):
+            convert_start = time.perf_counter()
+            chunk_results = process_dataframe_chunk(chunk_df, conversion_plan, start_row)
+            convert_seconds = time.perf_counter() - convert_start
+            record_stage("convert", convert_seconds, len(chunk_df))
+            
+            current_mapped = chunk_results["mapped_data"]
+            current_rejected = chunk_results["rejected_rows"]
+            log_event("chunk", file=conversion_plan["file_name"], chunk=chunks_processed + 1,
+                      start_row=start_row, rows=len(chunk_df), mapped=len(current_mapped),
+                      rejected=len(current_rejected),
+                      rows_read=read_stats.get("total_rows", 0),
+                      estimated_rows=read_stats.get("estimated_rows", 0),
+                      seconds=round(convert_seconds, 4))
+            
+            all_mapped_data.extend(current_mapped)
+            all_rejected_rows.extend(current_rejected)
+            processed_rows += len(current_mapped)
+            file_rejected += len(current_rejected)
+            
+            chunks_processed += 1
+            if chunks_processed % LARGE_FILE_BATCH_CHUNKS == 0:
+                yield all_mapped_data, all_rejected_rows
+                
+                # 清空临时列表以释放内存
+                all_mapped_data = []
+                all_rejected_rows = []
+        
+        # 处理剩余数据
+        if all_mapped_data or all_rejected_rows:
+            yield all_mapped_data, all_rejected_rows
+        
+        logger.info("大文件处理完成. 总行数: %d, 处理行数: %d, 拒绝行数: %d",
+                    read_stats.get("total_rows", 0), processed_rows, file_rejected)
+    except (_AppendMismatch, FileIngestError):
+        raise
+    except Exception as big_file_error:
+        logger.exception("大文件处理失败: %s", big_file_error)
+        raise big_file_error
+
+
+def write_file_batches(conn, cursor, batches, on_batch=None):
+    """
+    将一个文件的批次依次写入数据库，每批提交一次
+    
+    Args:
+        on_batch: 可选回调，每批写入后以当前统计调用（用于任务进度和取消检查）
+    
+    Returns:
+        dict: processed_rows、rejected_rows、duplicate_rows、failed_rows、inserted_rows
+    """
+    stats = {"processed_rows": 0, "rejected_rows": 0, "duplicate_rows": 0, "failed_rows": 0, "inserted_rows": 0}
+    for mapped_data, rejected_rows in batches:
+        if mapped_data or rejected_rows:
+            write_start = time.perf_counter()
+            insert_result = insert_data_to_db(conn, cursor, mapped_data, rejected_rows)
+            commit_start = time.perf_counter()
+            conn.commit()
+            write_end = time.perf_counter()
+            record_stage("insert", commit_start - write_start, len(mapped_data) + len(rejected_rows))
+            record_stage("commit", write_end - commit_start)
+            log_event("batch", mapped=len(mapped_data), rejected=len(rejected_rows),
+                      inserted=insert_result["inserted"], duplicates=insert_result["duplicates"],
+                      failed=insert_result["failed"],
+                      seconds=round(write_end - write_start, 4))
+            stats["duplicate_rows"] += insert_result["duplicates"]
+            stats["failed_rows"] += insert_result["failed"]
+            stats["inserted_rows"] += insert_result["inserted"]
+        stats["processed_rows"] += len(mapped_data)
+        stats["rejected_rows"] += len(rejected_rows)
+        if on_batch:
+            on_batch(stats)
+    return stats
+
+
+def _ingest_file_worker(file_path, conversion_plan, batch_queue, ledger_entry=None, excel_file=None):
+    """
+    进程池工作函数：读取并转换一个文件（工作表），把批次放入队列，由主进程统一写入数据库
+    
+    转换计划由主进程编译，列类型已按主进程的模板确定。
+    队列消息: ("batch", mapped_data, rejected_rows, read_stats)、("done", read_stats, 指标增量)、("error", 错误描述)
+    """
+    read_stats = {}
+    metrics_before = metrics_snapshot()
+    parse_before = get_parse_stats()
+    try:
+        for mapped_data, rejected_rows in iter_file_batches(file_path, conversion_plan, read_stats, ledger_entry, excel_file):
+            batch_queue.put(("batch", mapped_data, rejected_rows, dict(read_stats)))
+        batch_queue.put(("done", read_stats, (metrics_delta(metrics_before), parse_stats_delta(parse_before))))
+    except FileIngestError as sheet_error:
+        batch_queue.put(("error", str(sheet_error)))
+    except pd.errors.ParserError as excel_error:
+        batch_queue.put(("error", f"Excel解析错误: {str(excel_error)}"))
+    except Exception as excel_error:
+        logger.exception("读取Excel文件失败: %s", excel_error)
+        batch_queue.put(("error", f"读取Excel文件失败: {str(excel_error)}"))
+
+
+def _ingest_sheets_worker(file_path, sheet_tasks):
+    """
+    进程池工作函数：依次读取同一工作簿的多个工作表，工作簿只打开一次（共享字符串只解析一次）
+
+    Args:
+        sheet_tasks: [(conversion_plan, batch_queue, ledger_entry)]，按主进程写入的顺序排列
+    """
+    try:
+        excel_file = pd.ExcelFile(file_path)
+    except Exception as excel_error:
+        for _, batch_queue, _ in sheet_tasks:
+            batch_queue.put(("error", f"读取Excel文件失败: {str(excel_error)}"))
+        return
+    try:
+        for conversion_plan, batch_queue, ledger_entry in sheet_tasks:
+            _ingest_file_worker(file_path, conversion_plan, batch_queue, ledger_entry, excel_file)
+    finally:
+        excel_file.close()
+
+
+def _iter_queue_batches(batch_queue, future, read_stats):
+    """
+    从工作进程队列中读取一个文件的批次，直到文件处理完成
+
+    工作进程已退出却没有发送结束消息，或超过PARALLEL_QUEUE_STALL_SECONDS秒没有新消息时抛出FileIngestError，
+    不会无限等待。
+    """
+    import queue
+
+    last_message = time.monotonic()
+    while True:
+        try:
+            message = batch_queue.get(timeout=1)
+        except queue.Empty:
+            # 工作进程退出后不会再发送消息
+            if future.done() and batch_queue.empty():
+                if future.exception() is not None:
+                    raise FileIngestError(f"读取Excel文件失败: {str(future.exception())}")
+                raise FileIngestError("读取Excel文件失败: 工作进程已结束但没有返回结果")
+            if time.monotonic() - last_message > PARALLEL_QUEUE_STALL_SECONDS:
+                raise FileIngestError(f"读取Excel文件失败: 工作进程超过 {PARALLEL_QUEUE_STALL_SECONDS} 秒没有返回数据")
+            continue
+        last_message = time.monotonic()
+        if message[0] == "batch":
+            read_stats.update(message[3])
+            yield message[1], message[2]
+        elif message[0] == "done":
+            read_stats.update(message[1])
+            merge_metrics(*message[2])
+            return
+        else:
+            raise FileIngestError(message[1])
+
+
+# 后台合并任务
+#---------------------------------
+INGEST_JOB_WORKERS = 1  # 同时运行的合并任务数，其余任务排队
+MAX_FINISHED_JOBS = 50  # 保留的已结束任务数
+
+ingest_jobs = {}
+ingest_jobs_lock = threading.Lock()
+ingest_job_executor = None
+
+
+class JobCancelled(Exception):
+    """合并任务被用户取消"""
+
+
+def parse_merge_request(data):
+    """
+    解析并校验合并请求参数
+    
+    Returns:
+        (params, error): 参数字典；参数无效时params为None，error为 (响应内容, 状态码)
+    """
+    file_paths = data.get('file_paths', [])
+    db_path = data.get('db_path')
+    ingest_profile = data.get('ingest_profile', DEFAULT_INGEST_PROFILE)
+
+    if not file_paths or not db_path:
+        return None, ({"status": "error", "message": "Missing file paths or database path"}, 400)
+
+    # 并行进程数：1为顺序处理，0表示使用全部CPU核心
+    try:
+        parallel_workers = int(data.get('parallel_workers', 1))
+    except (TypeError, ValueError):
+        return None, ({"status": "error", "message": "parallel_workers must be an integer"}, 400)
+    if parallel_workers <= 0:
+        parallel_workers = os.cpu_count() or 1
+
+    if ingest_profile not in SQLITE_INGEST_PROFILES:
+        return None, ({
+            "status": "error",
+            "message": f"Unknown ingest profile '{ingest_profile}', expected one of {list(SQLITE_INGEST_PROFILES)}"
+        }, 400)
+
+    sheet_selection, error = parse_sheet_selection(data)
+    if error:
+        return None, error
+
+    return {
+        "file_paths": file_paths,
+        "db_path": db_path,
+        "column_mappings": data.get('column_mappings', {}),
+        "ingest_profile": ingest_profile,
+        "parallel_workers": parallel_workers,
+        "fts_index": bool(data.get('fts_index', False)),
+        "force_reingest": bool(data.get('force_reingest', False)),
+        "sheet_selection": sheet_selection,
+        "cprofile": bool(data.get('cprofile', False))
+    }, None
+
+
+def _update_job_file(job, file_idx, **fields):
+    """更新任务中某个文件的进度（没有任务时忽略）"""
+    if job is None:
+        return
+    with ingest_jobs_lock:
+        job["files"][file_idx].update(fields)
+
+
+def _check_job_cancelled(job):
+    """任务已被取消时抛出JobCancelled"""
+    if job is not None and job["cancel_event"].is_set():
+        raise JobCancelled()
+
+
+def job_to_dict(job):
+    """生成任务状态的JSON表示，包含每个文件的吞吐量和预计剩余时间"""
+    now = time.time()
+    with ingest_jobs_lock:
+        files = [dict(f) for f in job["files"]]
+        result = {
+            "job_id": job["id"],
+            "status": job["status"],
+            "db_path": job["params"]["db_path"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "result": job["result"]
+        }
+
+    for f in files:
+        elapsed = None
+        if f["started_at"]:
+            elapsed = (f["finished_at"] or now) - f["started_at"]
+        f["elapsed_seconds"] = round(elapsed, 2) if elapsed is not None else None
+        throughput = f["rows_read"] / elapsed if elapsed else 0
+        f["rows_per_second"] = round(throughput, 1)
+        eta = None
+        if f["status"] == "running" and throughput and f["estimated_rows"]:
+            eta = round(max(f["estimated_rows"] - f["rows_read"], 0) / throughput, 1)
+        f["eta_seconds"] = eta
+
+    result["files"] = files
+    result["rows_read"] = sum(f["rows_read"] for f in files)
+    result["rows_inserted"] = sum(f["rows_inserted"] for f in files)
+    result["rows_rejected"] = sum(f["rows_rejected"] for f in files)
+    return result
+
+
+def merge_files(params, job=None):
+    """
+    将多个Excel文件合并到数据库
+    
+    Args:
+        params: parse_merge_request返回的参数
+        job: 可选的后台任务，用于报告进度和响应取消
+        
+    Returns:
+        (响应内容, 状态码)
+    """
+    if params.get("cprofile"):
+        (payload, status_code), profile_info = run_profiled(merge_files, dict(params, cprofile=False), job)
+        payload["profile"] = profile_info
+        return payload, status_code
+
+    file_paths = params["file_paths"]
+    db_path = params["db_path"]
+    column_mappings = params["column_mappings"]
+    ingest_profile = params["ingest_profile"]
+    parallel_workers = params["parallel_workers"]
+
+    pool = None
+    manager = None
+    metrics_before = metrics_snapshot()
+    parse_before = get_parse_stats()
+    started = time.perf_counter()
+    try:
+        # Create database
+        create_database(db_path)
+        conn = get_connection(db_path, write=True)
+        profile_info = apply_ingest_profile(conn, ingest_profile)
+        cursor = conn.cursor()
+        # 合并期间暂停全文索引的逐行同步，结束后批量补齐
+        # 重新导入删除行时可能降低全文索引的同步位置，因此放在字典中
+        fts_sync = {"start_rowid": suspend_fts_sync(conn)}
+        suspend_stats_sync(conn)
+
+        total_processed = 0
+        total_rejected = 0
+        total_duplicates = 0
+        total_failed = 0
+        file_stats = []
+
+        # 每个工作表编译一次转换计划（共用文件映射的工作表共用同一个计划），
+        # 并根据导入台账决定跳过、只导入追加的行还是完整导入
+        sheet_selection = params.get("sheet_selection")
+        units = []  # 每个要导入的工作表一项：file_idx、conversion_plan、ingest_plan
+        file_units = {}  # file_idx -> 工作表在units中的下标
+        file_errors = {}
+        missing_sheets = {}
+        for file_idx, file_path in enumerate(file_paths):
+            if not os.path.exists(file_path):
+                continue
+            try:
+                sheet_names, missing_sheets[file_idx] = select_sheets(file_path, sheet_selection)
+            except Exception as e:
+                file_errors[file_idx] = f"读取工作表列表失败: {str(e)}"
+                continue
+            if not sheet_names:
+                file_errors[file_idx] = "没有匹配的工作表"
+                continue
+            for conversion_plan in compile_sheet_plans(file_path, sheet_names, column_mappings):
+                file_units.setdefault(file_idx, []).append(len(units))
+                units.append({
+                    "file_idx": file_idx,
+                    "conversion_plan": conversion_plan,
+                    "ingest_plan": plan_file_ingest(
+                        cursor, file_path, conversion_plan, params.get("force_reingest", False)
+                    )
+                })
+        conn.commit()
+
+        # 并行模式：进程池读取和转换工作表，当前线程作为唯一的写入者按顺序写入。
+        # 同一工作簿的工作表轮流分给至多parallel_workers个任务，每个任务只打开一次工作簿；
+        # 任务按第一个工作表的顺序提交，写入顺序等待的工作表总能被执行，不会互相阻塞
+        batch_queues = {}
+        worker_futures = {}
+        active_units = {i for i, unit in enumerate(units) if unit["ingest_plan"]["action"] != "skipped"}
+        parallel_workers = min(parallel_workers, len(active_units))
+        if parallel_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            
+            logger.info("并行处理模式: %d 个进程", parallel_workers)
+            manager = multiprocessing.Manager()
+            pool = ProcessPoolExecutor(max_workers=parallel_workers)
+            for file_idx in sorted(file_units):
+                file_active = [i for i in file_units[file_idx] if i in active_units]
+                for i in file_active:
+                    batch_queues[i] = manager.Queue(maxsize=PARALLEL_READ_AHEAD_BATCHES)
+                if len(file_active) == 1:
+                    unit = units[file_active[0]]
+                    worker_futures[file_active[0]] = pool.submit(
+                        _ingest_file_worker, file_paths[file_idx], unit["conversion_plan"],
+                        batch_queues[file_active[0]], unit["ingest_plan"]["ledger_entry"]
+                    )
+                    continue
+                group_count = min(parallel_workers, len(file_active))
+                for group_idx in range(group_count):
+                    group = file_active[group_idx::group_count]
+                    future = pool.submit(_ingest_sheets_worker, file_paths[file_idx], [
+                        (units[i]["conversion_plan"], batch_queues[i], units[i]["ingest_plan"]["ledger_entry"])
+                        for i in group
+                    ])
+                    for i in group:
+                        worker_futures[i] = future
+
+        def ingest_unit(unit_idx, excel_file, progress):
+            """
+            导入一个工作表（不选择工作表时即整个文件），返回统计；读取失败时统计中带error
+
+            progress为文件内之前的工作表已累计的任务进度，本工作表的进度在其基础上累加
+            """
+            unit = units[unit_idx]
+            file_path = file_paths[unit["file_idx"]]
+            conversion_plan = unit["conversion_plan"]
+            plan = unit["ingest_plan"]
+            ledger_entry = plan["ledger_entry"]
+            stat = {"file_name": os.path.basename(file_path)}
+            if conversion_plan.get("sheet_name"):
+                stat.update(sheet_name=conversion_plan["sheet_name"], source_file=conversion_plan["file_name"])
+
+            # 内容未变化的文件直接跳过
+            if plan["action"] == "skipped":
+                logger.info("文件未变化，跳过: %s", conversion_plan["file_name"])
+                progress["rows_read"] += ledger_entry["row_count"]
+                _update_job_file(job, unit["file_idx"], rows_read=progress["rows_read"])
+                return dict(stat, ingest_action="skipped", total_rows=ledger_entry["row_count"],
+                            skipped_rows=ledger_entry["row_count"], processed_rows=0, rejected_rows=0,
+                            duplicate_rows=0, failed_rows=0)
+
+            def abandon_queue():
+                """
+                写入失败时读完工作进程放入队列的剩余批次（直到结束或错误消息）：队列有容量上限，
+                否则工作进程一直阻塞在put()，同一任务中后续的工作表永远不会被读取
+                """
+                if queue_batches is None:
+                    return
+                try:
+                    for _ in queue_batches:
+                        pass
+                except FileIngestError:
+                    pass
+
+            # 尝试读取Excel文件
+            queue_batches = None
+            try:
+                read_stats = {}
+                if unit_idx in batch_queues:
+                    batches = queue_batches = _iter_queue_batches(batch_queues[unit_idx], worker_futures[unit_idx], read_stats)
+                else:
+                    batches = iter_file_batches(file_path, conversion_plan, read_stats, ledger_entry, excel_file)
+                batches = guard_ingest_batches(
+                    batches, cursor, plan, conversion_plan["file_name"], read_stats, fts_sync
+                )
+
+                def on_batch(stats):
+                    _update_job_file(
+                        job, unit["file_idx"],
+                        current_sheet=conversion_plan.get("sheet_name"),
+                        rows_read=progress["rows_read"] + read_stats.get("total_rows", 0),
+                        estimated_rows=progress["rows_read"] + read_stats.get("estimated_rows", read_stats.get("total_rows", 0)),
+                        rows_inserted=progress["rows_inserted"] + stats["inserted_rows"],
+                        rows_rejected=progress["rows_rejected"] + stats["rejected_rows"],
+                        duplicate_rows=progress["duplicate_rows"] + stats["duplicate_rows"]
+                    )
+                    _check_job_cancelled(job)
+
+                write_stats = write_file_batches(conn, cursor, batches, on_batch=on_batch)
+                ingest_action = read_stats.get("ingest_action", plan["action"])
+                record_ingest_ledger(cursor, plan, read_stats)
+            except JobCancelled:
+                raise
+            except FileIngestError as excel_error:
+                error_msg = str(excel_error)
+                logger.error(error_msg)
+                abandon_queue()
+                return dict(stat, error=error_msg)
+            except pd.errors.ParserError as excel_error:
+                error_msg = f"Excel解析错误: {str(excel_error)}"
+                logger.error(error_msg)
+                abandon_queue()
+                return dict(stat, error=error_msg)
+            except Exception as excel_error:
+                error_msg = f"读取Excel文件失败: {str(excel_error)}"
+                logger.exception(error_msg)
+                abandon_queue()
+                return dict(stat, error=error_msg)
+
+            progress["rows_read"] += read_stats.get("total_rows", 0)
+            progress["rows_inserted"] += write_stats["inserted_rows"]
+            progress["rows_rejected"] += write_stats["rejected_rows"]
+            progress["duplicate_rows"] += write_stats["duplicate_rows"]
+            return dict(
+                stat,
+                ingest_action=ingest_action,
+                total_rows=read_stats.get("total_rows", 0),
+                skipped_rows=ledger_entry["row_count"] if ingest_action == "append" else 0,
+                processed_rows=write_stats["processed_rows"],
+                rejected_rows=write_stats["rejected_rows"],
+                duplicate_rows=write_stats["duplicate_rows"],
+                failed_rows=write_stats["failed_rows"]
+            )
+
+        for file_idx, file_path in enumerate(file_paths):
+            _check_job_cancelled(job)
+            excel_file = None
+            try:
+                # 检查文件是否存在
+                if not os.path.exists(file_path):
+                    file_stats.append({
+                        "file_name": os.path.basename(file_path),
+                        "error": "文件不存在"
+                    })
+                    _update_job_file(job, file_idx, status="error", error="文件不存在")
+                    continue
+                if file_idx in file_errors:
+                    file_stats.append({
+                        "file_name": os.path.basename(file_path),
+                        "error": file_errors[file_idx]
+                    })
+                    _update_job_file(job, file_idx, status="error", error=file_errors[file_idx])
+                    continue
+
+                unit_indexes = file_units[file_idx]
+                if any(units[i]["ingest_plan"]["action"] != "skipped" for i in unit_indexes):
+                    # 检查文件大小
+                    file_size = os.path.getsize(file_path)
+                    logger.info("处理文件: %s, 大小: %.2f MB", os.path.basename(file_path), file_size / (1024 * 1024))
+                    _update_job_file(job, file_idx, status="running", started_at=time.time())
+                # 在当前线程读取多个工作表时共用一个工作簿对象
+                local_units = [i for i in unit_indexes
+                               if i not in batch_queues and units[i]["ingest_plan"]["action"] != "skipped"]
+                if len(local_units) > 1:
+                    excel_file = pd.ExcelFile(file_path)
+
+                progress = {"rows_read": 0, "rows_inserted": 0, "rows_rejected": 0, "duplicate_rows": 0}
+                sheet_stats = []
+                for sheet_idx, unit_idx in enumerate(unit_indexes):
+                    sheet_stats.append(ingest_unit(unit_idx, excel_file, progress))
+                    # 提交当前工作表的所有更改
+                    conn.commit()
+                    # 更新处理进度
+                    log_progress((file_idx + (sheet_idx + 1) / len(unit_indexes)) / len(file_paths) * 100)
+
+                for stat in sheet_stats:
+                    if "error" not in stat:
+                        total_processed += stat["processed_rows"]
+                        total_rejected += stat["rejected_rows"]
+                        total_duplicates += stat["duplicate_rows"]
+                        total_failed += stat["failed_rows"]
+
+                errors = [stat["error"] for stat in sheet_stats if "error" in stat]
+                if sheet_selection is None:
+                    file_stat = sheet_stats[0]
+                else:
+                    # 选择了工作表时文件的统计为各工作表之和，另附每个工作表的统计
+                    succeeded = [stat for stat in sheet_stats if "error" not in stat]
+                    actions = {stat["ingest_action"] for stat in succeeded}
+                    file_stat = {"file_name": os.path.basename(file_path)}
+                    if succeeded:
+                        file_stat["ingest_action"] = actions.pop() if len(actions) == 1 else "mixed"
+                        for key in ("total_rows", "skipped_rows", "processed_rows", "rejected_rows", "duplicate_rows",
+                                    "failed_rows"):
+                            file_stat[key] = sum(stat[key] for stat in succeeded)
+                    else:
+                        file_stat["error"] = errors[0]
+                    file_stat["sheets"] = sheet_stats
+                    if missing_sheets.get(file_idx):
+                        file_stat["missing_sheets"] = missing_sheets[file_idx]
+                file_stats.append(file_stat)
+
+                if "error" in file_stat:
+                    _update_job_file(job, file_idx, status="error", error=file_stat["error"], finished_at=time.time())
+                elif file_stat["ingest_action"] == "skipped":
+                    _update_job_file(job, file_idx, status="skipped", rows_read=progress["rows_read"])
+                else:
+                    _update_job_file(job, file_idx, status="completed", finished_at=time.time(),
+                                     rows_read=progress["rows_read"], error="; ".join(errors) or None)
+
+            except JobCancelled:
+                raise
+            except Exception as file_error:
+                error_msg = f"处理文件错误: {str(file_error)}"
+                logger.exception(error_msg)
+                file_stats.append({
+                    "file_name": os.path.basename(file_path),
+                    "error": error_msg
+                })
+                _update_job_file(job, file_idx, status="error", error=error_msg, finished_at=time.time())
+            finally:
+                if excel_file is not None:
+                    excel_file.close()
+
+        # 全部数据写入后再建立索引
+        conn.commit()
+        _check_job_cancelled(job)
+        with time_stage("index"):
+            index_stats = ensure_default_indexes(conn)
+        with time_stage("fts_sync"):
+            resume_fts_sync(conn, fts_sync["start_rowid"])
+        with time_stage("stats_sync"):
+            resume_stats_sync(conn)
+        fts_stats = None
+        if params.get("fts_index"):
+            try:
+                with time_stage("fts_index"):
+                    fts_stats = create_fts_index(conn)
+            except ValueError as e:
+                logger.error("创建全文索引失败: %s", e)
+                fts_stats = {"created": False, "error": str(e)}
+
+        # 最终提交，恢复持久化设置并关闭连接
+        conn.commit()
+        restore_durable_settings(conn)
+        conn.close()
+        invalidate_query_cache(db_path)
+
+        # 更新最近文件列表
+        update_recent_files(db_path)
+
+        return {
+            "status": "success",
+            "db_path": db_path,
+            "total_processed": total_processed,
+            "total_rejected": total_rejected,
+            "total_duplicates": total_duplicates,
+            "total_failed": total_failed,
+            "ingest_profile": profile_info,
+            "parallel_workers": max(parallel_workers, 1),
+            "indexes": index_stats,
+            "fts_index": fts_stats,
+            "file_stats": file_stats,
+            "metrics": collect_job_metrics(metrics_before, parse_before, started)
+        }, 200
+    except JobCancelled:
+        # 已提交的批次保留在数据库中
+        logger.warning("合并任务已取消: %s", db_path)
+        try:
+            conn.commit()
+            resume_fts_sync(conn, fts_sync["start_rowid"])
+            resume_stats_sync(conn)
+            restore_durable_settings(conn)
+        finally:
+            conn.close()
+        invalidate_query_cache(db_path)
+        return {
+            "status": "cancelled",
+            "db_path": db_path,
+            "total_processed": total_processed,
+            "total_rejected": total_rejected,
+            "total_duplicates": total_duplicates,
+            "total_failed": total_failed,
+            "ingest_profile": profile_info,
+            "file_stats": file_stats,
+            "metrics": collect_job_metrics(metrics_before, parse_before, started)
+        }, 200
+    except Exception as e:
+        logger.exception("处理文件过程中发生严重错误: %s", e)
+        
+        # 确保恢复持久化设置并关闭数据库连接
+        if 'conn' in locals() and conn:
+            try:
+                resume_fts_sync(conn, locals().get('fts_sync', {}).get('start_rowid'))
+                resume_stats_sync(conn)
+                restore_durable_settings(conn)
+            except:
+                pass
+            finally:
+                conn.close()
+            
+        return {
+            "status": "error", 
+            "message": str(e),
+            "details": traceback.format_exc()
+        }, 500
+    finally:
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manager:
+            manager.shutdown()
+
+
+def _run_ingest_job(job):
+    """在后台线程中执行合并任务"""
+    with ingest_jobs_lock:
+        if job["cancel_event"].is_set():
+            job["status"] = "cancelled"
+            job["finished_at"] = time.time()
+            return
+        job["status"] = "running"
+        job["started_at"] = time.time()
+
+    try:
+        payload, status_code = merge_files(job["params"], job)
+        status = payload["status"]
+        if status == "success":
+            status = "completed"
+        elif status == "error":
+            status = "failed"
+    except Exception as e:
+        logger.exception("合并任务失败: %s", e)
+        payload, status = {"status": "error", "message": str(e)}, "failed"
+
+    with ingest_jobs_lock:
+        job["status"] = status
+        job["result"] = payload
+        job["finished_at"] = time.time()
+
+
+def submit_ingest_job(params):
+    """创建合并任务并提交到后台执行器，返回任务"""
+    global ingest_job_executor
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "params": params,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "cancel_event": threading.Event(),
+        "files": [{
+            "file_name": os.path.basename(path),
+            "status": "pending",
+            "rows_read": 0,
+            "estimated_rows": None,
+            "rows_inserted": 0,
+            "rows_rejected": 0,
+            "duplicate_rows": 0,
+            "current_sheet": None,
+            "started_at": None,
+            "finished_at": None,
+            "error": None
+        } for path in params["file_paths"]]
+    }
+
+    with ingest_jobs_lock:
+        # 清理最早结束的任务
+        finished = [j for j in ingest_jobs.values() if j["finished_at"]]
+        finished.sort(key=lambda j: j["finished_at"])
+        for old_job in finished[:max(len(finished) - MAX_FINISHED_JOBS + 1, 0)]:
+            del ingest_jobs[old_job["id"]]
+        ingest_jobs[job["id"]] = job
+
+        if ingest_job_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            ingest_job_executor = ThreadPoolExecutor(max_workers=INGEST_JOB_WORKERS, thread_name_prefix="ingest-job")
+
+    ingest_job_executor.submit(_run_ingest_job, job)
+    return job
+#---------------------------------
+
+
+@app.route('/api/process-files', methods=['POST'])
+def process_files():
+    """Process multiple Excel files and merge them into a database"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    params, error = parse_merge_request(request.json)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    payload, status_code = merge_files(params)
+    return jsonify(payload), status_code
+
+
+@app.route('/api/ingest-jobs', methods=['POST'])
+def create_ingest_job():
+    """Submit a merge as a background job and return its ID immediately"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    params, error = parse_merge_request(request.json)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    job = submit_ingest_job(params)
+    return jsonify({"status": "success", "job_id": job["id"], "job_status": job["status"]})
+
+
+@app.route('/api/ingest-jobs', methods=['GET'])
+def list_ingest_jobs():
+    """List merge jobs with their progress"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    with ingest_jobs_lock:
+        jobs = list(ingest_jobs.values())
+    jobs.sort(key=lambda j: j["created_at"], reverse=True)
+    return jsonify({"status": "success", "jobs": [job_to_dict(job) for job in jobs]})
+
+
+@app.route('/api/ingest-jobs/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """Get progress of a merge job: rows read/inserted/rejected, throughput and ETA per file"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    job = ingest_jobs.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": f"Job '{job_id}' not found"}), 404
+    return jsonify({"status": "success", "job": job_to_dict(job)})
+
+
+@app.route('/api/ingest-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_ingest_job(job_id):
+    """Cancel a queued or running merge job; batches already committed are kept"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    job = ingest_jobs.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": f"Job '{job_id}' not found"}), 404
+    if job["finished_at"]:
+        return jsonify({"status": "error", "message": f"Job '{job_id}' already finished"}), 409
+
+    job["cancel_event"].set()
+    return jsonify({"status": "success", "message": f"Job '{job_id}' cancellation requested"})
+
+
+# 标准输出列，顺序与transactions表一致
+STANDARD_COLUMNS = [
+    "ID", "记账日期", "记账时间", "账户名", "账号", "开户行", "币种", "借贷",
+    "交易金额", "交易渠道", "网点名称", "附言", "余额", "对手账户名", "对手账号", "对手开户行"
+]
+
+# 可直接作为行号的列名
+ROW_NUMBER_CANDIDATES = ['row_number', 'rownum', 'row', '行号', '行']
+
+SQLITE_MAX_INT = 9223372036854775807
+
+
+target_type_cache = {}  # {目标列: 数据类型}，模板修改后清空
+target_type_cache_generation = None
+target_type_cache_lock = threading.Lock()
+
+
+def resolve_target_type(target_col):
+    """查找目标列的数据类型（取第一个包含该列的模板），默认为text；每个模板版本只查找一次"""
+    global target_type_cache_generation
+
+    with target_type_cache_lock:
+        if target_type_cache_generation != templates_generation:
+            target_type_cache.clear()
+            target_type_cache_generation = templates_generation
+        target_type = target_type_cache.get(target_col)
+        if target_type is None:
+            target_type = "text"
+            for template in list(templates.values()):
+                if target_col in template:
+                    target_type = template[target_col]["type"]
+                    break
+            target_type_cache[target_col] = target_type
+    return target_type
+
+
+def _convert_unique_values(uniques, target_type):
+    """
+    转换去重后的字符串值：数字和已探测到格式的日期时间走快速路径，其余交给convert_value
+    
+    Args:
+        uniques: 去除首尾空格后的非空字符串数组
+        target_type: 目标数据类型
+        
+    Returns:
+        (results, errors): 转换结果数组，以及 {下标: 错误原因} 字典
+    """
+    results = np.full(len(uniques), None, dtype=object)
+    errors = {}
+    slow_idx = range(len(uniques))
+
+    if target_type in ("int", "float"):
+        # 金融数字格式整列解析，只有无法识别的值才交给Babel
+        parsed, slow_idx = parse_number_values(uniques, target_type)
+        for i, number in enumerate(parsed):
+            if number is None:
+                continue
+            if target_type == "int" and abs(number) > SQLITE_MAX_INT:
+                log_row_event("big_int", "整数值 %s 太大，将以字符串形式存储", number)
+                number = str(number)
+            results[i] = number
+
+    elif target_type in ("date", "time"):
+        if target_type == "date":
+            # 与convert_value相同的预处理：带小数点的数值只取整数部分
+            prepared = []
+            for u in uniques:
+                int_part = u.split('.')[0]
+                prepared.append(int_part if '.' in u and int_part.isdigit() else u)
+            parsed = parse_date_values(prepared)
+        else:
+            parsed = parse_time_values(uniques)
+        for i, parsed_value in enumerate(parsed):
+            if parsed_value:
+                results[i] = parsed_value
+        # 解析失败的值交给convert_value生成错误信息
+        slow_idx = [i for i, parsed_value in enumerate(parsed) if not parsed_value]
+
+    for i in slow_idx:
+        try:
+            results[i] = convert_value(uniques[i], target_type)
+        except Exception as e:
+            errors[i] = str(e)
+
+    return results, errors
+
+
+def convert_column(values, target_type, keep_raw_string=False):
+    """
+    列式转换：一次转换整列值，结果与逐个调用convert_value完全一致
+    
+    convert_value的结果只取决于 str(value).strip()，因此每个不同的值只需转换一次。
+    
+    Args:
+        values: 列的numpy数组（元素与iterrows得到的行值一致）
+        target_type: 目标数据类型 ("int", "float", "date", "time", "text")
+        keep_raw_string: 为True时非空值直接保存为str(value)（用于ID字段）
+        
+    Returns:
+        (converted, has_data, errors): 转换后的object数组、
+        每行是否有非空值的布尔数组、{行位置: 错误原因} 字典
+    """
+    n = len(values)
+    converted = np.full(n, None, dtype=object)
+    has_data = np.zeros(n, dtype=bool)
+    errors = {}
+
+    present = np.flatnonzero(~pd.isna(values))
+    if present.size == 0:
+        return converted, has_data, errors
+
+    raw_strings = [str(v) for v in values[present]]
+    stripped = np.array([s.strip() for s in raw_strings], dtype=object)
+    non_empty = stripped != ''
+    has_data[present] = non_empty
+
+    if keep_raw_string:
+        converted[present] = raw_strings
+        return converted, has_data, errors
+
+    present = present[non_empty]
+    stripped = stripped[non_empty]
+    if present.size == 0:
+        return converted, has_data, errors
+
+    if target_type not in ("int", "float", "date", "time"):
+        converted[present] = stripped
+        return converted, has_data, errors
+
+    codes, uniques = pd.factorize(stripped)
+    unique_results, unique_errors = _convert_unique_values(np.asarray(uniques, dtype=object), target_type)
+    converted[present] = unique_results[codes]
+
+    if unique_errors:
+        failed = np.zeros(len(uniques), dtype=bool)
+        failed[list(unique_errors)] = True
+        for pos, code in zip(present[failed[codes]], codes[failed[codes]]):
+            errors[int(pos)] = unique_errors[code]
+
+    return converted, has_data, errors
+
+
+def _row_number_text(value):
+    """行号列的值可以作为行号时返回行号字符串，否则返回None；数值无法转换为整数时抛出异常"""
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        return str(int(float(value)))
+    return None
+
+
+def _resolve_row_numbers(df, values, start_row, candidate_columns):
+    """
+    计算每行的行号字符串，存在行号列时优先使用该列的值
+    
+    每行依次检查行号列，取第一个值为数字的列作为行号；值为空或不是数字时检查下一列，都没有时使用默认行号。
+    
+    Returns:
+        (row_numbers, row_errors): 行号字符串列表，以及 {行位置: 错误原因}（行号列的值无法转换）
+    """
+    row_numbers = [str(start_row + idx + 1) for idx in df.index]
+    row_errors = {}
+
+    candidates = [(col, df.columns.get_loc(col)) for col in candidate_columns if col in df.columns]
+    if not candidates:
+        return row_numbers, row_errors
+
+    undecided = np.ones(len(df), dtype=bool)
+    overridden = 0
+    for col, loc in candidates:
+        col_values = values[:, loc]
+        for pos in np.flatnonzero(undecided & ~pd.isna(col_values)):
+            try:
+                row_number = _row_number_text(col_values[pos])
+            except Exception as e:
+                undecided[pos] = False
+                row_errors[int(pos)] = str(e)
+                continue
+            if row_number is not None:
+                undecided[pos] = False
+                row_numbers[pos] = row_number
+                overridden += 1
+
+    if overridden:
+        logger.debug("使用行号列 %s 的值作为行号: %d 行", [col for col, _ in candidates], overridden)
+    return row_numbers, row_errors
+
+
+def resolve_file_mapping(column_mappings, file_path):
+    """查找文件的列映射：依次按完整路径、文件名、路径后缀匹配"""
+    file_name = os.path.basename(file_path)
+    file_mapping = column_mappings.get(file_path, {})
+    if not file_mapping and file_name in column_mappings:
+        file_mapping = column_mappings[file_name]
+    
+    # 如果还没有映射，尝试通过文件名查找
+    if not file_mapping:
+        for path in column_mappings:
+            if path.endswith(file_name):
+                file_mapping = column_mappings[path]
+                break
+    return file_mapping
+
+
+def compile_conversion_plan(file_path, column_mappings):
+    """
+    为一个文件编译转换计划，文件的所有块共用
+    
+    计划只包含可JSON序列化的值，可以直接传给工作进程。
+    
+    Returns:
+        dict: file_name、mapping（原始列 -> 目标列）、columns（每个映射列的目标类型和转换方式，
+        converter为"raw"时原样保存字符串）、output_columns、row_number_columns、
+        empty_row_rule（"drop"：映射列全部为空的行不导入）、fingerprint（映射和目标类型的指纹）
+    """
+    file_name = os.path.basename(file_path)
+    file_mapping = resolve_file_mapping(column_mappings, file_path)
+    logger.info("文件 %s 的列映射: %s", file_name, file_mapping)
+
+    output_columns = STANDARD_COLUMNS + ["source_file", "row_number"]
+    columns = []
+    for orig_col, target_col in file_mapping.items():
+        if not target_col:
+            continue
+        target_type = resolve_target_type(target_col)
+        columns.append({
+            "source": orig_col,
+            "target": target_col,
+            "type": target_type,
+            "converter": "raw" if target_col == "ID" else target_type
+        })
+        if target_col not in output_columns:
+            output_columns.append(target_col)
+
+    fingerprint_items = sorted((str(c["source"]), c["target"], c["type"]) for c in columns)
+    return {
+        "file_name": file_name,
+        "mapping": dict(file_mapping),
+        "columns": columns,
+        "output_columns": output_columns,
+        "row_number_columns": list(ROW_NUMBER_CANDIDATES),
+        "empty_row_rule": "drop",
+        "fingerprint": hashlib.sha256(json.dumps(fingerprint_items, ensure_ascii=False).encode('utf-8')).hexdigest()
+    }
+
+
+def compile_sheet_plans(file_path, sheet_names, column_mappings):
+    """
+    为工作簿中选中的工作表编译转换计划，与sheet_names一一对应
+
+    列映射中有单独条目（键为"文件名#工作表"）的工作表使用自己的计划；其余工作表共用按文件查找的映射
+    编译的同一个计划，只替换来源名称，并要求表头包含映射中的全部原始列（required_columns）。
+    sheet_names为[""]（只读取第一个工作表）时与compile_conversion_plan相同。
+    """
+    if sheet_names == [""]:
+        return [compile_conversion_plan(file_path, column_mappings)]
+
+    file_name = os.path.basename(file_path)
+    shared_plan = None
+    plans = []
+    for sheet_name in sheet_names:
+        source_name = sheet_source_name(file_name, sheet_name)
+        if column_mappings.get(source_name):
+            plan = compile_conversion_plan(source_name, {source_name: column_mappings[source_name]})
+        else:
+            if shared_plan is None:
+                shared_plan = compile_conversion_plan(file_path, column_mappings)
+                shared_plan["required_columns"] = [column["source"] for column in shared_plan["columns"]]
+            plan = dict(shared_plan, file_name=source_name)
+        plan["sheet_name"] = sheet_name
+        plans.append(plan)
+    return plans
+
+
+def process_dataframe_chunk(df, plan, start_row):
+    """按转换计划处理数据框的一个块，返回映射数据、被拒绝的行和进入映射数据的行位置"""
+    mapped_data = []
+    rejected_rows = []
+    file_name = plan["file_name"]
+
+    if len(df) == 0:
+        return {"mapped_data": mapped_data, "rejected_rows": rejected_rows, "accepted_positions": np.array([], dtype=int)}
+
+    # 与iterrows相同的按行取值方式，保证值的类型与逐行处理时一致
+    values = df.values
+    if values.dtype.kind in "mM":
+        values = df.astype(object).values
+    row_count = len(df)
+    row_numbers, row_errors = _resolve_row_numbers(df, values, start_row, plan["row_number_columns"])
+
+    # 逐列转换
+    column_values = {}
+    has_data = np.zeros(row_count, dtype=bool)
+    cell_errors = []  # [(原始列, 目标列, 原始值数组, {行位置: 错误原因})]
+
+    for column in plan["columns"]:
+        orig_col, target_col = column["source"], column["target"]
+        if orig_col not in df.columns:
+            continue
+
+        col_values = values[:, df.columns.get_loc(orig_col)]
+        with time_stage("convert_column", row_count, type=column["type"]):
+            converted, col_has_data, errors = convert_column(
+                col_values, column["type"], keep_raw_string=(column["converter"] == "raw")
+            )
+        has_data |= col_has_data
+        column_values[target_col] = converted
+        if errors:
+            cell_errors.append((orig_col, target_col, col_values, errors))
+
+    # 标准列之外的目标列只在块中存在对应原始列时输出
+    base_columns = set(STANDARD_COLUMNS + ["source_file", "row_number"])
+    output_columns = [col for col in plan["output_columns"] if col in base_columns or col in column_values]
+
+    # 整行错误（行号列无法转换）的行不参与列转换
+    error_rows = set(row_errors)
+    for _, _, _, errors in cell_errors:
+        error_rows.update(errors)
+
+    raw_rows = {}
+    raw_columns = json.dumps([str(col) for col in df.columns], ensure_ascii=False) if error_rows else None
+
+    def raw_data(pos):
+        # 被拒绝行的原始值只编码一次，同一行的所有单元格错误共用
+        if pos not in raw_rows:
+            raw_rows[pos] = encode_raw_values(values[pos])
+        return raw_rows[pos]
+
+    for pos in sorted(error_rows):
+        if pos in row_errors:
+            rejected_rows.append({
+                "source_file": file_name,
+                "row_number": str(start_row + df.index[pos] + 1),
+                "column_name": "整行错误",
+                "target_column": "",
+                "original_value": "整行处理失败",
+                "raw_columns": raw_columns,
+                "raw_data": raw_data(pos),
+                "reason": row_errors[pos]
+            })
+            continue
+
+        for orig_col, target_col, col_values, errors in cell_errors:
+            if pos not in errors:
+                continue
+            value = col_values[pos]
+            log_row_event("conversion", "转换错误 行 %s, 列 %s: %s", row_numbers[pos], orig_col, errors[pos])
+            rejected_rows.append({
+                "source_file": file_name,
+                "row_number": row_numbers[pos],
+                "column_name": orig_col,
+                "target_column": target_col,
+                "original_value": str(value) if pd.notna(value) else "null",
+                "raw_columns": raw_columns,
+                "raw_data": raw_data(pos),
+                "reason": errors[pos]
+            })
+
+    # 有数据且没有转换错误的行进入映射数据
+    accepted = has_data.copy() if plan["empty_row_rule"] == "drop" else np.ones(row_count, dtype=bool)
+    if error_rows:
+        accepted[list(error_rows)] = False
+    accepted_pos = np.flatnonzero(accepted)
+
+    if accepted_pos.size:
+        empty = [None] * accepted_pos.size
+        file_names = [file_name] * accepted_pos.size
+        columns_data = []
+        for col in output_columns:
+            if col == "source_file":
+                columns_data.append(file_names)
+            elif col == "row_number":
+                columns_data.append([row_numbers[pos] for pos in accepted_pos])
+            elif col in column_values:
+                columns_data.append(column_values[col][accepted_pos].tolist())
+            else:
+                columns_data.append(empty)
+        mapped_data = [dict(zip(output_columns, row)) for row in zip(*columns_data)]
+    
+    if rejected_rows:
+        log_row_event("rejected_sample", "示例被拒绝行: %s", rejected_rows[0])
+    
+    return {"mapped_data": mapped_data, "rejected_rows": rejected_rows, "accepted_positions": accepted_pos}
+
+
+# 被拒绝行存储
+# 每个被拒绝的源数据行在rejected_raw_rows中只保存一份原始值（JSON数组，压缩后更小时用zlib压缩），
+# 列名按表头去重保存在rejected_headers中；每个单元格错误是rejected_cells中指向原始行的一条记录。
+# 文件中的行号列可能重复，原始行不按 (source_file, row_number) 去重。
+# rejected_rows视图按旧表的列展开单元格错误（不含raw_data），供计数等简单查询使用。
+#---------------------------------
+REJECTED_CELL_FIELDS = ["column_name", "target_column", "original_value", "reason"]
+RAW_DATA_COMPRESS_LEVEL = 6
+
+
+def _json_safe_value(value):
+    """转为严格JSON可表示的值：NaN和NaT为null，无穷大为字符串，其余非基本类型转为字符串"""
+    if value is None:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value in (float("inf"), float("-inf")):
+            return "Infinity" if value > 0 else "-Infinity"
+        return value
+    if isinstance(value, (str, int)):
+        return value
+    if value is pd.NaT:
+        return None
+    return str(value)
+
+
+def encode_raw_values(values):
+    """将一行原始值编码为JSON数组，压缩后更小时使用zlib压缩"""
+    text = json.dumps([_json_safe_value(v) for v in values], ensure_ascii=False,
+                      allow_nan=False, separators=(",", ":")).encode("utf-8")
+    compressed = zlib.compress(text, RAW_DATA_COMPRESS_LEVEL)
+    return compressed if len(compressed) < len(text) else text
+
+
+def decode_raw_row(columns_json, raw_data):
+    """按表头还原原始行字典，无法解码时返回说明错误的字典"""
+    if raw_data is None:
+        return None
+    try:
+        # 未压缩的值以JSON数组的"["开头，zlib数据不会以此开头
+        if raw_data[:1] != b"[":
+            raw_data = zlib.decompress(raw_data)
+        values = json.loads(raw_data.decode("utf-8"))
+        columns = json.loads(columns_json) if columns_json else [str(i) for i in range(len(values))]
+        return dict(zip(columns, values))
+    except (zlib.error, ValueError, TypeError) as e:
+        return {"错误": f"原始数据无法解析: {str(e)}"}
+
+
+def _encode_raw_dict(raw):
+    """旧格式的原始行（字典或JSON字符串）转为 (表头JSON, 压缩值)"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raw = {"原始数据": raw}
+    if not isinstance(raw, dict):
+        raw = {}
+    return json.dumps([str(k) for k in raw], ensure_ascii=False), encode_raw_values(list(raw.values()))
+
+
+def ensure_rejected_storage(cursor):
+    """创建被拒绝行的表和视图（索引随DEFAULT_INDEXES建立）；旧版每个单元格一行的rejected_rows表迁移到新结构"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rejected_headers (
+        id INTEGER PRIMARY KEY,
+        columns TEXT UNIQUE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rejected_raw_rows (
+        id INTEGER PRIMARY KEY,
+        source_file TEXT,
+        row_number TEXT,
+        header_id INTEGER REFERENCES rejected_headers(id),
+        raw_data BLOB
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rejected_cells (
+        id INTEGER PRIMARY KEY,
+        raw_row_id INTEGER REFERENCES rejected_raw_rows(id),
+        column_name TEXT,
+        target_column TEXT,
+        original_value TEXT,
+        reason TEXT
+    )
+    """)
+
+    legacy = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'rejected_rows'").fetchone()
+    if legacy and legacy[0] == "table":
+        _migrate_legacy_rejected_rows(cursor)
+
+    cursor.execute("""
+    CREATE VIEW IF NOT EXISTS rejected_rows AS
+    SELECT c.id, r.source_file, r.row_number, c.column_name, c.target_column, c.original_value, c.reason,
+           c.raw_row_id
+    FROM rejected_cells c JOIN rejected_raw_rows r ON r.id = c.raw_row_id
+    """)
+
+
+def prepare_rejected_storage(db_path):
+    """只读检查被拒绝行的存储结构，需要建表或迁移旧版表时才借用写连接"""
+    conn = get_connection(db_path)
+    try:
+        objects = dict(conn.execute(
+            "SELECT name, type FROM sqlite_master "
+            "WHERE name IN ('rejected_headers', 'rejected_raw_rows', 'rejected_cells', 'rejected_rows')"
+        ).fetchall())
+    finally:
+        conn.close()
+    if len(objects) == 4 and objects["rejected_rows"] == "view":
+        return
+
+    conn = get_connection(db_path, write=True)
+    try:
+        ensure_rejected_storage(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _migrate_legacy_rejected_rows(cursor):
+    """把旧版rejected_rows表（每个单元格错误保存一份完整原始行JSON）迁移到新结构后删除"""
+    started = time.perf_counter()
+    migrated = 0
+    raw_row_ids = {}  # 跨批次去重，同一原始行的单元格错误可能被分到相邻的两批
+    legacy_cursor = cursor.connection.cursor()
+    legacy_cursor.execute(
+        "SELECT source_file, row_number, column_name, target_column, original_value, raw_data, reason "
+        "FROM rejected_rows ORDER BY id"
+    )
+    while True:
+        rows = legacy_cursor.fetchmany(5000)
+        if not rows:
+            break
+        batch = []
+        for source_file, row_number, column_name, target_column, original_value, raw_data, reason in rows:
+            raw_columns, encoded = _encode_raw_dict(raw_data)
+            batch.append({
+                "source_file": source_file,
+                "row_number": row_number,
+                "column_name": column_name,
+                "target_column": target_column,
+                "original_value": original_value,
+                "raw_columns": raw_columns,
+                "raw_data": encoded,
+                "reason": reason
+            })
+        migrated += store_rejected_rows(cursor, batch, raw_row_ids)
+    cursor.execute("DROP TABLE rejected_rows")
+    # 旧表的索引随表删除，迁移后的数据不会再经过合并流程建立索引
+    for table, columns in DEFAULT_INDEXES:
+        if table.startswith("rejected_"):
+            column_sql = ", ".join(f'"{column}"' for column in columns)
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "{index_name(table, columns)}" ON "{table}" ({column_sql})')
+    logger.info("已迁移旧版被拒绝行 %d 条，耗时 %.2f 秒", migrated, time.perf_counter() - started)
+
+
+def store_rejected_rows(cursor, rejected_rows, raw_row_ids=None):
+    """
+    写入一批被拒绝的单元格
+
+    同一源数据行的多个单元格错误只写入一份原始值，每个单元格错误写入一条rejected_cells记录。
+    行字典的raw_columns为表头JSON、raw_data为encode_raw_values的结果；旧格式（字典或JSON字符串）会被转换。
+
+    Args:
+        raw_row_ids: 可选，多批共用的 (source_file, row_number, raw_columns, raw_data) -> rejected_raw_rows.id，
+            同一原始行的单元格错误分在不同批次时也只写入一份原始值
+
+    Returns:
+        int: 写入的单元格错误数
+    """
+    header_ids = {}
+    if raw_row_ids is None:
+        raw_row_ids = {}
+    cells = []
+    for row in rejected_rows:
+        raw_columns, raw_data = row.get("raw_columns"), row.get("raw_data")
+        if not isinstance(raw_data, bytes):
+            raw_columns, raw_data = _encode_raw_dict(raw_data)
+        source_file = str(row.get("source_file") or "")
+        row_number = str(row.get("row_number") or "")
+        key = (source_file, row_number, raw_columns, raw_data)
+        raw_row_id = raw_row_ids.get(key)
+        if raw_row_id is None:
+            header_id = header_ids.get(raw_columns)
+            if header_id is None:
+                cursor.execute("INSERT OR IGNORE INTO rejected_headers (columns) VALUES (?)", (raw_columns,))
+                header_id = cursor.execute("SELECT id FROM rejected_headers WHERE columns = ?", (raw_columns,)).fetchone()[0]
+                header_ids[raw_columns] = header_id
+            cursor.execute(
+                "INSERT INTO rejected_raw_rows (source_file, row_number, header_id, raw_data) VALUES (?, ?, ?, ?)",
+                (source_file, row_number, header_id, raw_data)
+            )
+            raw_row_id = raw_row_ids[key] = cursor.lastrowid
+        # 没有值的字段用空字符串代替
+        cells.append([raw_row_id] + [str(row[f]) if row.get(f) is not None else "" for f in REJECTED_CELL_FIELDS])
+
+    cursor.executemany(
+        f"INSERT INTO rejected_cells (raw_row_id, {', '.join(REJECTED_CELL_FIELDS)}) "
+        f"VALUES (?, {', '.join(['?'] * len(REJECTED_CELL_FIELDS))})",
+        cells
+    )
+    adjust_rejected_count(cursor, len(cells))
+    return len(cells)
+
+
+REJECTED_ROW_QUERY = """
+SELECT c.id, r.source_file, r.row_number, c.column_name, c.target_column, c.original_value, c.reason,
+       c.raw_row_id, h.columns, r.raw_data
+FROM rejected_cells c
+JOIN rejected_raw_rows r ON r.id = c.raw_row_id
+LEFT JOIN rejected_headers h ON h.id = r.header_id
+"""
+
+
+def fetch_rejected_rows(cursor, where_sql="", params=(), limit=None, offset=0):
+    """
+    按旧版rejected_rows的结构读取单元格错误，raw_data还原为字典（同一原始行只解码一次）
+
+    Returns:
+        list[dict]: id、source_file、row_number、column_name、target_column、original_value、reason、
+        raw_row_id、raw_data
+    """
+    query = REJECTED_ROW_QUERY
+    if where_sql:
+        query += f" WHERE {where_sql}"
+    query += " ORDER BY c.id"
+    params = list(params)
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+
+    decoded = {}
+    results = []
+    for row in cursor.execute(query, params).fetchall():
+        row_id, source_file, row_number, column_name, target_column, original_value, reason, raw_row_id, columns, raw_data = row
+        if raw_row_id not in decoded:
+            decoded[raw_row_id] = decode_raw_row(columns, raw_data)
+        results.append({
+            "id": row_id,
+            "source_file": source_file,
+            "row_number": row_number,
+            "column_name": column_name,
+            "target_column": target_column,
+            "original_value": original_value,
+            "reason": reason,
+            "raw_row_id": raw_row_id,
+            "raw_data": decoded[raw_row_id]
+        })
+    return results
+
+
+def delete_rejected_cells(cursor, cell_ids):
+    """删除单元格错误，原始行不再被任何单元格错误引用时一并删除，返回删除的单元格数"""
+    cell_ids = [int(i) for i in cell_ids]
+    deleted = 0
+    for start in range(0, len(cell_ids), 500):
+        chunk = cell_ids[start:start + 500]
+        placeholders = ", ".join(["?"] * len(chunk))
+        raw_row_ids = [r[0] for r in cursor.execute(
+            f"SELECT DISTINCT raw_row_id FROM rejected_cells WHERE id IN ({placeholders})", chunk
+        ).fetchall()]
+        cursor.execute(f"DELETE FROM rejected_cells WHERE id IN ({placeholders})", chunk)
+        deleted += cursor.rowcount
+        if raw_row_ids:
+            raw_placeholders = ", ".join(["?"] * len(raw_row_ids))
+            cursor.execute(
+                f"DELETE FROM rejected_raw_rows WHERE id IN ({raw_placeholders}) "
+                f"AND NOT EXISTS (SELECT 1 FROM rejected_cells c WHERE c.raw_row_id = rejected_raw_rows.id)",
+                raw_row_ids
+            )
+    adjust_rejected_count(cursor, -deleted)
+    return deleted
+#---------------------------------
+
+
+
+def _safe_db_value(value):
+    """将SQLite无法直接存储的值（超大整数、NaN、无穷大）转换为字符串"""
+    import math
+
+    if isinstance(value, int) and abs(value) > SQLITE_MAX_INT:
+        return str(value)
+    if isinstance(value, float) and (abs(value) > SQLITE_MAX_INT or math.isnan(value) or math.isinf(value)):
+        return str(value)
+    return value
+
+
+def _insert_row_with_retry(cursor, insert_query, values):
+    """
+    逐行插入（批量插入失败时的回退路径），依次尝试安全类型和全字符串值
+
+    Returns:
+        插入的行数（0表示ID已存在被跳过）；所有尝试都失败时返回None
+    """
+    try:
+        cursor.execute(insert_query, values)
+        return cursor.rowcount
+    except (sqlite3.Error, OverflowError) as sql_error:
+        log_row_event("insert_retry", "SQL错误(插入数据): %s, 问题数据值: %s", sql_error, values)
+
+    try:
+        cursor.execute(insert_query, [_safe_db_value(v) for v in values])
+        log_row_event("insert_retry", "使用安全类型值重试成功")
+        return cursor.rowcount
+    except (sqlite3.Error, OverflowError) as retry_error:
+        log_row_event("insert_retry", "使用安全类型重试仍然失败: %s", retry_error)
+
+    # 最后的尝试：将所有值转换为字符串
+    try:
+        cursor.execute(insert_query, [str(v) if v is not None else None for v in values])
+        log_row_event("insert_retry", "使用全字符串类型重试成功")
+        return cursor.rowcount
+    except sqlite3.Error as final_error:
+        logger.warning("所有尝试都失败，跳过此行: %s", final_error)
+        return None
+
+
+def _executemany_batch(cursor, insert_query, batch):
+    """
+    在保存点内批量执行插入，返回 (实际插入的行数, 写入失败的行数)
+    
+    批量插入失败时回滚到保存点，再逐行插入，避免部分已插入的行被重复写入。
+    """
+    failed = 0
+    cursor.execute("SAVEPOINT bulk_insert")
+    try:
+        cursor.executemany(insert_query, batch)
+        inserted = cursor.rowcount
+    except (sqlite3.Error, OverflowError) as bulk_error:
+        cursor.execute("ROLLBACK TO SAVEPOINT bulk_insert")
+        logger.warning("批量插入失败，改为逐行插入 %d 行: %s", len(batch), bulk_error)
+        inserted = 0
+        for values in batch:
+            row_inserted = _insert_row_with_retry(cursor, insert_query, values)
+            if row_inserted is None:
+                failed += 1
+            else:
+                inserted += row_inserted
+    cursor.execute("RELEASE SAVEPOINT bulk_insert")
+    return inserted, failed
+
+
+def insert_data_to_db(conn, cursor, mapped_data, rejected_rows):
+    """
+    将映射数据和被拒绝的行批量插入数据库
+    
+    每批数据只确定一次列顺序，以元组形式通过executemany写入。
+    
+    Returns:
+        dict: inserted（插入的映射行数）、duplicates（因ID已存在被跳过的行数）、
+        failed（逐行重试仍无法写入的行数）、rejected_inserted（插入的被拒绝行数）
+    """
+    result = {"inserted": 0, "duplicates": 0, "failed": 0, "rejected_inserted": 0}
+    
+    try:
+        # 插入映射数据：按列集合相同的连续行分组，每组固定一次列顺序
+        start = 0
+        while start < len(mapped_data):
+            columns = list(mapped_data[start].keys())
+            end = start + 1
+            while end < len(mapped_data) and len(mapped_data[end]) == len(columns) and list(mapped_data[end].keys()) == columns:
+                end += 1
+            
+            id_pos = columns.index("ID") if "ID" in columns else None
+            row_number_pos = columns.index("row_number") if "row_number" in columns else None
+            batch = []
+            for row in mapped_data[start:end]:
+                values = list(row.values())
+                # 确保ID和row_number字段是字符串类型
+                if id_pos is not None and values[id_pos] is not None:
+                    values[id_pos] = str(values[id_pos])
+                if row_number_pos is not None and values[row_number_pos] is not None:
+                    values[row_number_pos] = str(values[row_number_pos])
+                batch.append(values)
+            
+            # 使用INSERT OR IGNORE语法，跳过违反唯一约束（ID已存在）的行
+            placeholders = ", ".join(["?" for _ in columns])
+            insert_query = f"INSERT OR IGNORE INTO transactions ({', '.join(columns)}) VALUES ({placeholders})"
+            inserted, failed = _executemany_batch(cursor, insert_query, batch)
+            result["inserted"] += inserted
+            result["failed"] += failed
+            result["duplicates"] += len(batch) - inserted - failed
+            start = end
+
+        if result["duplicates"]:
+            logger.debug("%d 条记录的ID已存在，已跳过", result["duplicates"])
+        if result["failed"]:
+            logger.warning("%d 条记录无法写入，已跳过", result["failed"])
+
+        # 插入被拒绝的行 - 直接使用当前连接，而不是创建新连接
+        if rejected_rows:
+            logger.debug("正在插入 %d 条被拒绝的行", len(rejected_rows))
+            result["rejected_inserted"] = store_rejected_rows(cursor, rejected_rows)
+            
+            # 主连接提交
+            try:
+                conn.commit()
+            except sqlite3.Error as commit_error:
+                logger.error("提交被拒绝行时发生错误: %s", commit_error)
+                
+    except Exception as e:
+        logger.exception("插入数据错误: %s", e)
+
+    return result
+        
+# 查询分页与计数缓存
+#---------------------------------
+QUERY_CACHE_SIZE = 256  # 计数缓存和页游标缓存的最大条目数
+COUNT_ESTIMATE_SAMPLE_ROWS = 10000  # 估算计数时抽样的行数
+COUNT_MODES = ("exact", "estimate", "none")
+
+query_cache_lock = threading.Lock()
+query_count_cache = OrderedDict()
+query_page_cursors = OrderedDict()
+query_cache_generations = {}
+pending_count_jobs = {}
+count_executor = None
+
+
+def build_filter_clause(filters, fts_columns=()):
+    """
+    根据前端过滤条件生成WHERE子句
+    
+    Args:
+        fts_columns: 已建立全文索引的列，这些列上的contains/startswith/endswith条件改为查询全文索引
+    
+    Returns:
+        (where_sql, params): 不含WHERE关键字的条件（无条件时为空字符串）和参数列表
+    """
+    like_patterns = {'contains': "%{}%", 'startswith': "{}%", 'endswith': "%{}"}
+    filter_conditions = []
+    params = []
+    for f in filters or []:
+        column = f.get('column')
+        operator = f.get('operator', '=')
+        value = f.get('value')
+
+        if column:
+            if operator == 'not_null':
+                filter_conditions.append(f"{column} IS NOT NULL AND {column} != ''")
+            elif operator in like_patterns:
+                pattern = like_patterns[operator].format(value)
+                if column in fts_columns and can_use_fts(value):
+                    filter_conditions.append(f"rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {column} LIKE ?)")
+                else:
+                    filter_conditions.append(f"{column} LIKE ?")
+                params.append(pattern)
+            else:
+                filter_conditions.append(f"{column} {operator} ?")
+                params.append(value)
+
+    return " AND ".join(f"({c})" for c in filter_conditions), params
+
+
+def _database_signature(db_path):
+    """
+    数据库版本标识：文件（含WAL文件）的修改时间和大小，加上本进程内的失效计数
+    
+    数据库被修改后标识随之变化，旧的缓存条目不再命中。
+    """
+    db_path = os.path.abspath(db_path)
+    signature = [query_cache_generations.get(db_path, 0)]
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature.extend([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            signature.extend([None, None])
+    return tuple(signature)
+
+
+def invalidate_query_cache(db_path):
+    """数据库被本进程修改后调用，清除该数据库的计数和页游标缓存"""
+    db_path = os.path.abspath(db_path)
+    with query_cache_lock:
+        query_cache_generations[db_path] = query_cache_generations.get(db_path, 0) + 1
+        for cache in (query_count_cache, query_page_cursors):
+            for key in [k for k in cache if k[0] == db_path]:
+                del cache[key]
+
+
+def _cache_get(cache, key):
+    with query_cache_lock:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+
+def _cache_put(cache, key, value):
+    with query_cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > QUERY_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def _count_cache_key(db_path, filters):
+    """计数缓存键：(数据库路径, 数据库版本, 过滤条件)"""
+    return (
+        os.path.abspath(db_path),
+        _database_signature(db_path),
+        json.dumps(filters or [], sort_keys=True, ensure_ascii=False, default=str)
+    )
+
+
+def count_rows(cursor, where_sql, params):
+    """精确计数"""
+    query = "SELECT COUNT(*) FROM transactions"
+    if where_sql:
+        query += f" WHERE {where_sql}"
+    cursor.execute(query, params)
+    return cursor.fetchone()[0]
+
+
+def estimate_rows(cursor, where_sql, params):
+    """
+    快速估算计数：以最大rowid作为总行数，有过滤条件时按前COUNT_ESTIMATE_SAMPLE_ROWS行的命中比例推算
+    
+    Returns:
+        (count, exact): 估算值，以及抽样是否已覆盖全表（此时为精确值）
+    """
+    cursor.execute("SELECT MAX(rowid) FROM transactions")
+    max_rowid = cursor.fetchone()[0] or 0
+    if max_rowid <= COUNT_ESTIMATE_SAMPLE_ROWS:
+        return count_rows(cursor, where_sql, params), True
+    if not where_sql:
+        return max_rowid, False
+
+    cursor.execute(
+        f"SELECT COUNT(*) FROM (SELECT rowid, * FROM transactions ORDER BY rowid LIMIT ?) WHERE {where_sql}",
+        [COUNT_ESTIMATE_SAMPLE_ROWS] + list(params)
+    )
+    matched = cursor.fetchone()[0]
+    return int(round(matched / COUNT_ESTIMATE_SAMPLE_ROWS * max_rowid)), False
+
+
+def _count_in_background(db_path, cache_key, where_sql, params):
+    """后台线程中计算精确计数并写入缓存"""
+    try:
+        conn = get_connection(db_path)
+        try:
+            total = count_rows(conn.cursor(), where_sql, params)
+        finally:
+            conn.close()
+        # 计数期间数据库被修改时丢弃结果
+        if _database_signature(db_path) == cache_key[1]:
+            _cache_put(query_count_cache, cache_key, total)
+    except Exception as e:
+        logger.error("后台计数失败: %s", e)
+    finally:
+        with query_cache_lock:
+            pending_count_jobs.pop(cache_key, None)
+
+
+def schedule_exact_count(db_path, cache_key, where_sql, params):
+    """提交后台精确计数（同一查询只提交一次）"""
+    global count_executor
+
+    with query_cache_lock:
+        if cache_key in pending_count_jobs:
+            return
+        if count_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            count_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-count")
+        pending_count_jobs[cache_key] = count_executor.submit(
+            _count_in_background, db_path, cache_key, where_sql, params
+        )
+
+
+def get_total_count(cursor, db_path, filters, where_sql, params, count_mode="exact"):
+    """
+    获取查询总行数，优先使用缓存
+    
+    Args:
+        count_mode: "exact" 同步计算精确值；"estimate" 立即返回估算值，精确值在后台计算，
+                    下次相同查询时返回；"none" 不计数
+    
+    Returns:
+        (total_count, exact): 总行数（不计数时为None），以及是否为精确值
+    """
+    if count_mode == "none":
+        return None, False
+
+    cache_key = _count_cache_key(db_path, filters)
+    cached = _cache_get(query_count_cache, cache_key)
+    if cached is not None:
+        return cached, True
+
+    if count_mode == "estimate":
+        total, exact = estimate_rows(cursor, where_sql, params)
+        if exact:
+            _cache_put(query_count_cache, cache_key, total)
+        else:
+            schedule_exact_count(db_path, cache_key, where_sql, params)
+        return total, exact
+
+    total = count_rows(cursor, where_sql, params)
+    _cache_put(query_count_cache, cache_key, total)
+    return total, True
+
+
+def encode_cursor(sort_value, rowid):
+    """将一页最后一行的 (排序列值, rowid) 编码为游标字符串"""
+    raw = json.dumps([sort_value, rowid], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor_text):
+    """解码游标，格式无效时抛出ValueError"""
+    try:
+        sort_value, rowid = json.loads(base64.urlsafe_b64decode(cursor_text.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor_text}")
+    if not isinstance(rowid, int):
+        raise ValueError(f"无效的分页游标: {cursor_text}")
+    return sort_value, rowid
+
+
+def build_keyset_clause(sort_by, descending, cursor_value):
+    """
+    生成“位于游标之后”的条件，排序键为 (sort_by, rowid)
+    
+    SQLite升序时NULL排在最前，降序时排在最后。
+    
+    Returns:
+        (condition_sql, params)
+    """
+    sort_value, rowid = cursor_value
+    op = "<" if descending else ">"
+    if not sort_by:
+        return f"rowid {op} ?", [rowid]
+
+    if sort_value is None:
+        if descending:
+            return f"({sort_by} IS NULL AND rowid < ?)", [rowid]
+        return f"(({sort_by} IS NULL AND rowid > ?) OR {sort_by} IS NOT NULL)", [rowid]
+
+    condition = f"({sort_by} {op} ? OR ({sort_by} = ? AND rowid {op} ?)"
+    if descending:
+        condition += f" OR {sort_by} IS NULL"
+    return condition + ")", [sort_value, sort_value, rowid]
+
+
+def fetch_keyset_page(cursor, where_sql, params, sort_by, descending, page_size,
+                      cursor_value=None, offset=0):
+    """
+    按 (sort_by, rowid) 键集分页读取一页
+    
+    Args:
+        cursor_value: 上一页最后一行的 (排序列值, rowid)，为None时从头开始
+        offset: 在游标之后再跳过的行数（仅在没有对应页游标时使用）
+    
+    Returns:
+        (rows, next_cursor_value): 行列表，以及本页最后一行的键（没有更多数据时为None）
+    """
+    conditions = [where_sql] if where_sql else []
+    query_params = list(params)
+    if cursor_value is not None:
+        keyset_sql, keyset_params = build_keyset_clause(sort_by, descending, cursor_value)
+        conditions.append(keyset_sql)
+        query_params.extend(keyset_params)
+
+    direction = "DESC" if descending else "ASC"
+    sort_key_sql = f"{sort_by} AS __sort_key, " if sort_by else ""
+    query = f"SELECT {sort_key_sql}rowid AS __rowid, * FROM transactions"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if sort_by:
+        query += f" ORDER BY {sort_by} {direction}, rowid {direction}"
+    else:
+        query += f" ORDER BY rowid {direction}"
+    # 多取一行用于判断是否还有下一页
+    query += f" LIMIT {int(page_size) + 1} OFFSET {int(offset)}"
+
+    cursor.execute(query, query_params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor_value = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor_value = (last["__sort_key"] if sort_by else None, last["__rowid"])
+    return rows, next_cursor_value
+
+
+def _page_cursor_key(db_path, filters, sort_by, descending, page_size):
+    return _count_cache_key(db_path, filters) + (sort_by, descending, page_size)
+
+
+def find_page_start(page_cursor_key, page, page_size):
+    """
+    查找离目标页最近的已知页起点
+    
+    Returns:
+        (cursor_value, offset): 起点游标（None表示从头开始）和还需跳过的行数
+    """
+    pages = _cache_get(query_page_cursors, page_cursor_key) or {}
+    known = [p for p in pages if p <= page]
+    if not known:
+        return None, (page - 1) * page_size
+    start_page = max(known)
+    return pages[start_page], (page - start_page) * page_size
+
+
+def remember_page_cursor(page_cursor_key, page, cursor_value):
+    """记录第page页的起点游标（即上一页最后一行的键）"""
+    with query_cache_lock:
+        pages = query_page_cursors.get(page_cursor_key)
+    pages = dict(pages or {})
+    pages[page] = cursor_value
+    _cache_put(query_page_cursors, page_cursor_key, pages)
+#---------------------------------
+
+
+# 索引管理
+#---------------------------------
+# 合并完成后创建的默认索引: (表名, 列)
+DEFAULT_INDEXES = [
+    ("transactions", ("记账日期",)),
+    ("transactions", ("账号",)),
+    ("transactions", ("对手账号",)),
+    ("transactions", ("source_file", "row_number")),
+    ("rejected_raw_rows", ("source_file", "row_number")),
+    ("rejected_cells", ("raw_row_id",))
+]
+INDEX_SUGGEST_MIN_USES = 3  # 过滤或排序列被使用多少次后建议建立索引
+
+column_usage_lock = threading.Lock()
+column_usage = {}  # {数据库路径: {列名: {"filter": 次数, "sort": 次数}}}
+
+
+def index_name(table, columns):
+    """索引命名规则: idx_表名_列1_列2"""
+    return "idx_" + "_".join([table] + list(columns))
+
+
+def list_indexes(cursor, table):
+    """
+    列出表上的索引（不含主键等自动索引）
+    
+    Returns:
+        list: [{"name", "table", "columns"}]
+    """
+    indexes = []
+    for row in cursor.execute(f'PRAGMA index_list("{table}")').fetchall():
+        name = row[1]
+        if name.startswith("sqlite_autoindex"):
+            continue
+        columns = [info[2] for info in cursor.execute(f'PRAGMA index_info("{name}")').fetchall()]
+        indexes.append({"name": name, "table": table, "columns": columns})
+    return indexes
+
+
+def _table_columns(cursor, table):
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")').fetchall()]
+
+
+def create_index(conn, table, columns):
+    """
+    创建索引（已存在时跳过），返回索引名称、是否新建和耗时
+    
+    列名必须是表中存在的列，否则抛出ValueError。
+    """
+    cursor = conn.cursor()
+    table_columns = _table_columns(cursor, table)
+    for column in columns:
+        if column not in table_columns:
+            raise ValueError(f"表 {table} 中不存在列 {column}")
+
+    name = index_name(table, columns)
+    existing = {index["name"] for index in list_indexes(cursor, table)}
+    if name in existing:
+        return {"name": name, "table": table, "columns": list(columns), "created": False, "build_seconds": 0}
+
+    start_time = time.time()
+    column_sql = ", ".join(f'"{column}"' for column in columns)
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({column_sql})')
+    conn.commit()
+    build_seconds = round(time.time() - start_time, 3)
+    logger.info("创建索引 %s 耗时 %s 秒", name, build_seconds)
+    return {"name": name, "table": table, "columns": list(columns), "created": True, "build_seconds": build_seconds}
+
+
+def ensure_default_indexes(conn):
+    """
+    合并完成后创建默认索引并更新查询优化器统计信息
+    
+    索引在全部数据写入后一次性建立，比写入过程中逐行维护索引快得多。
+    
+    Returns:
+        list: 每个索引的创建结果
+    """
+    results = []
+    for table, columns in DEFAULT_INDEXES:
+        try:
+            results.append(create_index(conn, table, columns))
+        except (sqlite3.Error, ValueError) as e:
+            logger.error("创建索引失败 %s%s: %s", table, columns, e)
+            results.append({"name": index_name(table, columns), "table": table, "columns": list(columns),
+                             "created": False, "error": str(e)})
+    if any(r.get("created") for r in results):
+        conn.execute("PRAGMA optimize")
+    return results
+
+
+def record_column_usage(db_path, filters=None, sort_by=None):
+    """记录查询中使用的过滤列和排序列，用于建议索引"""
+    db_path = os.path.abspath(db_path)
+    with column_usage_lock:
+        usage = column_usage.setdefault(db_path, {})
+        for f in filters or []:
+            column = f.get('column')
+            if column:
+                usage.setdefault(column, {"filter": 0, "sort": 0})["filter"] += 1
+        if sort_by:
+            usage.setdefault(sort_by, {"filter": 0, "sort": 0})["sort"] += 1
+
+
+def suggest_indexes(cursor, db_path, min_uses=INDEX_SUGGEST_MIN_USES):
+    """
+    根据记录的列使用情况建议索引：使用次数达到min_uses且还没有以该列开头的索引
+    
+    Returns:
+        list: [{"table", "columns", "name", "filter_uses", "sort_uses"}]，按使用次数降序
+    """
+    with column_usage_lock:
+        usage = {column: dict(counts) for column, counts in column_usage.get(os.path.abspath(db_path), {}).items()}
+
+    table_columns = _table_columns(cursor, "transactions")
+    indexed = {index["columns"][0] for index in list_indexes(cursor, "transactions") if index["columns"]}
+    indexed.add("ID")  # 主键已有索引
+
+    suggestions = []
+    for column, counts in usage.items():
+        uses = counts["filter"] + counts["sort"]
+        if uses < min_uses or column in indexed or column not in table_columns:
+            continue
+        suggestions.append({
+            "table": "transactions",
+            "columns": [column],
+            "name": index_name("transactions", [column]),
+            "filter_uses": counts["filter"],
+            "sort_uses": counts["sort"]
+        })
+    suggestions.sort(key=lambda s: s["filter_uses"] + s["sort_uses"], reverse=True)
+    return suggestions
+#---------------------------------
+
+
+# 全文索引
+#---------------------------------
+# 使用FTS5的trigram分词器：按三字符切分，对中文无需分词，
+# 并且LIKE '%关键词%' 可以直接使用索引，查询语义与原来的LIKE一致
+FTS_TABLE = "transactions_fts"
+FTS_TEXT_COLUMNS = ["附言", "账户名", "对手账户名"]
+FTS_MIN_QUERY_CHARS = 3  # trigram索引只能加速至少3个字符的关键词
+FTS_TRIGGERS = ["transactions_fts_ai", "transactions_fts_ad", "transactions_fts_au"]
+
+
+def can_use_fts(value):
+    """关键词是否可以走全文索引：至少FTS_MIN_QUERY_CHARS个字符且不含LIKE通配符"""
+    if value is None:
+        return False
+    value = str(value)
+    return len(value) >= FTS_MIN_QUERY_CHARS and '%' not in value and '_' not in value
+
+
+def fts_supported(conn):
+    """当前SQLite是否支持FTS5 trigram分词器（需要3.34及以上版本）"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+        conn.execute("DROP TABLE temp.fts_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def has_fts_index(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,))
+    return cursor.fetchone() is not None
+
+
+def get_fts_columns(cursor):
+    """返回已建立全文索引的列（没有全文索引时为空元组），用于build_filter_clause"""
+    return tuple(FTS_TEXT_COLUMNS) if has_fts_index(cursor) else ()
+
+
+def _create_fts_triggers(cursor):
+    """创建同步触发器，transactions的插入、删除和文本列更新自动同步到全文索引"""
+    columns = ", ".join(FTS_TEXT_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in FTS_TEXT_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in FTS_TEXT_COLUMNS)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS transactions_fts_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS transactions_fts_ad AFTER DELETE ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS transactions_fts_au AFTER UPDATE OF {columns} ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+        INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values});
+    END
+    """)
+
+
+def _drop_fts_triggers(cursor):
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+def _fts_triggers_complete(cursor):
+    cursor.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type='trigger' AND name IN ({', '.join('?' * len(FTS_TRIGGERS))})",
+        FTS_TRIGGERS
+    )
+    return cursor.fetchone()[0] == len(FTS_TRIGGERS)
+
+
+def create_fts_index(conn):
+    """
+    为FTS_TEXT_COLUMNS建立全文索引（外部内容表，不重复存储文本）并创建同步触发器
+    
+    Returns:
+        dict: created（是否新建）、build_seconds
+    """
+    cursor = conn.cursor()
+    if has_fts_index(cursor):
+        _create_fts_triggers(cursor)
+        conn.commit()
+        return {"created": False, "build_seconds": 0}
+    if not fts_supported(conn):
+        raise ValueError(f"当前SQLite版本 {sqlite3.sqlite_version} 不支持FTS5 trigram分词器")
+
+    start_time = time.time()
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        {', '.join(FTS_TEXT_COLUMNS)},
+        content='transactions', content_rowid='rowid', tokenize='trigram'
+    )
+    """)
+    cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _create_fts_triggers(cursor)
+    conn.commit()
+    build_seconds = round(time.time() - start_time, 3)
+    logger.info("创建全文索引耗时 %s 秒", build_seconds)
+    return {"created": True, "build_seconds": build_seconds}
+
+
+def drop_fts_index(conn):
+    cursor = conn.cursor()
+    _drop_fts_triggers(cursor)
+    cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    conn.commit()
+
+
+def suspend_fts_sync(conn):
+    """
+    合并开始前移除同步触发器，避免逐行维护全文索引
+    
+    上次合并中断导致触发器缺失时先重建全文索引。
+    
+    Returns:
+        合并前transactions的最大rowid；没有全文索引时为None
+    """
+    cursor = conn.cursor()
+    if not has_fts_index(cursor):
+        return None
+    if not _fts_triggers_complete(cursor):
+        logger.warning("全文索引与数据不同步，正在重建")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _drop_fts_triggers(cursor)
+    conn.commit()
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM transactions")
+    return cursor.fetchone()[0]
+
+
+def resume_fts_sync(conn, start_rowid):
+    """合并结束后把新写入的行（rowid大于start_rowid）批量加入全文索引，并恢复同步触发器"""
+    if start_rowid is None:
+        return
+    cursor = conn.cursor()
+    columns = ", ".join(FTS_TEXT_COLUMNS)
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) SELECT rowid, {columns} FROM transactions WHERE rowid > ?",
+        (start_rowid,)
+    )
+    _create_fts_triggers(cursor)
+    conn.commit()
+#---------------------------------
+
+
+# 统计汇总
+# stats_files（每个文件的行数和记账日期范围）、stats_accounts（每个账号的行数）和stats_summary
+# （被拒绝单元格数、同步位置）由触发器随transactions的写入增量维护，/api/database-stats只读这几张小表。
+# 合并期间与全文索引一样移除触发器，结束后把rowid大于同步位置的新行分组汇总后补齐。
+# 账号和文件名为NULL时以空字符串保存；更新或删除的记账日期恰好是文件的最小/最大值时，该文件标记为dirty，
+# 读取时重新计算其日期范围。
+#---------------------------------
+STATS_TRIGGERS = ["transactions_stats_ai", "transactions_stats_ad", "transactions_stats_au"]
+STATS_TOP_ACCOUNTS = 5
+
+_STATS_FILE_UPSERT = """
+ON CONFLICT (source_file) DO UPDATE SET
+    row_count = row_count + excluded.row_count,
+    min_date = CASE WHEN min_date IS NULL OR excluded.min_date < min_date THEN COALESCE(excluded.min_date, min_date) ELSE min_date END,
+    max_date = CASE WHEN max_date IS NULL OR excluded.max_date > max_date THEN COALESCE(excluded.max_date, max_date) ELSE max_date END
+"""
+_STATS_ACCOUNT_UPSERT = "ON CONFLICT (账号) DO UPDATE SET row_count = row_count + excluded.row_count"
+
+
+def _stats_remove_sql(prefix):
+    """从统计中减去一行，日期范围可能因此收缩时标记dirty"""
+    return f"""
+        UPDATE stats_files SET row_count = row_count - 1,
+            dirty = dirty OR ({prefix}.记账日期 IS NOT NULL AND ({prefix}.记账日期 = min_date OR {prefix}.记账日期 = max_date))
+        WHERE source_file = IFNULL({prefix}.source_file, '');
+        UPDATE stats_accounts SET row_count = row_count - 1 WHERE 账号 = IFNULL({prefix}.账号, '');
+        DELETE FROM stats_accounts WHERE 账号 = IFNULL({prefix}.账号, '') AND row_count <= 0;
+    """
+
+
+def _stats_add_sql(prefix):
+    """把一行计入统计"""
+    return f"""
+        INSERT INTO stats_files (source_file, row_count, min_date, max_date)
+        VALUES (IFNULL({prefix}.source_file, ''), 1, {prefix}.记账日期, {prefix}.记账日期) {_STATS_FILE_UPSERT};
+        INSERT INTO stats_accounts (账号, row_count) VALUES (IFNULL({prefix}.账号, ''), 1) {_STATS_ACCOUNT_UPSERT};
+    """
+
+
+def _create_stats_triggers(cursor):
+    """创建统计触发器：transactions的插入、删除以及文件名、账号、记账日期的更新同步到统计表"""
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS transactions_stats_ai AFTER INSERT ON transactions BEGIN
+        {_stats_add_sql("new")}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS transactions_stats_ad AFTER DELETE ON transactions BEGIN
+        {_stats_remove_sql("old")}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS transactions_stats_au AFTER UPDATE OF source_file, 账号, 记账日期 ON transactions BEGIN
+        {_stats_remove_sql("old")}
+        {_stats_add_sql("new")}
+    END
+    """)
+
+
+def _drop_stats_triggers(cursor):
+    for trigger in STATS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+def _stats_triggers_complete(cursor):
+    cursor.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type='trigger' AND name IN ({', '.join('?' * len(STATS_TRIGGERS))})",
+        STATS_TRIGGERS
+    )
+    return cursor.fetchone()[0] == len(STATS_TRIGGERS)
+
+
+def _stats_summary_value(cursor, key, default=0):
+    row = cursor.execute("SELECT value FROM stats_summary WHERE key = ?", (key,)).fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def _set_stats_summary(cursor, key, value):
+    cursor.execute(
+        "INSERT INTO stats_summary (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+
+def _accumulate_stats(cursor, start_rowid):
+    """把rowid大于start_rowid的行分组汇总后计入统计表"""
+    cursor.execute(f"""
+    INSERT INTO stats_files (source_file, row_count, min_date, max_date)
+    SELECT IFNULL(source_file, ''), COUNT(*), MIN(记账日期), MAX(记账日期)
+    FROM transactions WHERE rowid > ? GROUP BY IFNULL(source_file, '')
+    {_STATS_FILE_UPSERT}
+    """, (start_rowid,))
+    cursor.execute(f"""
+    INSERT INTO stats_accounts (账号, row_count)
+    SELECT IFNULL(账号, ''), COUNT(*) FROM transactions WHERE rowid > ? GROUP BY IFNULL(账号, '')
+    {_STATS_ACCOUNT_UPSERT}
+    """, (start_rowid,))
+
+
+def recompute_stats(conn):
+    """
+    从transactions和rejected_cells完整重算统计表并恢复触发器
+
+    Returns:
+        dict: recomputed、build_seconds
+    """
+    start_time = time.time()
+    cursor = conn.cursor()
+    _drop_stats_triggers(cursor)
+    cursor.execute("DELETE FROM stats_files")
+    cursor.execute("DELETE FROM stats_accounts")
+    _accumulate_stats(cursor, 0)
+    cursor.execute("SELECT COUNT(*) FROM rejected_cells")
+    _set_stats_summary(cursor, "rejected_cells", cursor.fetchone()[0])
+    _set_stats_summary(cursor, "sync_rowid", None)
+    _create_stats_triggers(cursor)
+    conn.commit()
+    build_seconds = round(time.time() - start_time, 3)
+    logger.info("重算统计汇总耗时 %s 秒", build_seconds)
+    return {"recomputed": True, "build_seconds": build_seconds}
+
+
+def ensure_stats_tables(conn):
+    """创建统计表和触发器；统计表是新建的（如旧版数据库）时立即完整重算"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_summary'")
+    if cursor.fetchone():
+        return
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS stats_files (
+        source_file TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        min_date TEXT,
+        max_date TEXT,
+        dirty INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS stats_accounts (
+        账号 TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_accounts_row_count ON stats_accounts (row_count)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS stats_summary (key TEXT PRIMARY KEY, value)")
+    recompute_stats(conn)
+
+
+def adjust_rejected_count(cursor, delta):
+    """被拒绝单元格增减时更新统计；没有统计表的旧版数据库在建表时完整重算，这里直接跳过"""
+    if delta:
+        try:
+            cursor.execute("UPDATE stats_summary SET value = value + ? WHERE key = 'rejected_cells'", (delta,))
+        except sqlite3.OperationalError:
+            pass
+
+
+def suspend_stats_sync(conn):
+    """
+    合并开始前移除统计触发器，记录同步位置（合并前transactions的最大rowid）
+
+    上次合并中断导致触发器缺失时，先从上次记录的同步位置补齐统计。
+    """
+    cursor = conn.cursor()
+    if not _stats_triggers_complete(cursor):
+        logger.warning("统计汇总与数据不同步，正在补齐")
+        _accumulate_stats(cursor, _stats_summary_value(cursor, "sync_rowid"))
+    _drop_stats_triggers(cursor)
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM transactions")
+    _set_stats_summary(cursor, "sync_rowid", cursor.fetchone()[0])
+    conn.commit()
+
+
+def _source_date_range(cursor, source_file):
+    """文件的 (最小, 最大) 记账日期；按source_file直接比较以使用 (source_file, row_number) 索引"""
+    if source_file == '':
+        return cursor.execute(
+            "SELECT MIN(记账日期), MAX(记账日期) FROM transactions WHERE source_file IS NULL OR source_file = ''"
+        ).fetchone()
+    return cursor.execute(
+        "SELECT MIN(记账日期), MAX(记账日期) FROM transactions WHERE source_file = ?", (source_file,)
+    ).fetchone()
+
+
+def _refresh_dirty_stats(cursor):
+    """重新计算标记为dirty的文件的日期范围（在写连接上调用，调用方负责提交）"""
+    cursor.execute("DELETE FROM stats_files WHERE row_count <= 0")
+    for (source_file,) in cursor.execute("SELECT source_file FROM stats_files WHERE dirty = 1").fetchall():
+        min_date, max_date = _source_date_range(cursor, source_file)
+        cursor.execute(
+            "UPDATE stats_files SET min_date = ?, max_date = ?, dirty = 0 WHERE source_file = ?",
+            (min_date, max_date, source_file)
+        )
+
+
+def resume_stats_sync(conn):
+    """合并结束后把同步位置之后写入的行计入统计，整理dirty文件，并恢复触发器"""
+    cursor = conn.cursor()
+    if _stats_triggers_complete(cursor):
+        return
+    _accumulate_stats(cursor, _stats_summary_value(cursor, "sync_rowid"))
+    _set_stats_summary(cursor, "sync_rowid", None)
+    _refresh_dirty_stats(cursor)
+    _create_stats_triggers(cursor)
+    conn.commit()
+
+
+def _merge_date(current, value, pick):
+    if current is None:
+        return value
+    if value is None:
+        return current
+    return pick(current, value)
+
+
+def read_database_stats(cursor):
+    """
+    从统计表读取数据库统计
+
+    触发器缺失（合并进行中或中断）时，同步位置之后的行现场汇总后合并进结果。
+
+    Returns:
+        dict: total_rows、rejected_rows、unique_files、date_range、top_accounts、pending_rows（现场汇总的行数）
+    """
+    files = {row[0]: list(row[1:]) for row in cursor.execute(
+        "SELECT source_file, row_count, min_date, max_date, dirty FROM stats_files"
+    ).fetchall()}
+    pending_accounts = {}
+    pending_rows = 0
+    if not _stats_triggers_complete(cursor):
+        sync_rowid = _stats_summary_value(cursor, "sync_rowid")
+        for source_file, count, min_date, max_date in cursor.execute(
+            "SELECT IFNULL(source_file, ''), COUNT(*), MIN(记账日期), MAX(记账日期) "
+            "FROM transactions WHERE rowid > ? GROUP BY IFNULL(source_file, '')", (sync_rowid,)
+        ).fetchall():
+            pending_rows += count
+            entry = files.setdefault(source_file, [0, None, None, 0])
+            entry[0] += count
+            entry[1] = _merge_date(entry[1], min_date, min)
+            entry[2] = _merge_date(entry[2], max_date, max)
+        pending_accounts = dict(cursor.execute(
+            "SELECT IFNULL(账号, ''), COUNT(*) FROM transactions WHERE rowid > ? GROUP BY IFNULL(账号, '')",
+            (sync_rowid,)
+        ).fetchall())
+
+    # 写入路径提交前已整理dirty文件，这里只剩合并进行中或中断时的文件，现场计算日期范围
+    for source_file, entry in files.items():
+        if entry[3] and entry[0] > 0:
+            entry[1], entry[2] = _source_date_range(cursor, source_file)
+
+    counted = [entry for entry in files.values() if entry[0] > 0]
+    min_dates = [entry[1] for entry in counted if entry[1] is not None]
+    max_dates = [entry[2] for entry in counted if entry[2] is not None]
+
+    # 有现场汇总的账号时需要全部账号参与排序，否则直接取统计表的前几名
+    if pending_accounts:
+        accounts = dict(cursor.execute("SELECT 账号, row_count FROM stats_accounts").fetchall())
+        for account, count in pending_accounts.items():
+            accounts[account] = accounts.get(account, 0) + count
+        top_accounts = sorted(accounts.items(), key=lambda item: item[1], reverse=True)[:STATS_TOP_ACCOUNTS]
+    else:
+        top_accounts = cursor.execute(
+            "SELECT 账号, row_count FROM stats_accounts ORDER BY row_count DESC LIMIT ?", (STATS_TOP_ACCOUNTS,)
+        ).fetchall()
+
+    return {
+        "total_rows": sum(entry[0] for entry in counted),
+        "rejected_rows": _stats_summary_value(cursor, "rejected_cells"),
+        "unique_files": sum(1 for name, entry in files.items() if entry[0] > 0 and name != ''),
+        "date_range": [min(min_dates) if min_dates else None, max(max_dates) if max_dates else None],
+        "top_accounts": [{"账号": account if account != '' else None, "count": count} for account, count in top_accounts],
+        "pending_rows": pending_rows
+    }
+#---------------------------------
+
+
+@app.route('/api/query-database', methods=['POST'])
+def query_database():
+    """
+    Query the database with filters and sorting
+    
+    分页使用 (排序列, rowid) 键集：传入上一页返回的cursor时直接从游标处读取；
+    只传page时使用缓存的页起点游标，翻页开销与第一页相同。
+    count_mode为"estimate"时立即返回估算总数，精确值在后台计算。
+    """
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    data = request.json
+    db_path = data.get('db_path')
+    filters = data.get('filters', [])
+    sort_by = data.get('sort_by', None)
+    sort_direction = data.get('sort_direction', 'asc')
+    page = data.get('page', 1)
+    page_size = data.get('page_size', 100)
+    page_cursor = data.get('cursor')
+    count_mode = data.get('count_mode', 'exact')
+
+    if not db_path:
+        return jsonify({"status": "error", "message": "Missing database path"}), 400
+
+    if count_mode not in COUNT_MODES:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown count mode '{count_mode}', expected one of {list(COUNT_MODES)}"
+        }), 400
+
+    try:
+        page = int(page)
+        page_size = int(page_size)
+        if page < 1 or page_size < 1:
+            raise ValueError()
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Invalid page or page size"}), 400
+
+    try:
+        cursor_value = decode_cursor(page_cursor) if page_cursor else None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        conn = get_connection(db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        record_column_usage(db_path, filters, sort_by)
+        where_sql, params = build_filter_clause(filters, get_fts_columns(cursor))
+        descending = bool(sort_by) and sort_direction.lower() == 'desc'
+
+        # Get total count
+        total_count, count_exact = get_total_count(cursor, db_path, filters, where_sql, params, count_mode)
+
+        # 定位页起点
+        page_key = _page_cursor_key(db_path, filters, sort_by, descending, page_size)
+        offset = 0
+        if not page_cursor:
+            cursor_value, offset = find_page_start(page_key, page, page_size)
+
+        rows, next_cursor_value = fetch_keyset_page(
+            cursor, where_sql, params, sort_by, descending, page_size, cursor_value, offset
+        )
+        if next_cursor_value is not None and (not page_cursor or 'page' in data):
+            remember_page_cursor(page_key, page + 1, next_cursor_value)
+
+        # Convert to list of dicts
+        results = []
+        for row in rows:
+            results.append({key: row[key] for key in row.keys() if not key.startswith('__')})
+
+        conn.close()
+
+        return jsonify({
+            "status": "success",
+            "total_count": total_count,
+            "count_exact": count_exact,
+            "page": page,
+            "page_size": page_size,
+            "has_more": next_cursor_value is not None,
+            "next_cursor": encode_cursor(*next_cursor_value) if next_cursor_value is not None else None,
+            "results": results
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/check-database', methods=['POST'])
+def check_database():
+    """检查数据库结构和潜在问题"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    data = request.json
+    db_path = data.get('db_path')
+
+    if not db_path:
+        return jsonify({"status": "error", "message": "缺少数据库路径"}), 400
+    
+    try:
+        conn = get_connection(db_path)
+        cursor = conn.cursor()
+        tables = []
+        errors = []
+    
+        # 检查表是否存在
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        table_names = [row[0] for row in cursor.fetchall()]
+        
+        if 'transactions' not in table_names:
+            errors.append("transactions表不存在")
+        
+        for table_name in ('rejected_raw_rows', 'rejected_cells'):
+            if table_name not in table_names and 'rejected_rows' not in table_names:
+                errors.append(f"{table_name}表不存在")
+        
+        # 获取表结构
+        for table_name in table_names:
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            columns = [f"{row[1]} ({row[2]})" for row in cursor.fetchall()]
+            tables.append({"name": table_name, "columns": columns})
+            
+            # 检查字段类型是否合适
+            if table_name == 'transactions':
+                id_type = None
+                row_number_type = None
+                
+                for row in cursor.execute(f"PRAGMA table_info({table_name})"):
+                    if row[1] == 'ID':
+                        id_type = row[2]
+                    elif row[1] == 'row_number':
+                        row_number_type = row[2]
+                
+                if id_type != 'TEXT' and id_type is not None:
+                    errors.append(f"transactions表中的ID字段类型为{id_type}，应为TEXT以支持大整数")
+                
+                if row_number_type != 'TEXT' and row_number_type is not None:
+                    errors.append(f"transactions表中的row_number字段类型为{row_number_type}，应为TEXT以支持大整数")
+            
+            elif table_name in ('rejected_rows', 'rejected_raw_rows'):
+                row_number_type = None
+                
+                for row in cursor.execute(f"PRAGMA table_info({table_name})"):
+                    if row[1] == 'row_number':
+                        row_number_type = row[2]
+                
+                if row_number_type != 'TEXT' and row_number_type is not None:
+                    errors.append(f"{table_name}表中的row_number字段类型为{row_number_type}，应为TEXT以支持大整数")
+        
+        if 'rejected_rows' in table_names:
+            errors.append("rejected_rows为旧版表结构，打开被拒绝行列表时会自动迁移")
+        
+        # 检查被拒绝单元格表是否为空
+        if 'rejected_cells' in table_names:
+            cursor.execute("SELECT COUNT(*) FROM rejected_cells")
+            rejected_count = cursor.fetchone()[0]
+            
+            if rejected_count == 0:
+                # 检查日志中可能的错误
+                cursor.execute("PRAGMA integrity_check")
+                integrity_result = cursor.fetchall()
+                
+                if integrity_result[0][0] != 'ok':
+                    errors.append(f"数据库一致性检查失败: {integrity_result}")
+                
+                # 检查rejected_cells表是否有正确的索引
+                cursor.execute("PRAGMA index_list(rejected_cells)")
+                indices = cursor.fetchall()
+                
+                if not indices:
+                    errors.append("rejected_cells表缺少索引，可能影响性能")
+        
+        conn.close()
+    
+        return jsonify({
+            "status": "success",
+            "tables": tables,
+            "errors": errors
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e), "traceback": traceback.format_exc()}), 500
+
+@app.route('/api/rejected-rows', methods=['POST'])
+def get_rejected_rows():
+    """Get rejected rows that need manual verification"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    data = request.json
+    db_path = data.get('db_path')
+    page = data.get('page', 1)
+    page_size = data.get('page_size', 100)
+
+    if not db_path:
+        return jsonify({"status": "error", "message": "Missing database path"}), 400
+
+    try:
+        conn = get_connection(db_path)
+        cursor = conn.cursor()
+
+        logger.debug("查询被拒绝行：数据库=%s, 页码=%s, 每页=%s", db_path, page, page_size)
+        
+        # 确保被拒绝行的表存在（旧版数据库在此迁移）
+        prepare_rejected_storage(db_path)
+
+        cursor.execute("SELECT COUNT(*) FROM rejected_cells")
+        total_count = cursor.fetchone()[0]
+        logger.debug("共有 %d 条被拒绝的单元格", total_count)
+
+        # 获取分页结果，同一原始行只解码一次
+        offset = (page - 1) * page_size
+        try:
+            results = fetch_rejected_rows(cursor, limit=page_size, offset=offset)
+            logger.debug("查询返回 %d 行数据", len(results))
+        except sqlite3.Error as e:
+            logger.error("查询被拒绝行时发生SQLite错误: %s", e)
+            return jsonify({"status": "error", "message": f"数据库查询错误: {str(e)}"}), 500
+
+        conn.close()
+
+        return jsonify({
+            "status": "success",
+            "total_count": total_count,
+            "page": page,
+            "page_size": page_size,
+            "results": results
+        })
+    except Exception as e:
+        logger.exception("获取rejected_rows时发生错误: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/process-rejected-row', methods=['POST'])
+def process_rejected_row():
+    """Process a manually fixed rejected row with simplified logic"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    data = request.json
+    print(f"接收到处理请求: {data}", file=sys.stderr, flush=True)
+    
+    db_path = data.get('db_path')
+    row_id = data.get('row_id')
+    fixed_data = data.get('fixed_data', {})
+    action = data.get('action', 'save')  # 'save' or 'delete'
+    user_mappings = data.get('user_mappings', {})  # 从前端获取映射关系
+    
+    if not db_path or row_id is None:
+        return jsonify({"status": "error", "message": "Missing database path or row ID"}), 400
+
+    try:
+        conn = get_connection(db_path, write=True)
+        cursor = conn.cursor()
+        ensure_rejected_storage(cursor)
+
+        if action == 'delete':
+            # Delete the rejected row
+            delete_rejected_cells(cursor, [row_id])
+            conn.commit()
+            conn.close()
+            return jsonify({"status": "success", "message": f"Rejected row {row_id} deleted successfully"})
+            
+        # 获取被拒绝的行信息
+        rows = fetch_rejected_rows(cursor, "c.id = ?", (row_id,))
+        if not rows:
+            conn.close()
+            return jsonify({"status": "error", "message": f"Rejected row {row_id} not found"}), 404
+        row_dict = rows[0]
+            
+        # 提取关键信息
+        source_file = fixed_data.get("source_file") or row_dict.get("source_file")
+        row_number = str(fixed_data.get("row_number") or row_dict.get("row_number") or "1")
+        column_name = row_dict.get('column_name')  # 原始列名
+        target_column = row_dict.get('target_column')  # 目标列名
+        current_fixing_field = target_column if target_column else column_name  # 当前修复的字段
+        
+        print(f"处理文件: {source_file}, 行号: {row_number}, 修复字段: {current_fixing_field}", 
+              file=sys.stderr, flush=True)
+        print(f"用户映射关系: {user_mappings}", file=sys.stderr, flush=True)
+
+        # 查找是否存在现有行
+        cursor.execute(
+            "SELECT * FROM transactions WHERE source_file = ? AND row_number = ?", 
+            (source_file, row_number)
+        )
+        existing_row = cursor.fetchone()
+        
+        if existing_row:
+            # 如果行已存在，仅更新用户修改的字段
+            print(f"找到现有行，仅更新修改的字段", file=sys.stderr, flush=True)
+            
+            # 更新用户修改的字段
+            for field, value in fixed_data.items():
+                # 跳过标识字段
+                if field in ["source_file", "row_number"]:
+                    continue
+                    
+                # 只处理当前修复的字段和ID字段
+                if field == current_fixing_field or field == "ID":
+                    # 处理空值和NaN
+                    if value is None or value == '' or value == 'NaN':
+                        cursor.execute(
+                            f"UPDATE transactions SET {field} = NULL WHERE source_file = ? AND row_number = ?",
+                            (source_file, row_number)
+                        )
+                        print(f"将字段 {field} 更新为NULL", file=sys.stderr, flush=True)
+                    else:
+                        # 特殊处理ID字段，确保以字符串形式存储
+                        if field == "ID":
+                            value = str(value)
+                            
+                        cursor.execute(
+                            f"UPDATE transactions SET {field} = ? WHERE source_file = ? AND row_number = ?",
+                            (value, source_file, row_number)
+                        )
+                        print(f"更新字段: {field} = {value}", file=sys.stderr, flush=True)
+        else:
+            # 如果行不存在，需要根据映射关系从原始数据创建新行
+            print(f"行不存在，创建新行", file=sys.stderr, flush=True)
+            
+            # 解析原始数据
+            original_data = row_dict.get('raw_data') or {}
+            logger.debug("原始数据: %d 个字段", len(original_data))
+                
+            # 创建新行数据
+            new_row = {
+                "source_file": source_file,
+                "row_number": row_number
+            }
+            
+            # 应用用户映射关系，从原始数据填充字段
+            template_name = data.get('template_name')
+            current_template = templates.get(template_name, templates.get(next(iter(templates))))
+            
+            for orig_col, target_col in user_mappings.items():
+                if not target_col or orig_col not in original_data:
+                    continue  # 跳过未映射的列或原始数据中不存在的列
+                
+                try:
+                    # 获取字段类型
+                    field_type = "text"  # 默认类型
+                    if target_col in current_template:
+                        field_type = current_template[target_col]["type"]
+                    
+                    # 转换值
+                    value = original_data[orig_col]
+                    if value is not None:
+                        converted_value = convert_value(value, field_type)
+                        if converted_value is not None:
+                            new_row[target_col] = converted_value
+                            print(f"从原始数据映射: {orig_col} -> {target_col} = {converted_value}", file=sys.stderr, flush=True)
+                except Exception as e:
+                    print(f"转换字段 {orig_col} 值失败: {str(e)}", file=sys.stderr, flush=True)
+            
+            # 应用用户修改的字段值，这些优先级更高
+            for field, value in fixed_data.items():
+                if field in ["source_file", "row_number"]:
+                    continue  # 已经处理过
+                
+                if value is not None and value != 'NaN' and value != '':
+                    new_row[field] = value
+                    print(f"使用用户提供的值: {field} = {value}", file=sys.stderr, flush=True)
+                elif field == current_fixing_field:
+                    # 如果是当前修复的字段，即使为空也设置为NULL
+                    new_row[field] = None
+                    print(f"设置字段为NULL: {field}", file=sys.stderr, flush=True)
+            
+            # 插入新行
+            if len(new_row) > 2:  # 确保至少有一个非标识字段
+                columns = list(new_row.keys())
+                values = list(new_row.values())
+                placeholders = ", ".join(["?" for _ in columns])
+                
+                try:
+                    cursor.execute(
+                        f"INSERT INTO transactions ({', '.join(columns)}) VALUES ({placeholders})",
+                        values
+                    )
+                    print(f"成功插入新行: {columns} = {values}", file=sys.stderr, flush=True)
+                except sqlite3.Error as e:
+                    print(f"插入新行失败: {str(e)}", file=sys.stderr, flush=True)
+                    raise e
+            else:
+                print("警告: 没有足够的数据创建新行", file=sys.stderr, flush=True)
+        
+        # 删除已处理的拒绝行
+        delete_rejected_cells(cursor, [row_id])
+        # 修改的记账日期可能是文件的最小/最大值，提交前重新计算这些文件的日期范围
+        _refresh_dirty_stats(cursor)
+        
+        conn.commit()
+        conn.close()
+        invalidate_query_cache(db_path)
+        
+        return jsonify({
+            "status": "success",
+            "message": f"Rejected row {row_id} processed successfully"
         })
     except Exception as e:
+        print(f"处理拒绝行失败: {str(e)}", file=sys.stderr, flush=True)
+        traceback.print_exc(file=sys.stderr)
+        
+        try:
+            if 'conn' in locals() and conn:
+                conn.close()
+        except:
+            pass
+            
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/check-database', methods=['POST'])
-def check_database():
-    """检查数据库结构和潜在问题"""
-    # 验证请求
+
+# 被拒绝行批量修复
+# 按条件选出被拒绝的单元格，对其原始值应用同一条修复规则后，把涉及的原始行按（文件, 表头）分组，
+# 整组构造数据框走与导入相同的转换计划，一次转换完成。全部列都转换成功的行写入transactions
+# （行已存在时只更新被修复的列，与单行修复一致），并删除该行的所有单元格错误；仍有错误的行保持不变。
+#---------------------------------
+REPAIR_TYPES = ("int", "float", "date", "time", "text")
+REPAIR_OUTPUT_FORMATS = {"date": "%Y-%m-%d", "time": "%H:%M:%S"}
+REPAIR_FAILURE_SAMPLE = 20  # 响应中返回的仍失败行示例数
+
+
+def parse_repair_request(data):
+    """
+    解析并校验批量修复请求
+
+    选择条件（selection）: ids、source_file、column_name、target_column、reason_pattern（正则），同时给出时取交集。
+    修复规则（fix）: value（常量）、regex（{"pattern", "replacement"}，改写原始值）、
+    format（日期/时间的strptime格式）、type（覆盖目标列的数据类型），依次应用。
+    列映射: column_mappings（{文件: {原始列: 目标列}}）或对所有文件生效的user_mappings。
+
+    Returns:
+        (params, error): 参数字典；参数无效时params为None，error为 (响应内容, 状态码)
+    """
+    db_path = data.get('db_path')
+    if not db_path:
+        return None, ({"status": "error", "message": "Missing database path"}, 400)
+
+    selection = data.get('selection') or {}
+    where, where_params = [], []
+    ids = selection.get('ids')
+    if ids:
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            return None, ({"status": "error", "message": "selection.ids must be a list of integers"}, 400)
+        where.append(f"c.id IN ({', '.join(['?'] * len(ids))})")
+        where_params.extend(ids)
+    for field, column in (("source_file", "r.source_file"), ("column_name", "c.column_name"),
+                          ("target_column", "c.target_column")):
+        if selection.get(field):
+            where.append(f"{column} = ?")
+            where_params.append(str(selection[field]))
+    reason_pattern = None
+    if selection.get('reason_pattern'):
+        try:
+            reason_pattern = re.compile(selection['reason_pattern'])
+        except re.error as e:
+            return None, ({"status": "error", "message": f"Invalid reason_pattern: {e}"}, 400)
+    if not where and reason_pattern is None:
+        return None, ({"status": "error", "message": "Selection is empty, specify ids, source_file, column_name, target_column or reason_pattern"}, 400)
+
+    fix = data.get('fix') or {}
+    fix_type = fix.get('type')
+    if fix_type is not None and fix_type not in REPAIR_TYPES:
+        return None, ({"status": "error", "message": f"Unknown type '{fix_type}', expected one of {list(REPAIR_TYPES)}"}, 400)
+    regex = None
+    if fix.get('regex'):
+        try:
+            regex = (re.compile(fix['regex']['pattern']), str(fix['regex'].get('replacement', '')))
+        except (KeyError, TypeError, re.error) as e:
+            return None, ({"status": "error", "message": f"Invalid regex rule: {e}"}, 400)
+    value_format = fix.get('format')
+    if value_format and fix_type not in (None, "date", "time"):
+        return None, ({"status": "error", "message": "format only applies to date and time columns"}, 400)
+    if 'value' not in fix and regex is None and not value_format and fix_type is None:
+        return None, ({"status": "error", "message": "Fix rule is empty, specify value, regex, format or type"}, 400)
+
+    return {
+        "db_path": db_path,
+        "where_sql": " AND ".join(where),
+        "where_params": where_params,
+        "reason_pattern": reason_pattern,
+        "has_value": 'value' in fix,
+        "value": fix.get('value'),
+        "regex": regex,
+        "format": value_format,
+        "type": fix_type,
+        "column_mappings": data.get('column_mappings') or {},
+        "user_mappings": data.get('user_mappings') or {},
+        "dry_run": bool(data.get('dry_run', False)),
+    }, None
+
+
+def _apply_fix_rule(values, params, target_type):
+    """对一列被选中单元格的原始值应用修复规则，返回新值列表（列式处理）"""
+    if params["has_value"]:
+        return [params["value"]] * len(values)
+
+    series = pd.Series(values, dtype=object)
+    present = series.notna()
+    if params["regex"] is not None and present.any():
+        pattern, replacement = params["regex"]
+        series[present] = series[present].astype(str).str.replace(pattern, replacement, regex=True)
+
+    output_format = REPAIR_OUTPUT_FORMATS.get(target_type)
+    if params["format"] and output_format and present.any():
+        parsed = pd.to_datetime(series[present].astype(str).str.strip(), format=params["format"], errors='coerce')
+        parsed_ok = parsed.notna()
+        # 按指定格式解析成功的值改写为标准格式，其余保持原值交给常规转换
+        series[parsed_ok[parsed_ok].index] = parsed[parsed_ok].dt.strftime(output_format)
+    return series.tolist()
+
+
+def _repair_plan(source_file, params, fixed_targets):
+    """
+    修复用的转换计划：文件的列映射加上覆盖后的目标类型；没有映射时返回None
+
+    来自工作表的行（来源名为"文件名#工作表"）先查找工作表自己的映射，再使用文件的映射，与导入时一致。
+    """
+    # 文件名本身也可能含有分隔符，依次尝试每个分隔位置之前的部分
+    candidates = [source_file] + [source_file[:i] for i, char in enumerate(source_file) if char == SHEET_SOURCE_SEPARATOR]
+    for name in candidates:
+        mapping = resolve_file_mapping(params["column_mappings"], name)
+        if mapping:
+            break
+    mapping = mapping or params["user_mappings"]
+    if not mapping:
+        return None
+    plan = compile_conversion_plan(source_file, {source_file: mapping})
+    if params["type"]:
+        for column in plan["columns"]:
+            if column["target"] in fixed_targets:
+                column["type"] = params["type"]
+                if column["converter"] != "raw":
+                    column["converter"] = params["type"]
+    return plan
+
+
+def _upsert_repaired_rows(cursor, mapped_rows, fixed_targets):
+    """
+    写入修复后的行：(source_file, row_number) 已存在时只更新被修复的列，否则插入整行
+
+    Returns:
+        dict: inserted、updated、duplicates、failed
+    """
+    result = {"inserted": 0, "updated": 0, "duplicates": 0, "failed": 0}
+    existing = set()
+    by_file = {}
+    for row in mapped_rows:
+        by_file.setdefault(row["source_file"], set()).add(row["row_number"])
+    for source_file, row_numbers in by_file.items():
+        row_numbers = list(row_numbers)
+        for start in range(0, len(row_numbers), 500):
+            chunk = row_numbers[start:start + 500]
+            cursor.execute(
+                f"SELECT row_number FROM transactions WHERE source_file = ? AND row_number IN ({', '.join(['?'] * len(chunk))})",
+                [source_file] + chunk
+            )
+            existing.update((source_file, r[0]) for r in cursor.fetchall())
+
+    new_rows = [row for row in mapped_rows if (row["source_file"], row["row_number"]) not in existing]
+    updates = {}  # 被修复的列 -> [(值..., source_file, row_number)]
+    for row in mapped_rows:
+        if (row["source_file"], row["row_number"]) in existing:
+            columns = tuple(col for col in row if col in fixed_targets)
+            if columns:
+                values = [str(row[col]) if col == "ID" and row[col] is not None else row[col] for col in columns]
+                updates.setdefault(columns, []).append(values + [row["source_file"], row["row_number"]])
+    for columns, batch in updates.items():
+        set_sql = ", ".join(f'"{col}" = ?' for col in columns)
+        cursor.executemany(f"UPDATE transactions SET {set_sql} WHERE source_file = ? AND row_number = ?", batch)
+        result["updated"] += len(batch)
+
+    if new_rows:
+        insert_result = insert_data_to_db(cursor.connection, cursor, new_rows, [])
+        result["inserted"] = insert_result["inserted"]
+        result["duplicates"] = insert_result["duplicates"]
+        result["failed"] = insert_result["failed"]
+    return result
+
+
+def repair_rejected_rows(params):
+    """
+    批量修复被拒绝的行（在同一个事务中完成）
+
+    Returns:
+        (result, status_code)
+    """
+    started = time.perf_counter()
+    conn = get_connection(params["db_path"], write=True)
+    try:
+        cursor = conn.cursor()
+        ensure_rejected_storage(cursor)
+
+        selected = fetch_rejected_rows(cursor, params["where_sql"], params["where_params"])
+        if params["reason_pattern"] is not None:
+            selected = [cell for cell in selected if params["reason_pattern"].search(cell["reason"] or "")]
+        result = {
+            "status": "success",
+            "dry_run": params["dry_run"],
+            "selected_cells": len(selected),
+            "selected_rows": 0,
+            "fixed_rows": 0,
+            "still_failing_rows": 0,
+            "inserted": 0,
+            "updated": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "failures": []
+        }
+        if not selected:
+            conn.commit()
+            return result, 200
+
+        # 被选中的原始行及其全部单元格错误（包括未被选中的）
+        raw_row_ids = sorted({cell["raw_row_id"] for cell in selected})
+        all_cells = {}
+        for start in range(0, len(raw_row_ids), 500):
+            chunk = raw_row_ids[start:start + 500]
+            for cell in fetch_rejected_rows(cursor, f"c.raw_row_id IN ({', '.join(['?'] * len(chunk))})", chunk):
+                all_cells.setdefault(cell["raw_row_id"], []).append(cell)
+        result["selected_rows"] = len(raw_row_ids)
+
+        # 按 (文件, 表头) 分组，每组构造一个数据框
+        groups = OrderedDict()
+        for raw_row_id in raw_row_ids:
+            first = all_cells[raw_row_id][0]
+            header = tuple(first["raw_data"] or {})
+            groups.setdefault((first["source_file"], header), []).append(raw_row_id)
+        selected_by_row = {}
+        for cell in selected:
+            selected_by_row.setdefault(cell["raw_row_id"], []).append(cell)
+
+        mapped_rows = []
+        fixed_row_ids = []
+        failures = []
+        for (source_file, header), group_ids in groups.items():
+            fixed_targets = {cell["target_column"] for rid in group_ids for cell in selected_by_row[rid] if cell["target_column"]}
+            plan = _repair_plan(source_file, params, fixed_targets)
+            if plan is None:
+                failures.extend((rid, "缺少该文件的列映射") for rid in group_ids)
+                continue
+
+            rows = [[all_cells[rid][0]["raw_data"].get(col) for col in header] for rid in group_ids]
+            df = pd.DataFrame(rows, columns=list(header), dtype=object)
+            # 行号与入库时一致：默认行号为 下标 + 1，行号列存在时仍按原规则覆盖
+            df.index = [int(all_cells[rid][0]["row_number"]) - 1 if str(all_cells[rid][0]["row_number"]).isdigit() else pos
+                        for pos, rid in enumerate(group_ids)]
+
+            # 对每个被选中的原始列整列应用修复规则
+            by_column = {}
+            for pos, rid in enumerate(group_ids):
+                for cell in selected_by_row[rid]:
+                    if cell["column_name"] in df.columns:
+                        by_column.setdefault(cell["column_name"], (cell["target_column"], []))[1].append(pos)
+            for column_name, (target_column, positions) in by_column.items():
+                loc = df.columns.get_loc(column_name)
+                target_type = params["type"] or resolve_target_type(target_column)
+                df.iloc[positions, loc] = _apply_fix_rule(df.iloc[positions, loc].tolist(), params, target_type)
+
+            with time_stage("repair_convert", len(df)):
+                converted = process_dataframe_chunk(df, plan, 0)
+            accepted = set(converted["accepted_positions"].tolist())
+            mapped_rows.extend(converted["mapped_data"])
+            reasons = {}
+            for rejected in converted["rejected_rows"]:
+                reasons.setdefault(rejected["row_number"], f'{rejected["column_name"]}: {rejected["reason"]}')
+            for pos, rid in enumerate(group_ids):
+                if pos in accepted:
+                    fixed_row_ids.append(rid)
+                else:
+                    failures.append((rid, reasons.get(all_cells[rid][0]["row_number"], "映射列全部为空")))
+
+        result["fixed_rows"] = len(fixed_row_ids)
+        result["still_failing_rows"] = len(failures)
+        result["failures"] = [
+            {"raw_row_id": rid, "source_file": all_cells[rid][0]["source_file"],
+             "row_number": all_cells[rid][0]["row_number"], "reason": reason}
+            for rid, reason in failures[:REPAIR_FAILURE_SAMPLE]
+        ]
+
+        if params["dry_run"]:
+            conn.rollback()
+        else:
+            fixed_targets = {cell["target_column"] for cell in selected if cell["target_column"]}
+            result.update(_upsert_repaired_rows(cursor, mapped_rows, fixed_targets))
+            delete_rejected_cells(cursor, [cell["id"] for rid in fixed_row_ids for cell in all_cells[rid]])
+            _refresh_dirty_stats(cursor)
+            conn.commit()
+            invalidate_query_cache(params["db_path"])
+
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        log_event("repair", selected_cells=result["selected_cells"], fixed_rows=result["fixed_rows"],
+                  still_failing_rows=result["still_failing_rows"], dry_run=params["dry_run"],
+                  seconds=result["seconds"])
+        return result, 200
+    except Exception as e:
+        conn.rollback()
+        logger.exception("批量修复被拒绝行失败: %s", e)
+        return {"status": "error", "message": str(e)}, 500
+    finally:
+        conn.close()
+
+
+@app.route('/api/repair-rejected-rows', methods=['POST'])
+def repair_rejected_rows_endpoint():
+    """按条件批量修复被拒绝的行，返回修复成功和仍然失败的行数"""
     validation = verify_request()
     if validation:
         return jsonify(validation[0]), validation[1]
-        
-    data = request.json
+
+    params, error = parse_repair_request(request.json or {})
+    if error:
+        return jsonify(error[0]), error[1]
+    result, status_code = repair_rejected_rows(params)
+    return jsonify(result), status_code
+
+
+# 流式导出
+#---------------------------------
+EXPORT_FORMATS = ("xlsx", "csv", "parquet")
+EXPORT_FETCH_ROWS = 5000  # 每次从游标读取的行数
+DEFAULT_EXPORT_ROWS_PER_FILE = {"xlsx": 20000, "csv": 0, "parquet": 0}  # 0表示不分文件
+EXCEL_MAX_DATA_ROWS = 1048575  # xlsx工作表最大行数（不含表头）
+
+export_jobs = {}
+export_jobs_lock = threading.Lock()
+export_job_executor = None
+
+
+def parse_export_request(data):
+    """
+    解析并校验导出请求参数
+    
+    Returns:
+        (params, error): 参数字典；参数无效时params为None，error为 (响应内容, 状态码)
+    """
     db_path = data.get('db_path')
+    export_path = data.get('export_path')
+    export_format = data.get('format')
+    if not export_format:
+        # 未指定格式时按导出文件扩展名判断，默认xlsx
+        extension = os.path.splitext(export_path or "")[1].lower().lstrip('.')
+        export_format = extension if extension in EXPORT_FORMATS else "xlsx"
 
-    if not db_path:
-        return jsonify({"status": "error", "message": "缺少数据库路径"}), 400
+    if not db_path or not export_path:
+        return None, ({"status": "error", "message": "Missing database path or export path"}, 400)
+
+    if export_format not in EXPORT_FORMATS:
+        return None, ({
+            "status": "error",
+            "message": f"Unknown export format '{export_format}', expected one of {list(EXPORT_FORMATS)}"
+        }, 400)
+
+    try:
+        rows_per_file = int(data.get('rows_per_file', DEFAULT_EXPORT_ROWS_PER_FILE[export_format]))
+    except (TypeError, ValueError):
+        return None, ({"status": "error", "message": "Invalid rows_per_file"}, 400)
+    if rows_per_file < 0:
+        return None, ({"status": "error", "message": "Invalid rows_per_file"}, 400)
+    if export_format == "xlsx" and (rows_per_file == 0 or rows_per_file > EXCEL_MAX_DATA_ROWS):
+        rows_per_file = EXCEL_MAX_DATA_ROWS
+
+    return {
+        "db_path": db_path,
+        "export_path": export_path,
+        "format": export_format,
+        "rows_per_file": rows_per_file,
+        "filters": data.get('filters', []),
+        "sort_by": data.get('sort_by', None),
+        "sort_direction": data.get('sort_direction', 'asc')
+    }, None
+
+
+def _iter_cursor_batches(cursor, limit):
+    """从游标中逐批读取行，最多读取limit行（为None时读到结束）"""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = EXPORT_FETCH_ROWS if remaining is None else min(EXPORT_FETCH_ROWS, remaining)
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        if remaining is not None:
+            remaining -= len(rows)
+        yield rows
+
+
+def _write_xlsx_file(path, columns, batches, on_rows):
+    """
+    流式写入xlsx，内存占用与行数无关
     
+    优先使用xlsxwriter的constant_memory模式，未安装时使用openpyxl的只写模式。
+    """
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        tables = []
-        errors = []
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_numbers": False,
+                                              "strings_to_formulas": False, "strings_to_urls": False})
+        try:
+            worksheet = workbook.add_worksheet()
+            worksheet.write_row(0, 0, columns, workbook.add_format({"bold": True}))
+            row_idx = 1
+            for rows in batches:
+                for row in rows:
+                    worksheet.write_row(row_idx, 0, row)
+                    row_idx += 1
+                on_rows(len(rows))
+        finally:
+            workbook.close()
+        return
+
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    worksheet.append(columns)
+    for rows in batches:
+        for row in rows:
+            worksheet.append(row)
+        on_rows(len(rows))
+    workbook.save(path)
+
+
+def _write_csv_file(path, columns, batches, on_rows):
+    """写入带BOM的UTF-8 CSV，Excel可直接识别中文"""
+    import csv
+
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            on_rows(len(rows))
+
+
+def _write_parquet_file(path, columns, column_types, batches, on_rows):
+    """逐批写入Parquet行组，REAL列为float64，其余列为字符串（需要pyarrow）"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("导出Parquet需要安装pyarrow")
+
+    def to_float(value):
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    is_real = [column_types.get(c, "").upper() == "REAL" for c in columns]
+    schema = pa.schema([(c, pa.float64() if real else pa.string()) for c, real in zip(columns, is_real)])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            arrays = []
+            for i, real in enumerate(is_real):
+                values = [row[i] for row in rows]
+                if real:
+                    arrays.append(pa.array([to_float(v) for v in values], pa.float64()))
+                else:
+                    arrays.append(pa.array([str(v) if v is not None else None for v in values], pa.string()))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            on_rows(len(rows))
+
+
+def export_query(params, job=None):
+    """
+    按过滤和排序条件流式导出transactions，按rows_per_file分文件
     
-        # 检查表是否存在
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        table_names = [row[0] for row in cursor.fetchall()]
-        
-        if 'transactions' not in table_names:
-            errors.append("transactions表不存在")
-        
-        if 'rejected_rows' not in table_names:
-            errors.append("rejected_rows表不存在")
-        
-        # 获取表结构
-        for table_name in table_names:
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = [f"{row[1]} ({row[2]})" for row in cursor.fetchall()]
-            tables.append({"name": table_name, "columns": columns})
-            
-            # 检查字段类型是否合适
-            if table_name == 'transactions':
-                id_type = None
-                row_number_type = None
-                
-                for row in cursor.execute(f"PRAGMA table_info({table_name})"):
-                    if row[1] == 'ID':
-                        id_type = row[2]
-                    elif row[1] == 'row_number':
-                        row_number_type = row[2]
-                
-                if id_type != 'TEXT' and id_type is not None:
-                    errors.append(f"transactions表中的ID字段类型为{id_type}，应为TEXT以支持大整数")
-                
-                if row_number_type != 'TEXT' and row_number_type is not None:
-                    errors.append(f"transactions表中的row_number字段类型为{row_number_type}，应为TEXT以支持大整数")
-            
-            elif table_name == 'rejected_rows':
-                row_number_type = None
-                
-                for row in cursor.execute(f"PRAGMA table_info({table_name})"):
-                    if row[1] == 'row_number':
-                        row_number_type = row[2]
-                
-                if row_number_type != 'TEXT' and row_number_type is not None:
-                    errors.append(f"rejected_rows表中的row_number字段类型为{row_number_type}，应为TEXT以支持大整数")
-        
-        # 检查rejected_rows表是否为空
-        if 'rejected_rows' in table_names:
-            cursor.execute("SELECT COUNT(*) FROM rejected_rows")
-            rejected_count = cursor.fetchone()[0]
-            
-            if rejected_count == 0:
-                # 检查日志中可能的错误
-                cursor.execute("PRAGMA integrity_check")
-                integrity_result = cursor.fetchall()
-                
-                if integrity_result[0][0] != 'ok':
-                    errors.append(f"数据库一致性检查失败: {integrity_result}")
-                
-                # 检查rejected_rows表是否有正确的索引
-                cursor.execute("PRAGMA index_list(rejected_rows)")
-                indices = cursor.fetchall()
-                
-                if not indices:
-                    errors.append("rejected_rows表缺少索引，可能影响性能")
-        
+    行从SQLite游标中逐批读取并立即写出，不会一次性载入内存。
+    
+    Args:
+        params: parse_export_request返回的参数
+        job: 可选的后台导出任务，用于报告进度
+    
+    Returns:
+        dict: export_files、total_rows、metrics
+    """
+    db_path = params["db_path"]
+    export_format = params["format"]
+    rows_per_file = params["rows_per_file"]
+    sort_by = params["sort_by"]
+    metrics_before = metrics_snapshot()
+    parse_before = get_parse_stats()
+    started = time.perf_counter()
+
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        record_column_usage(db_path, params["filters"], sort_by)
+
+        # 导出时忽略没有值的过滤条件
+        filters = [f for f in params["filters"] if f.get('value') is not None]
+        where_sql, query_params = build_filter_clause(filters, get_fts_columns(cursor))
+        total_rows, _ = get_total_count(cursor, db_path, filters, where_sql, query_params)
+
+        query = "SELECT * FROM transactions"
+        if where_sql:
+            query += f" WHERE {where_sql}"
+        if sort_by:
+            query += f" ORDER BY {sort_by} {'DESC' if params['sort_direction'].lower() == 'desc' else 'ASC'}"
+
+        column_types = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(transactions)").fetchall()}
+        cursor.execute(query, query_params)
+        columns = [d[0] for d in cursor.description]
+
+        num_files = 1
+        if rows_per_file and total_rows > rows_per_file:
+            num_files = (total_rows + rows_per_file - 1) // rows_per_file
+        base_path = os.path.splitext(params["export_path"])[0]
+
+        progress = {"rows_written": 0, "last_report": 0}
+        if job is not None:
+            with export_jobs_lock:
+                job["total_rows"] = total_rows
+
+        def on_rows(count):
+            progress["rows_written"] += count
+            if job is not None:
+                with export_jobs_lock:
+                    job["rows_written"] = progress["rows_written"]
+            # 每写出约5%打印一次进度
+            if total_rows and progress["rows_written"] - progress["last_report"] >= max(total_rows // 20, 1):
+                progress["last_report"] = progress["rows_written"]
+                log_progress(progress["rows_written"] / total_rows * 100, label="Export progress")
+
+        export_files = []
+        for i in range(num_files):
+            file_name = params["export_path"] if num_files == 1 else f"{base_path}_{i + 1}.{export_format}"
+            # 最后一个文件读到游标结束，计数后新写入的行也会被导出
+            limit = rows_per_file if rows_per_file and i < num_files - 1 else None
+            batches = _iter_cursor_batches(cursor, limit)
+            if export_format == "xlsx":
+                _write_xlsx_file(file_name, columns, batches, on_rows)
+            elif export_format == "csv":
+                _write_csv_file(file_name, columns, batches, on_rows)
+            else:
+                _write_parquet_file(file_name, columns, column_types, batches, on_rows)
+            export_files.append(file_name)
+            if job is not None:
+                with export_jobs_lock:
+                    job["export_files"] = list(export_files)
+
+        record_stage("export", time.perf_counter() - started, progress["rows_written"], format=export_format)
+        logger.info("导出完成: %d 行, %d 个文件", progress["rows_written"], len(export_files))
+        return {
+            "export_files": export_files,
+            "total_rows": progress["rows_written"],
+            "metrics": collect_job_metrics(metrics_before, parse_before, started)
+        }
+    finally:
         conn.close()
+
+
+def _run_export_job(job):
+    """在后台线程中执行导出任务"""
+    with export_jobs_lock:
+        job["status"] = "running"
+        job["started_at"] = time.time()
+    try:
+        result = export_query(job["params"], job)
+        status, error = "completed", None
+    except Exception as e:
+        logger.exception("导出任务失败: %s", e)
+        result, status, error = None, "failed", str(e)
+    with export_jobs_lock:
+        job["status"] = status
+        job["error"] = error
+        if result:
+            job["export_files"] = result["export_files"]
+            job["metrics"] = result["metrics"]
+        job["finished_at"] = time.time()
+
+
+def submit_export_job(params):
+    """创建导出任务并提交到后台执行器，返回任务"""
+    global export_job_executor
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "params": params,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "total_rows": None,
+        "rows_written": 0,
+        "export_files": [],
+        "error": None,
+        "metrics": None
+    }
+
+    with export_jobs_lock:
+        # 清理最早结束的任务
+        finished = [j for j in export_jobs.values() if j["finished_at"]]
+        finished.sort(key=lambda j: j["finished_at"])
+        for old_job in finished[:max(len(finished) - MAX_FINISHED_JOBS + 1, 0)]:
+            del export_jobs[old_job["id"]]
+        export_jobs[job["id"]] = job
+
+        if export_job_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            export_job_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-job")
+
+    export_job_executor.submit(_run_export_job, job)
+    return job
+
+
+def export_job_to_dict(job):
+    """生成导出任务状态的JSON表示"""
+    with export_jobs_lock:
+        result = {key: job[key] for key in (
+            "status", "created_at", "started_at", "finished_at",
+            "total_rows", "rows_written", "export_files", "error", "metrics"
+        )}
+    result["job_id"] = job["id"]
+    result["format"] = job["params"]["format"]
+    result["progress"] = round(result["rows_written"] / result["total_rows"] * 100, 2) if result["total_rows"] else None
+    return result
+#---------------------------------
+
+
+@app.route('/api/export-excel', methods=['POST'])
+def export_excel():
+    """
+    Export query results to xlsx, CSV or Parquet
     
+    行从数据库游标中流式写出，内存占用与导出行数无关。background为true时作为后台任务运行，
+    通过 /api/export-jobs/<job_id> 查询进度。
+    """
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    params, error = parse_export_request(request.json)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    if request.json.get('background'):
+        job = submit_export_job(params)
+        return jsonify({"status": "success", "job_id": job["id"], "job_status": job["status"]})
+
+    try:
+        result = export_query(params)
         return jsonify({
             "status": "success",
-            "tables": tables,
-            "errors": errors
+            "message": f"Data exported successfully to {len(result['export_files'])} file(s)",
+            "export_files": result["export_files"],
+            "total_rows": result["total_rows"],
+            "metrics": result["metrics"]
         })
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e), "traceback": traceback.format_exc()}), 500
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/rejected-rows', methods=['POST'])
-def get_rejected_rows():
-    """Get rejected rows that need manual verification"""
+
+@app.route('/api/export-jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Get progress of a background export: rows written, total rows and files written so far"""
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+        
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": f"Job '{job_id}' not found"}), 404
+    return jsonify({"status": "success", "job": export_job_to_dict(job)})
+
+
+@app.route('/api/database-stats', methods=['POST'])
+def get_database_stats():
+    """
+    Get statistics about the database
+    
+    统计从触发器维护的汇总表读取，不再扫描transactions；旧版数据库没有汇总表或传入recompute: true时
+    借用写连接完整重算一次。
+    """
     # 验证请求
     validation = verify_request()
     if validation:
@@ -1340,301 +5845,88 @@ def get_rejected_rows():
         
     data = request.json
     db_path = data.get('db_path')
-    page = data.get('page', 1)
-    page_size = data.get('page_size', 100)
+    recompute = bool(data.get('recompute'))
 
     if not db_path:
         return jsonify({"status": "error", "message": "Missing database path"}), 400
 
-    try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        # 增加调试信息
-        print(f"查询被拒绝行：数据库={db_path}, 页码={page}, 每页={page_size}", file=sys.stderr, flush=True)
-        
-        # 检查表是否存在
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rejected_rows'")
-        if not cursor.fetchone():
-            print("错误: rejected_rows表不存在!", file=sys.stderr, flush=True)
-            return jsonify({
-                "status": "error", 
-                "message": "rejected_rows表不存在，可能数据库结构有问题"
-            }), 500
-
-        # 直接检查表中数据
-        cursor.execute("SELECT COUNT(*) FROM rejected_rows")
-        total_count_result = cursor.fetchone()
-        if not total_count_result:
-            print("警告: COUNT查询未返回结果", file=sys.stderr, flush=True)
-            total_count = 0
-        else:
-            total_count = total_count_result[0]
-            
-        print(f"rejected_rows表中有 {total_count} 行数据", file=sys.stderr, flush=True)
-
-        # 获取分页结果
-        offset = (page - 1) * page_size
-        try:
-            cursor.execute(f"SELECT * FROM rejected_rows LIMIT {page_size} OFFSET {offset}")
-            rows = cursor.fetchall()
-            print(f"查询返回 {len(rows)} 行数据", file=sys.stderr, flush=True)
-        except sqlite3.Error as e:
-            print(f"查询rejected_rows时发生SQLite错误: {str(e)}", file=sys.stderr, flush=True)
-            return jsonify({"status": "error", "message": f"数据库查询错误: {str(e)}"}), 500
-
-        # 转换为字典列表
-        results = []
-        for row in rows:
-            row_dict = {key: row[key] for key in row.keys()}
-            
-            # 解析raw_data JSON，处理特殊情况
-            if 'raw_data' in row_dict and row_dict['raw_data']:
-                try:
-                    # 处理可能存在的特殊字符串值
-                    raw_data_str = row_dict['raw_data']
-                    if isinstance(raw_data_str, str):
-                        # 预处理可能导致问题的值
-                        raw_data_str = (raw_data_str
-                            .replace(': NaN,', ': "NaN",')
-                            .replace(': Infinity,', ': "Infinity",')
-                            .replace(': -Infinity,', ': "-Infinity",')
-                            .replace(': NaN}', ': "NaN"}')
-                            .replace(': Infinity}', ': "Infinity"}')
-                            .replace(': -Infinity}', ': "-Infinity"}'))
-                        
-                        try:
-                            # 尝试解析处理后的JSON
-                            row_dict['raw_data'] = json.loads(raw_data_str)
-                        except json.JSONDecodeError as json_err:
-                            # 如果仍然失败，记录错误并保留原始字符串
-                            print(f"警告: JSON解析失败 (ID={row_dict.get('id')}): {str(json_err)}", 
-                                file=sys.stderr, flush=True)
-                            # 不做任何修改，保留原始字符串
-                            # 但确保前端能安全处理
-                            # 在这里我们确保字符串不会导致前端JSON解析错误
-                            row_dict['raw_data'] = {"原始数据无法解析": raw_data_str[:100] + "..."}
-                except Exception as e:
-                    print(f"处理raw_data时出错: {str(e)}", file=sys.stderr, flush=True)
-                    row_dict['raw_data'] = {"错误": f"数据处理错误: {str(e)}"}
-                    
-            results.append(row_dict)
+    try:
+        start_time = time.time()
+        conn = get_connection(db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_summary'")
+        has_stats = cursor.fetchone() is not None
 
+        recompute_info = None
+        if recompute or not has_stats:
+            conn.close()
+            conn = get_connection(db_path, write=True)
+            cursor = conn.cursor()
+            ensure_rejected_storage(cursor)
+            conn.commit()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_summary'")
+            if cursor.fetchone() and recompute:
+                recompute_info = recompute_stats(conn)
+            else:
+                ensure_stats_tables(conn)
+                recompute_info = {"recomputed": True}
+
+        stats = read_database_stats(cursor)
         conn.close()
 
         return jsonify({
             "status": "success",
-            "total_count": total_count,
-            "page": page,
-            "page_size": page_size,
-            "results": results
+            **stats,
+            "recomputed": bool(recompute_info),
+            "elapsed_ms": round((time.time() - start_time) * 1000, 2)
         })
     except Exception as e:
-        print(f"获取rejected_rows时发生错误: {str(e)}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/process-rejected-row', methods=['POST'])
-def process_rejected_row():
-    """Process a manually fixed rejected row with simplified logic"""
+
+@app.route('/api/indexes', methods=['POST'])
+def get_indexes():
+    """List indexes, recorded filter/sort column usage and suggested indexes"""
     # 验证请求
     validation = verify_request()
     if validation:
         return jsonify(validation[0]), validation[1]
         
     data = request.json
-    print(f"接收到处理请求: {data}", file=sys.stderr, flush=True)
-    
     db_path = data.get('db_path')
-    row_id = data.get('row_id')
-    fixed_data = data.get('fixed_data', {})
-    action = data.get('action', 'save')  # 'save' or 'delete'
-    user_mappings = data.get('user_mappings', {})  # 从前端获取映射关系
-    
-    if not db_path or row_id is None:
-        return jsonify({"status": "error", "message": "Missing database path or row ID"}), 400
+
+    if not db_path:
+        return jsonify({"status": "error", "message": "Missing database path"}), 400
 
     try:
-        conn = sqlite3.connect(db_path)
+        conn = get_connection(db_path)
         cursor = conn.cursor()
+        indexes = (list_indexes(cursor, "transactions") + list_indexes(cursor, "rejected_raw_rows")
+                   + list_indexes(cursor, "rejected_cells"))
+        suggestions = suggest_indexes(cursor, db_path, data.get('min_uses', INDEX_SUGGEST_MIN_USES))
+        conn.close()
 
-        if action == 'delete':
-            # Delete the rejected row
-            cursor.execute("DELETE FROM rejected_rows WHERE id = ?", (row_id,))
-            conn.commit()
-            conn.close()
-            return jsonify({"status": "success", "message": f"Rejected row {row_id} deleted successfully"})
-            
-        # 获取被拒绝的行信息
-        cursor.execute("SELECT * FROM rejected_rows WHERE id = ?", (row_id,))
-        row = cursor.fetchone()
-        if not row:
-            return jsonify({"status": "error", "message": f"Rejected row {row_id} not found"}), 404
-            
-        # 从SQLite结果创建字典
-        row_dict = {}
-        description = cursor.description or []
-        for i, col in enumerate(description):
-            row_dict[col[0]] = row[i]
-            
-        # 提取关键信息
-        source_file = fixed_data.get("source_file") or row_dict.get("source_file")
-        row_number = str(fixed_data.get("row_number") or row_dict.get("row_number") or "1")
-        column_name = row_dict.get('column_name')  # 原始列名
-        target_column = row_dict.get('target_column')  # 目标列名
-        current_fixing_field = target_column if target_column else column_name  # 当前修复的字段
-        
-        print(f"处理文件: {source_file}, 行号: {row_number}, 修复字段: {current_fixing_field}", 
-              file=sys.stderr, flush=True)
-        print(f"用户映射关系: {user_mappings}", file=sys.stderr, flush=True)
+        with column_usage_lock:
+            usage = column_usage.get(os.path.abspath(db_path), {})
+            usage = {column: dict(counts) for column, counts in usage.items()}
 
-        # 查找是否存在现有行
-        cursor.execute(
-            "SELECT * FROM transactions WHERE source_file = ? AND row_number = ?", 
-            (source_file, row_number)
-        )
-        existing_row = cursor.fetchone()
-        
-        if existing_row:
-            # 如果行已存在，仅更新用户修改的字段
-            print(f"找到现有行，仅更新修改的字段", file=sys.stderr, flush=True)
-            
-            # 更新用户修改的字段
-            for field, value in fixed_data.items():
-                # 跳过标识字段
-                if field in ["source_file", "row_number"]:
-                    continue
-                    
-                # 只处理当前修复的字段和ID字段
-                if field == current_fixing_field or field == "ID":
-                    # 处理空值和NaN
-                    if value is None or value == '' or value == 'NaN':
-                        cursor.execute(
-                            f"UPDATE transactions SET {field} = NULL WHERE source_file = ? AND row_number = ?",
-                            (source_file, row_number)
-                        )
-                        print(f"将字段 {field} 更新为NULL", file=sys.stderr, flush=True)
-                    else:
-                        # 特殊处理ID字段，确保以字符串形式存储
-                        if field == "ID":
-                            value = str(value)
-                            
-                        cursor.execute(
-                            f"UPDATE transactions SET {field} = ? WHERE source_file = ? AND row_number = ?",
-                            (value, source_file, row_number)
-                        )
-                        print(f"更新字段: {field} = {value}", file=sys.stderr, flush=True)
-        else:
-            # 如果行不存在，需要根据映射关系从原始数据创建新行
-            print(f"行不存在，创建新行", file=sys.stderr, flush=True)
-            
-            # 解析原始数据
-            original_data = {}
-            try:
-                raw_data_str = row_dict.get('raw_data')
-                if raw_data_str:
-                    # 处理可能的JSON格式问题
-                    if isinstance(raw_data_str, str):
-                        raw_data_str = (raw_data_str
-                            .replace(': NaN,', ': null,')
-                            .replace(': Infinity,', ': "Infinity",')
-                            .replace(': -Infinity,', ': "-Infinity",')
-                            .replace(': NaN}', ': null}')
-                            .replace(': Infinity}', ': "Infinity"}')
-                            .replace(': -Infinity}', ': "-Infinity"}'))
-                    
-                    original_data = json.loads(raw_data_str)
-                    print(f"成功解析原始数据: {len(original_data)} 个字段", file=sys.stderr, flush=True)
-            except Exception as e:
-                print(f"解析原始数据失败: {str(e)}", file=sys.stderr, flush=True)
-                
-            # 创建新行数据
-            new_row = {
-                "source_file": source_file,
-                "row_number": row_number
-            }
-            
-            # 应用用户映射关系，从原始数据填充字段
-            template_name = data.get('template_name')
-            current_template = templates.get(template_name, templates.get(next(iter(templates))))
-            
-            for orig_col, target_col in user_mappings.items():
-                if not target_col or orig_col not in original_data:
-                    continue  # 跳过未映射的列或原始数据中不存在的列
-                
-                try:
-                    # 获取字段类型
-                    field_type = "text"  # 默认类型
-                    if target_col in current_template:
-                        field_type = current_template[target_col]["type"]
-                    
-                    # 转换值
-                    value = original_data[orig_col]
-                    if value is not None:
-                        converted_value = convert_value(value, field_type)
-                        if converted_value is not None:
-                            new_row[target_col] = converted_value
-                            print(f"从原始数据映射: {orig_col} -> {target_col} = {converted_value}", file=sys.stderr, flush=True)
-                except Exception as e:
-                    print(f"转换字段 {orig_col} 值失败: {str(e)}", file=sys.stderr, flush=True)
-            
-            # 应用用户修改的字段值，这些优先级更高
-            for field, value in fixed_data.items():
-                if field in ["source_file", "row_number"]:
-                    continue  # 已经处理过
-                
-                if value is not None and value != 'NaN' and value != '':
-                    new_row[field] = value
-                    print(f"使用用户提供的值: {field} = {value}", file=sys.stderr, flush=True)
-                elif field == current_fixing_field:
-                    # 如果是当前修复的字段，即使为空也设置为NULL
-                    new_row[field] = None
-                    print(f"设置字段为NULL: {field}", file=sys.stderr, flush=True)
-            
-            # 插入新行
-            if len(new_row) > 2:  # 确保至少有一个非标识字段
-                columns = list(new_row.keys())
-                values = list(new_row.values())
-                placeholders = ", ".join(["?" for _ in columns])
-                
-                try:
-                    cursor.execute(
-                        f"INSERT INTO transactions ({', '.join(columns)}) VALUES ({placeholders})",
-                        values
-                    )
-                    print(f"成功插入新行: {columns} = {values}", file=sys.stderr, flush=True)
-                except sqlite3.Error as e:
-                    print(f"插入新行失败: {str(e)}", file=sys.stderr, flush=True)
-                    raise e
-            else:
-                print("警告: 没有足够的数据创建新行", file=sys.stderr, flush=True)
-        
-        # 删除已处理的拒绝行
-        cursor.execute("DELETE FROM rejected_rows WHERE id = ?", (row_id,))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({
             "status": "success",
-            "message": f"Rejected row {row_id} processed successfully"
+            "indexes": indexes,
+            "column_usage": usage,
+            "suggestions": suggestions
         })
     except Exception as e:
-        print(f"处理拒绝行失败: {str(e)}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
-        
-        try:
-            if 'conn' in locals() and conn:
-                conn.close()
-        except:
-            pass
-            
         return jsonify({"status": "error", "message": str(e)}), 500
-        
-@app.route('/api/export-excel', methods=['POST'])
-def export_excel():
-    """Export query results to Excel"""
+
+
+@app.route('/api/indexes/build', methods=['POST'])
+def build_indexes():
+    """
+    Build indexes and report build time per index
+    
+    不传columns时创建默认索引和所有建议索引；传入columns（列名列表）时为每列创建单列索引。
+    """
     # 验证请求
     validation = verify_request()
     if validation:
@@ -1642,87 +5934,46 @@ def export_excel():
         
     data = request.json
     db_path = data.get('db_path')
-    export_path = data.get('export_path')
-    filters = data.get('filters', [])
-    sort_by = data.get('sort_by', None)
-    sort_direction = data.get('sort_direction', 'asc')
+    columns = data.get('columns')
 
-    if not db_path or not export_path:
-        return jsonify({"status": "error", "message": "Missing database path or export path"}), 400
+    if not db_path:
+        return jsonify({"status": "error", "message": "Missing database path"}), 400
 
     try:
-        conn = sqlite3.connect(db_path)
-
-        # Build query
-        query = "SELECT * FROM transactions"
-        params = []
-
-        # Add filters
-        if filters:
-            filter_conditions = []
-            for f in filters:
-                column = f.get('column')
-                operator = f.get('operator', '=')
-                value = f.get('value')
-
-                if column and value is not None:
-                    if operator == 'contains':
-                        filter_conditions.append(f"{column} LIKE ?")
-                        params.append(f"%{value}%")
-                    elif operator == 'startswith':
-                        filter_conditions.append(f"{column} LIKE ?")
-                        params.append(f"{value}%")
-                    elif operator == 'endswith':
-                        filter_conditions.append(f"{column} LIKE ?")
-                        params.append(f"%{value}")
-                    else:
-                        filter_conditions.append(f"{column} {operator} ?")
-                        params.append(value)
-
-            if filter_conditions:
-                query += " WHERE " + " AND ".join(filter_conditions)
-
-        # Add sorting
-        if sort_by:
-            query += f" ORDER BY {sort_by} {'DESC' if sort_direction.lower() == 'desc' else 'ASC'}"
-
-        # Execute query and load into DataFrame
-        df = pd.read_sql_query(query, conn, params=params)
-
-        # Split into multiple files if necessary (max 20,000 rows per file)
-        max_rows_per_file = 20000
-        num_files = (len(df) + max_rows_per_file - 1) // max_rows_per_file
-
-        export_files = []
-
-        if num_files > 1:
-            # Split into multiple files
-            for i in range(num_files):
-                start_idx = i * max_rows_per_file
-                end_idx = min((i + 1) * max_rows_per_file, len(df))
-
-                file_name = f"{os.path.splitext(export_path)[0]}_{i + 1}.xlsx"
-                df.iloc[start_idx:end_idx].to_excel(file_name, index=False)
-                export_files.append(file_name)
+        conn = get_connection(db_path, write=True)
+        start_time = time.time()
+        if columns:
+            results = []
+            for column in columns:
+                try:
+                    results.append(create_index(conn, "transactions", [column]))
+                except ValueError as e:
+                    conn.close()
+                    return jsonify({"status": "error", "message": str(e)}), 400
         else:
-            # Single file
-            df.to_excel(export_path, index=False)
-            export_files.append(export_path)
-
+            results = ensure_default_indexes(conn)
+            for suggestion in suggest_indexes(conn.cursor(), db_path):
+                results.append(create_index(conn, suggestion["table"], suggestion["columns"]))
+        if any(r.get("created") for r in results):
+            conn.execute("PRAGMA optimize")
         conn.close()
 
         return jsonify({
             "status": "success",
-            "message": f"Data exported successfully to {len(export_files)} file(s)",
-            "export_files": export_files
+            "indexes": results,
+            "build_seconds": round(time.time() - start_time, 3)
         })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-@app.route('/api/database-stats', methods=['POST'])
-def get_database_stats():
-    """Get statistics about the database"""
+@app.route('/api/fts-index', methods=['POST'])
+def manage_fts_index():
+    """
+    Build, drop or inspect the full-text index over 附言/账户名/对手账户名
+    
+    action: "build"（默认）、"drop" 或 "status"
+    """
     # 验证请求
     validation = verify_request()
     if validation:
@@ -1730,51 +5981,111 @@ def get_database_stats():
         
     data = request.json
     db_path = data.get('db_path')
+    action = data.get('action', 'build')
 
     if not db_path:
         return jsonify({"status": "error", "message": "Missing database path"}), 400
+    if action not in ("build", "drop", "status"):
+        return jsonify({"status": "error", "message": f"Unknown action '{action}'"}), 400
 
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Get row counts
-        cursor.execute("SELECT COUNT(*) FROM transactions")
-        total_rows = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM rejected_rows")
-        rejected_rows = cursor.fetchone()[0]
+        conn = get_connection(db_path, write=True)
+        result = {"status": "success", "columns": FTS_TEXT_COLUMNS}
+        if action == "build":
+            try:
+                result.update(create_fts_index(conn))
+            except ValueError as e:
+                conn.close()
+                return jsonify({"status": "error", "message": str(e)}), 400
+        elif action == "drop":
+            drop_fts_index(conn)
+        result["enabled"] = has_fts_index(conn.cursor())
+        result["supported"] = fts_supported(conn)
+        conn.close()
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        # Get unique source files
-        cursor.execute("SELECT COUNT(DISTINCT source_file) FROM transactions")
-        unique_files = cursor.fetchone()[0]
 
-        # Get date range
-        cursor.execute("SELECT MIN(记账日期), MAX(记账日期) FROM transactions")
-        date_range = cursor.fetchone()
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Per-stage timing metrics since startup (or the last reset)
 
-        # Get top 5 accounts by transaction count
-        cursor.execute("""
-        SELECT 账号, COUNT(*) as count
-        FROM transactions
-        GROUP BY 账号
-        ORDER BY count DESC
-        LIMIT 5
-        """)
-        top_accounts = [{"账号": row[0], "count": row[1]} for row in cursor.fetchall()]
+    format=prometheus 返回Prometheus文本格式，默认返回JSON；reset=true 读取后清零
+    """
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
 
-        conn.close()
+    from simple_date_utils import get_cache_stats
 
-        return jsonify({
+    snapshot = metrics_snapshot()
+    parse_stats = get_parse_stats()
+    if request.args.get('format') == 'prometheus':
+        response = Response(format_prometheus_metrics(snapshot, parse_stats),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+    else:
+        response = jsonify({
             "status": "success",
-            "total_rows": total_rows,
-            "rejected_rows": rejected_rows,
-            "unique_files": unique_files,
-            "date_range": date_range,
-            "top_accounts": top_accounts
+            "uptime_seconds": round(time.time() - metrics_started_at, 3),
+            "stages": format_metrics(snapshot),
+            "parse": parse_stats,
+            "parse_cache": get_cache_stats(),
+            "connection_pools": connection_pool_stats()
         })
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+
+    if request.args.get('reset', '').lower() == 'true':
+        reset_metrics()
+    return response
+
+
+@app.route('/api/connection-pools', methods=['GET'])
+def get_connection_pools():
+    """数据库连接池统计"""
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+    return jsonify({"status": "success", **connection_pool_stats()})
+
+
+@app.route('/api/connection-pools/close', methods=['POST'])
+def close_connection_pools():
+    """关闭数据库（不指定db_path时为全部数据库）的空闲连接，便于移动或删除数据库文件"""
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+    data = request.json or {}
+    closed = close_database_connections(data.get('db_path'))
+    return jsonify({"status": "success", "closed": closed})
+
+
+@app.route('/api/log-level', methods=['GET', 'POST'])
+def manage_log_level():
+    """
+    Get or change the backend log level
+
+    POST {"level": "DEBUG"} 打开逐行诊断；新启动的工作进程通过环境变量继承该级别
+    """
+    # 验证请求
+    validation = verify_request()
+    if validation:
+        return jsonify(validation[0]), validation[1]
+
+    if request.method == 'POST':
+        level = str((request.json or {}).get('level', '')).upper()
+        if level not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+            return jsonify({"status": "error", "message": f"Unknown log level '{level}'"}), 400
+        logger.setLevel(level)
+        os.environ['BACKEND_LOG_LEVEL'] = level
+
+    return jsonify({
+        "status": "success",
+        "level": logging.getLevelName(logger.level),
+        "log_file": LOG_FILE,
+        "row_log_limit": ROW_LOG_LIMIT
+    })
 
 
 @app.route('/api/update-synonyms', methods=['POST'])
@@ -1800,10 +6111,13 @@ def update_synonyms():
         return jsonify({"status": "error", "message": f"Field '{field_name}' not found in template"}), 404
 
     templates[template_name][field_name]["synonyms"] = synonyms
+    bump_template_version(template_name)
+    persist_template(template_name)
 
     return jsonify({
         "status": "success",
-        "message": f"Synonyms updated for field '{field_name}' in template '{template_name}'"
+        "message": f"Synonyms updated for field '{field_name}' in template '{template_name}'",
+        "version": template_versions[template_name]
     })
 
 # 新增端口检查和服务启动函数
@@ -1825,6 +6139,10 @@ def find_available_port(start_port, max_attempts=10):
     return start_port
 
 if __name__ == '__main__':
+    # 打包后的程序在Windows上使用进程池时需要
+    import multiprocessing
+    multiprocessing.freeze_support()
+    
     # 检查是否有开发模式参数
     if len(sys.argv) > 1 and sys.argv[1].lower() == 'dev':
         print("启动开发模式，跳过验证...")
@@ -0,0 +1,111 @@
+"""
+日期/时间解析基准测试：对比parse_date/parse_time逐值解析（原有路径）和parse_date_values/parse_time_values整列解析
+
+两条路径的结果必须逐值一致，包括第60秒、2月30日、24点等边界值；不一致时以非零状态退出。
+
+用法: python benchmarks/bench_date_parsing.py [行数] [重复次数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simple_date_utils import (  # noqa: E402
+    clear_cache, parse_date, parse_date_values, parse_time, parse_time_values,
+)
+
+# 快速路径格式形状相同、但strptime不接受或pandas会进位的值
+EDGE_DATES = [
+    "2021-12-31 23:59:60", "2021/12/31 23:59:60", "2024-02-29 12:00:60",
+    "2024-02-30", "2023-02-29", "2024/13/01", "2024-00-10", "20240230", "20241301",
+    "2024-01-01 24:00:00", "2024-01-01 23:60:00", "0999-01-01",
+]
+EDGE_TIMES = [
+    "19:42:60", "23:59:60", "00:00:60", "235960", "196000", "240000",
+    "24:00:00", "23:60:00", "24:00", "12:60", "99:99",
+]
+
+
+def generate_dates(count, seed=0):
+    """生成以'%Y-%m-%d %H:%M:%S'为主、混有其他格式和边界值的日期字符串"""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(count):
+        style = rng.random()
+        year, month, day = rng.randint(1990, 2030), rng.randint(1, 12), rng.randint(1, 28)
+        hour, minute, second = rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59)
+        if style < 0.9:
+            values.append(f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}")
+        elif style < 0.93:
+            values.append(f"{year:04d}/{month:02d}/{day:02d}")
+        elif style < 0.96:
+            values.append(f"{day:02d}.{month:02d}.{year:04d}")
+        else:
+            values.append(rng.choice(EDGE_DATES))
+    return values
+
+
+def generate_times(count, seed=0):
+    """生成以'%H:%M:%S'为主、混有其他格式和边界值的时间字符串"""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(count):
+        style = rng.random()
+        hour, minute, second = rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59)
+        if style < 0.9:
+            values.append(f"{hour:02d}:{minute:02d}:{second:02d}")
+        elif style < 0.93:
+            values.append(f"{hour:02d}{minute:02d}{second:02d}")
+        elif style < 0.96:
+            values.append(f"{hour}:{minute:02d} {'AM' if hour < 12 else 'PM'}")
+        else:
+            values.append(rng.choice(EDGE_TIMES))
+    return values
+
+
+def best_of(func, values, repeat):
+    """重复执行取最短耗时（每次清空缓存，避免逐值路径受益于上一轮的缓存）"""
+    best = None
+    for _ in range(repeat):
+        clear_cache()
+        start = time.perf_counter()
+        result = func(values)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare(label, values, single, vectorized, repeat):
+    """对比两条路径，返回结果不一致的值"""
+    single_time, single_results = best_of(lambda vs: [single(v) for v in vs], values, repeat)
+    fast_time, fast_results = best_of(vectorized, values, repeat)
+    mismatches = sorted({
+        (value, a, b) for value, a, b in zip(values, single_results, fast_results) if a != b
+    })
+
+    count = len(values)
+    print(f"[{label}] 行数: {count}, 重复: {repeat}")
+    print(f"  逐值解析: {single_time:.3f}s ({count / single_time:,.0f} 行/秒), "
+          f"成功 {sum(r is not None for r in single_results)}")
+    print(f"  整列解析: {fast_time:.3f}s ({count / fast_time:,.0f} 行/秒), "
+          f"成功 {sum(r is not None for r in fast_results)}")
+    print(f"  加速比: {single_time / fast_time:.1f}x, 结果不一致: {len(mismatches)}")
+    for value, a, b in mismatches:
+        print(f"    {value!r}: 逐值 {a!r}, 整列 {b!r}")
+    return mismatches
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    mismatches = compare("日期", generate_dates(count), parse_date, parse_date_values, repeat)
+    mismatches += compare("时间", generate_times(count), parse_time, parse_time_values, repeat)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
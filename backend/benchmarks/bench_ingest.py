@@ -0,0 +1,271 @@
+"""
+导入流程基准测试：用合成流水分别计时读取、转换、写入、建索引、导出各阶段，再计时完整合并
+
+各阶段在同一遍流式处理中分别累计耗时，读取方式与merge_files一致（小文件整体读取，大文件分块读取）；
+完整合并直接调用merge_files。结果写入JSON文件，传入--compare时与之前的结果逐阶段对比。
+
+用法: python benchmarks/bench_ingest.py [--rows 10000,100000] [--dirty-rate 0.01] [--seed 0]
+                                       [--work-dir 目录] [--output 结果.json] [--compare 基准.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd  # noqa: E402
+
+import backend  # noqa: E402
+from synthetic_statements import DEFAULT_ROWS_PER_FILE, generate_statements  # noqa: E402
+
+STAGES = ["read", "convert", "insert", "index", "export"]
+
+
+def _fresh_db(path):
+    backend.close_database_connections(path)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    backend.create_database(path)
+
+
+def _iter_chunks(path, read_stats):
+    """与_iter_file_batches相同的读取方式：小文件整体读取，大文件分块读取"""
+    if os.path.getsize(path) <= backend.LARGE_FILE_THRESHOLD:
+        df = pd.read_excel(path)
+        read_stats["total_rows"] = len(df)
+        yield df, 0
+        return
+    yield from backend.iter_excel_chunks(path, chunk_size=backend.LARGE_FILE_CHUNK_SIZE, stats=read_stats)
+
+
+def run_stages(files, db_path, export_dir, profile, export_formats):
+    """
+    分阶段计时：读取和转换按块交替进行，分别累计；每块转换后立即写入
+
+    Returns:
+        dict: 各阶段耗时（秒）和行数统计
+    """
+    _fresh_db(db_path)
+    timings = dict.fromkeys(STAGES, 0.0)
+    counts = {"rows_read": 0, "inserted_rows": 0, "rejected_rows": 0, "duplicate_rows": 0, "failed_rows": 0}
+
+    conn = sqlite3.connect(db_path, timeout=60)
+    backend.apply_ingest_profile(conn, profile)
+    backend.suspend_stats_sync(conn)
+    cursor = conn.cursor()
+    for info in files:
+        plan = backend.compile_conversion_plan(info["path"], {os.path.basename(info["path"]): info["mapping"]})
+        read_stats = {}
+        chunks = _iter_chunks(info["path"], read_stats)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            timings["read"] += time.perf_counter() - start
+            if chunk is None:
+                break
+            df, start_row = chunk
+
+            start = time.perf_counter()
+            results = backend.process_dataframe_chunk(df, plan, start_row)
+            timings["convert"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            insert_result = backend.insert_data_to_db(conn, cursor, results["mapped_data"], results["rejected_rows"])
+            conn.commit()
+            timings["insert"] += time.perf_counter() - start
+
+            counts["inserted_rows"] += insert_result["inserted"]
+            counts["duplicate_rows"] += insert_result["duplicates"]
+            counts["failed_rows"] += insert_result["failed"]
+            counts["rejected_rows"] += len(results["rejected_rows"])
+        counts["rows_read"] += read_stats.get("total_rows", 0)
+
+    start = time.perf_counter()
+    backend.ensure_default_indexes(conn)
+    backend.resume_stats_sync(conn)
+    conn.commit()
+    timings["index"] = time.perf_counter() - start
+    backend.restore_durable_settings(conn)
+    conn.close()
+
+    export_timings = {}
+    for export_format in export_formats:
+        params, error = backend.parse_export_request({
+            "db_path": db_path,
+            "export_path": os.path.join(export_dir, f"export.{export_format}"),
+            "format": export_format,
+        })
+        if error:
+            raise ValueError(error[0]["message"])
+        start = time.perf_counter()
+        backend.export_query(params)
+        export_timings[export_format] = round(time.perf_counter() - start, 4)
+    timings["export"] = sum(export_timings.values())
+
+    return {
+        "seconds": {stage: round(value, 4) for stage, value in timings.items()},
+        "export_seconds": export_timings,
+        **counts,
+    }
+
+
+def run_end_to_end(files, db_path, profile, workers):
+    """完整调用merge_files，计时从建库到索引完成"""
+    backend.close_database_connections(db_path)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    params, error = backend.parse_merge_request({
+        "file_paths": [info["path"] for info in files],
+        "db_path": db_path,
+        "column_mappings": {os.path.basename(info["path"]): info["mapping"] for info in files},
+        "ingest_profile": profile,
+        "parallel_workers": workers,
+    })
+    if error:
+        raise ValueError(error[0]["message"])
+    start = time.perf_counter()
+    result, status_code = backend.merge_files(params)
+    elapsed = time.perf_counter() - start
+    if status_code != 200:
+        raise RuntimeError(result.get("message"))
+    return {
+        "seconds": round(elapsed, 4),
+        "processed_rows": result["total_processed"],
+        "rejected_rows": result["total_rejected"],
+        "duplicate_rows": result["total_duplicates"],
+        "db_size_bytes": os.path.getsize(db_path),
+    }
+
+
+def environment_info():
+    """运行环境，便于比较不同机器或版本的结果"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "git_commit": commit,
+    }
+
+
+def compare_results(current, baseline):
+    """按行数逐阶段对比两次结果，比值小于1表示变快"""
+    baseline_by_rows = {r["rows"]: r for r in baseline.get("results", [])}
+    for result in current["results"]:
+        base = baseline_by_rows.get(result["rows"])
+        if not base:
+            print(f"{result['rows']} 行: 基准结果中没有相同行数的记录")
+            continue
+        print(f"{result['rows']} 行 (当前 / 基准):")
+        pairs = [(stage, result["stages"]["seconds"][stage], base["stages"]["seconds"].get(stage)) for stage in STAGES]
+        if "end_to_end" in result and "end_to_end" in base:
+            pairs.append(("end_to_end", result["end_to_end"]["seconds"], base["end_to_end"]["seconds"]))
+        for name, now, before in pairs:
+            if before:
+                print(f"  {name:<10} {now:9.3f}s / {before:9.3f}s  x{now / before:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入流程基准测试")
+    parser.add_argument("--rows", default="10000,100000", help="逗号分隔的行数，如 10000,1000000,5000000")
+    parser.add_argument("--dirty-rate", type=float, default=0.01, help="注入脏值的行比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rows-per-file", type=int, default=DEFAULT_ROWS_PER_FILE)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "bank_statement_bench"),
+                        help="合成文件、数据库和导出文件的目录，合成文件会被复用")
+    parser.add_argument("--profile", default=backend.DEFAULT_INGEST_PROFILE, choices=list(backend.SQLITE_INGEST_PROFILES))
+    parser.add_argument("--workers", type=int, default=1, help="完整合并的并行进程数")
+    parser.add_argument("--export-formats", default="csv", help="逗号分隔的导出格式：xlsx,csv,parquet")
+    parser.add_argument("--skip-e2e", action="store_true", help="只做分阶段计时")
+    parser.add_argument("--output", help="结果JSON路径，默认写入work-dir/results")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    parser.add_argument("--verbose", action="store_true", help="保留后端的INFO日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        backend.logger.setLevel(logging.WARNING)
+        backend.progress_logger.setLevel(logging.WARNING)
+
+    sizes = [int(value) for value in args.rows.split(",") if value.strip()]
+    export_formats = [value.strip() for value in args.export_formats.split(",") if value.strip()]
+    data_dir = os.path.join(args.work_dir, "data")
+    run_dir = os.path.join(args.work_dir, "run")
+    os.makedirs(run_dir, exist_ok=True)
+
+    report = {
+        "benchmark": "ingest",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment_info(),
+        "config": {
+            "rows": sizes,
+            "dirty_rate": args.dirty_rate,
+            "seed": args.seed,
+            "rows_per_file": args.rows_per_file,
+            "profile": args.profile,
+            "workers": args.workers,
+            "export_formats": export_formats,
+            "large_file_threshold": backend.LARGE_FILE_THRESHOLD,
+            "chunk_size": backend.LARGE_FILE_CHUNK_SIZE,
+        },
+        "results": [],
+    }
+
+    for rows in sizes:
+        start = time.perf_counter()
+        files = generate_statements(data_dir, rows, args.dirty_rate, args.seed, args.rows_per_file)
+        print(f"{rows} 行: {len(files)} 个文件, 准备耗时 {time.perf_counter() - start:.1f}s", flush=True)
+
+        stages = run_stages(files, os.path.join(run_dir, "stages.db"), run_dir, args.profile, export_formats)
+        result = {
+            "rows": rows,
+            "files": len(files),
+            "dirty_rows": sum(info["dirty_rows"] for info in files),
+            "stages": stages,
+            "rows_per_second": {
+                stage: round(rows / seconds) if seconds else None
+                for stage, seconds in stages["seconds"].items()
+            },
+        }
+        if not args.skip_e2e:
+            result["end_to_end"] = run_end_to_end(files, os.path.join(run_dir, "merge.db"), args.profile, args.workers)
+        report["results"].append(result)
+
+        seconds = stages["seconds"]
+        print("  " + ", ".join(f"{stage} {seconds[stage]:.3f}s" for stage in STAGES)
+              + (f", 完整合并 {result['end_to_end']['seconds']:.3f}s" if "end_to_end" in result else ""))
+        print(f"  写入 {stages['inserted_rows']} 行, 拒绝 {stages['rejected_rows']} 条, 注入脏行 {result['dirty_rows']}")
+
+    output = args.output or os.path.join(
+        args.work_dir, "results", f"ingest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_results(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+数字解析基准测试：对比Babel逐值解析（原有路径）和parse_number_values整列解析
+
+用法: python benchmarks/bench_number_parsing.py [行数] [重复次数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import _parse_float_with_babel  # noqa: E402
+from simple_number_utils import parse_number_values  # noqa: E402
+
+
+def generate_amounts(count, seed=0):
+    """生成混合格式的金额字符串（普通小数、千分位、负数、括号、百分比、借贷标记、全角）"""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(count):
+        amount = rng.uniform(-1000000, 1000000)
+        style = rng.random()
+        if style < 0.4:
+            values.append(f"{amount:.2f}")
+        elif style < 0.7:
+            values.append(f"{amount:,.2f}")
+        elif style < 0.8:
+            values.append(f"({abs(amount):,.2f})")
+        elif style < 0.85:
+            values.append(f"{abs(amount):,.2f} {'DR' if amount < 0 else 'CR'}")
+        elif style < 0.9:
+            values.append(f"{amount / 10000:.2f}%")
+        elif style < 0.95:
+            values.append(f"{amount:.2f}".translate(str.maketrans("0123456789.-", "０１２３４５６７８９．－")))
+        else:
+            values.append(str(int(amount)))
+    return values
+
+
+def babel_path(values):
+    """原有路径：每个值依次尝试en_US、zh_CN和手动清理，失败记为None"""
+    results = []
+    for value in values:
+        try:
+            results.append(_parse_float_with_babel(value))
+        except ValueError:
+            results.append(None)
+    return results
+
+
+def vectorized_path(values):
+    """新路径：整列解析，剩余值再交给Babel"""
+    results, unparsed = parse_number_values(values, "float")
+    for i in unparsed:
+        try:
+            results[i] = _parse_float_with_babel(values[i])
+        except ValueError:
+            results[i] = None
+    return results
+
+
+def best_of(func, values, repeat):
+    """重复执行取最短耗时"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(values)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    values = generate_amounts(count)
+
+    babel_time, babel_results = best_of(babel_path, values, repeat)
+    fast_time, fast_results = best_of(vectorized_path, values, repeat)
+
+    babel_parsed = sum(r is not None for r in babel_results)
+    fast_parsed = sum(r is not None for r in fast_results)
+    # 两条路径都能解析的值，结果必须一致（百分比按Decimal精确计算，允许末位误差）
+    disagreements = sum(
+        1 for a, b in zip(babel_results, fast_results)
+        if a is not None and b is not None and abs(a - b) > abs(a) * 1e-15
+    )
+
+    print(f"行数: {count}, 重复: {repeat}")
+    print(f"Babel逐值解析: {babel_time:.3f}s ({count / babel_time:,.0f} 行/秒), 成功 {babel_parsed}")
+    print(f"整列解析:      {fast_time:.3f}s ({count / fast_time:,.0f} 行/秒), 成功 {fast_parsed}")
+    print(f"加速比: {babel_time / fast_time:.1f}x, 结果不一致: {disagreements}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+合成银行流水生成器：按default_template的列结构生成确定性的Excel测试文件
+
+表头从各列的同义词中选取，并加入首尾空格、全角字符、大小写变化等噪声；每个文件有一种主要的
+日期/时间格式，少量行混入其他格式；金额带千分位、括号负数等写法；按dirty_rate注入无法转换的值。
+相同的行数、脏行比例和种子生成的文件内容完全一致。
+
+xlsx单个工作表最多约104万行，超过rows_per_file的行数拆分为多个文件。
+
+用法: python benchmarks/synthetic_statements.py 输出目录 [行数] [脏行比例] [种子]
+"""
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import default_template, _write_xlsx_file  # noqa: E402
+
+MAX_SHEET_ROWS = 1048575  # xlsx单个工作表的最大数据行数
+DEFAULT_ROWS_PER_FILE = 1000000
+WRITE_BATCH_ROWS = 10000
+
+# 每个文件的主要日期/时间格式，MIXED_FORMAT_RATE比例的行使用其他格式
+DATE_STYLES = ["%Y-%m-%d", "%Y%m%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "int"]
+TIME_STYLES = ["%H:%M:%S", "%H%M%S", "%H:%M"]
+MIXED_FORMAT_RATE = 0.1
+
+# 脏值：目标列 -> 无法转换的值
+DIRTY_VALUES = {
+    "记账日期": ["无效日期", "2024-13-45", "日期未知"],
+    "记账时间": ["25:61:99", "上午", "--"],
+    "交易金额": ["abc", "1.2.3", "金额待定"],
+    "余额": ["N/A余额", "#VALUE!", "1,2,3.4.5"],
+}
+
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨"
+GIVEN_NAMES = ["伟", "芳", "娜", "敏", "静", "强", "磊", "军", "洋", "勇", "艳", "杰"]
+COMPANY_SUFFIXES = ["有限公司", "贸易有限公司", "科技有限公司", "商店"]
+BANKS = ["中国工商银行", "中国建设银行", "中国农业银行", "中国银行", "招商银行"]
+BRANCHES = ["北京分行营业部", "上海浦东支行", "深圳南山支行", "杭州西湖支行", "成都高新支行"]
+CHANNELS = ["柜面", "网银", "手机银行", "ATM", "POS", "第三方支付"]
+MEMOS = ["工资", "货款", "转账", "消费", "还款", "利息", "手续费", "报销", "房租"]
+
+FULL_WIDTH = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz()",
+                           "ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ（）")
+
+
+def messy_headers(rng):
+    """
+    为每个标准列选取一个表头并加入噪声
+
+    Returns:
+        (headers, mapping): 表头列表（与default_template列顺序一致），表头 -> 目标列
+    """
+    headers = []
+    mapping = {}
+    for target, info in default_template.items():
+        header = rng.choice([target] + info["synonyms"])
+        style = rng.random()
+        if style < 0.2:
+            header = f" {header} "
+        elif style < 0.3:
+            header = header.translate(FULL_WIDTH)
+        elif style < 0.4:
+            header = header.upper()
+        elif style < 0.5:
+            header = f"{header}："
+        # 同一文件内表头不能重复
+        while header in mapping:
+            header = f"{header}_"
+        headers.append(header)
+        mapping[header] = target
+    return headers, mapping
+
+
+def _person(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2)))
+
+
+def _party(rng):
+    if rng.random() < 0.3:
+        return rng.choice(SURNAMES) + rng.choice(["华", "信", "达", "盛"]) + rng.choice(COMPANY_SUFFIXES)
+    return _person(rng)
+
+
+def _account(rng):
+    return "62" + "".join(str(rng.randint(0, 9)) for _ in range(17))
+
+
+def _format_date(day, style):
+    if style == "int":
+        return int(day.strftime("%Y%m%d"))
+    return day.strftime(style)
+
+
+def _format_time(seconds, style):
+    hour, rest = divmod(seconds, 3600)
+    minute, second = divmod(rest, 60)
+    return {
+        "%H:%M:%S": f"{hour:02d}:{minute:02d}:{second:02d}",
+        "%H%M%S": f"{hour:02d}{minute:02d}{second:02d}",
+        "%H:%M": f"{hour:02d}:{minute:02d}",
+    }[style]
+
+
+def _format_amount(amount, rng):
+    style = rng.random()
+    if style < 0.35:
+        return round(amount, 2)
+    if style < 0.7:
+        return f"{amount:,.2f}"
+    if style < 0.8 and amount < 0:
+        return f"({abs(amount):,.2f})"
+    if style < 0.9:
+        return f"{amount:.2f}"
+    return f"{amount:+,.2f}"
+
+
+def iter_rows(row_count, rng, start_id=1, dirty_rate=0.01, dirty_counter=None):
+    """
+    逐行生成default_template列顺序的行数据
+
+    dirty_counter为列表时，每注入一个脏行追加其行下标（从0开始）
+    """
+    date_style = rng.choice(DATE_STYLES)
+    time_style = rng.choice(TIME_STYLES)
+    targets = list(default_template)
+    dirty_columns = [targets.index(col) for col in DIRTY_VALUES]
+    accounts = [(_person(rng), _account(rng), rng.choice(BANKS) + rng.choice(BRANCHES)) for _ in range(50)]
+    start_day = date(2023, 1, 1)
+    balance = {}
+
+    for i in range(row_count):
+        name, account, bank = accounts[rng.randrange(len(accounts))]
+        amount = round(rng.uniform(-50000, 50000), 2)
+        balance[account] = round(balance.get(account, rng.uniform(1000, 100000)) + amount, 2)
+        day = start_day + timedelta(days=i * 730 // max(row_count, 1))
+        row = [
+            start_id + i,
+            _format_date(day, date_style if rng.random() >= MIXED_FORMAT_RATE else rng.choice(DATE_STYLES)),
+            _format_time(rng.randrange(86400), time_style if rng.random() >= MIXED_FORMAT_RATE else rng.choice(TIME_STYLES)),
+            name,
+            account,
+            bank,
+            rng.choice(["CNY", "人民币", "156"]),
+            "借" if amount < 0 else "贷",
+            _format_amount(amount, rng),
+            rng.choice(CHANNELS),
+            rng.choice(BRANCHES),
+            rng.choice(MEMOS),
+            balance[account],
+            _party(rng),
+            _account(rng),
+            rng.choice(BANKS),
+        ]
+        if dirty_rate and rng.random() < dirty_rate:
+            col = rng.choice(dirty_columns)
+            row[col] = rng.choice(DIRTY_VALUES[targets[col]])
+            if dirty_counter is not None:
+                dirty_counter.append(i)
+        yield row
+
+
+def generate_statements(output_dir, rows, dirty_rate=0.01, seed=0, rows_per_file=DEFAULT_ROWS_PER_FILE):
+    """
+    生成合成流水文件，已生成的文件直接复用
+
+    Returns:
+        list[dict]: 每个文件的 path、rows、dirty_rows、mapping（表头 -> 目标列）
+    """
+    rows_per_file = min(rows_per_file, MAX_SHEET_ROWS)
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    file_count = max((rows + rows_per_file - 1) // rows_per_file, 1)
+    for file_idx in range(file_count):
+        file_rows = min(rows_per_file, rows - file_idx * rows_per_file)
+        base = os.path.join(output_dir, f"statement_{rows}_{dirty_rate}_{seed}_{file_idx + 1}")
+        path, manifest_path = base + ".xlsx", base + ".json"
+        if os.path.exists(path) and os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                files.append(json.load(f))
+            continue
+
+        # 每个文件使用独立的随机序列，拆分方式不影响单个文件的内容
+        rng = random.Random(f"{seed}-{file_idx}")
+        headers, mapping = messy_headers(rng)
+        dirty = []
+        rows_iter = iter_rows(file_rows, rng, start_id=file_idx * rows_per_file + 1,
+                              dirty_rate=dirty_rate, dirty_counter=dirty)
+
+        def batches():
+            batch = []
+            for row in rows_iter:
+                batch.append(row)
+                if len(batch) >= WRITE_BATCH_ROWS:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        _write_xlsx_file(path, headers, batches(), lambda count: None)
+        info = {"path": path, "rows": file_rows, "dirty_rows": len(dirty), "mapping": mapping}
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        files.append(info)
+    return files
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    output_dir = sys.argv[1]
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    dirty_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    for info in generate_statements(output_dir, rows, dirty_rate, seed):
+        print(f"{info['path']}: {info['rows']} 行, 脏行 {info['dirty_rows']}")
+
+
+if __name__ == '__main__':
+    main()
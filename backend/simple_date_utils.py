@@ -1,10 +1,39 @@
 from dateutil import parser
+import os
 import re
+import threading
+import time
 from datetime import datetime
+from functools import lru_cache
+
+# 解析结果缓存大小，可通过环境变量DATE_CACHE_SIZE调整
+DEFAULT_CACHE_SIZE = int(os.environ.get('DATE_CACHE_SIZE', 65536))
+
+# 格式探测的样本数和最低匹配比例
+FORMAT_SAMPLE_SIZE = 200
+FORMAT_MIN_MATCH_RATIO = 0.8
+
+# 可快速解析的日期格式：(形状正则, strptime格式)
+# 只收录解析结果与parse_date完全一致的格式，形状不符或解析失败的值仍走parse_date
+DATE_FORMATS = [
+    (re.compile(r'^\d{8}$'), '%Y%m%d'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}$'), '%Y-%m-%d'),
+    (re.compile(r'^\d{4}/\d{2}/\d{2}$'), '%Y/%m/%d'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'), '%Y-%m-%d %H:%M:%S'),
+    (re.compile(r'^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}$'), '%Y/%m/%d %H:%M:%S'),
+]
+
+# 可快速解析的时间格式，规则同上
+TIME_FORMATS = [
+    (re.compile(r'^\d{2}:\d{2}:\d{2}$'), '%H:%M:%S'),
+    (re.compile(r'^\d{6}$'), '%H%M%S'),
+    (re.compile(r'^\d{2}:\d{2}$'), '%H:%M'),
+]
+
 
 def parse_date(value):
     """
-    使用dateutil库解析多种格式的日期
+    使用dateutil库解析多种格式的日期（结果按输入字符串缓存）
     
     Args:
         value: 要解析的日期字符串
@@ -16,8 +45,11 @@ def parse_date(value):
         return None
     
     # 确保是字符串
-    str_value = str(value).strip()
-    
+    return _cached_parse_date(str(value).strip())
+
+
+def _parse_date_string(str_value):
+    """parse_date的实际解析逻辑，输入为去除首尾空格的字符串"""
     # 处理带小数点的数值（如"20210610.0"）
     if '.' in str_value and str_value.split('.')[1] == '0':
         try:
@@ -74,7 +106,7 @@ def parse_date(value):
             
 def parse_time(value):
     """
-    解析多种格式的时间
+    解析多种格式的时间（结果按输入字符串缓存）
     
     Args:
         value: 要解析的时间字符串
@@ -86,8 +118,11 @@ def parse_time(value):
         return None
     
     # 转为字符串
-    value = str(value).strip()
-    
+    return _cached_parse_time(str(value).strip())
+
+
+def _parse_time_string(value):
+    """parse_time的实际解析逻辑，输入为去除首尾空格的字符串"""
     # 处理HHMMSS格式 (例如: 235959)
     if re.match(r'^\d{6}$', value):
         hh = value[:2]
@@ -181,4 +216,183 @@ def parse_time(value):
     except Exception:
         pass
     
-    return None
\ No newline at end of file
+    return None
+
+
+_cached_parse_date = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(_parse_date_string)
+_cached_parse_time = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(_parse_time_string)
+
+
+def configure_cache(maxsize):
+    """
+    重新设置日期和时间解析缓存的大小（会清空现有缓存）
+    
+    Args:
+        maxsize: 每个缓存最多保存的条目数，None表示不限制，0表示不缓存
+    """
+    global _cached_parse_date, _cached_parse_time
+    _cached_parse_date = lru_cache(maxsize=maxsize)(_parse_date_string)
+    _cached_parse_time = lru_cache(maxsize=maxsize)(_parse_time_string)
+
+
+def clear_cache():
+    """清空日期和时间解析缓存"""
+    _cached_parse_date.cache_clear()
+    _cached_parse_time.cache_clear()
+
+
+def get_cache_stats():
+    """
+    获取缓存命中统计
+    
+    Returns:
+        dict: {"date": {...}, "time": {...}}，每项包含hits、misses、size、maxsize
+    """
+    stats = {}
+    for name, cached in (("date", _cached_parse_date), ("time", _cached_parse_time)):
+        info = cached.cache_info()
+        stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+    return stats
+
+
+# 批量解析统计：按格式向量化解析和逐个回退解析的值数和耗时
+_parse_stats_lock = threading.Lock()
+_parse_stats = {}
+
+
+def _empty_parse_stats():
+    return {"calls": 0, "values": 0, "fast_values": 0, "fallback_values": 0,
+            "fast_seconds": 0.0, "fallback_seconds": 0.0}
+
+
+def get_parse_stats():
+    """
+    获取批量解析统计
+
+    Returns:
+        dict: {"date": {...}, "time": {...}}，每项包含calls、values、fast_values、fallback_values、
+        fast_seconds、fallback_seconds
+    """
+    with _parse_stats_lock:
+        return {kind: dict(_parse_stats.get(kind) or _empty_parse_stats()) for kind in ("date", "time")}
+
+
+def merge_parse_stats(delta):
+    """合并其他进程的批量解析统计增量（格式同get_parse_stats）"""
+    with _parse_stats_lock:
+        for kind, values in delta.items():
+            stats = _parse_stats.setdefault(kind, _empty_parse_stats())
+            for name, value in values.items():
+                stats[name] += value
+
+
+def reset_parse_stats():
+    """清零批量解析统计"""
+    with _parse_stats_lock:
+        _parse_stats.clear()
+
+
+def detect_format(values, formats):
+    """
+    根据样本探测一列值的格式
+    
+    Args:
+        values: 去除首尾空格的字符串序列
+        formats: DATE_FORMATS或TIME_FORMATS
+        
+    Returns:
+        (pattern, fmt): 样本中匹配比例最高且不低于FORMAT_MIN_MATCH_RATIO的格式，没有则返回None
+    """
+    samples = [v for v in values[:FORMAT_SAMPLE_SIZE] if v]
+    if not samples:
+        return None
+
+    best, best_count = None, 0
+    for pattern, fmt in formats:
+        count = 0
+        for v in samples:
+            if pattern.match(v):
+                try:
+                    datetime.strptime(v, fmt)
+                    count += 1
+                except ValueError:
+                    pass
+        if count > best_count:
+            best, best_count = (pattern, fmt), count
+
+    if best and best_count >= len(samples) * FORMAT_MIN_MATCH_RATIO:
+        return best
+    return None
+
+
+def _parse_values(values, formats, output_format, fallback, kind):
+    """按探测到的格式向量化解析，其余值交给fallback逐个解析"""
+    import pandas as pd
+
+    start = time.perf_counter()
+    values = list(values)
+    results = [None] * len(values)
+    detected = detect_format(values, formats)
+
+    fast_positions = []
+    if detected:
+        pattern, fmt = detected
+        fast_positions = [i for i, v in enumerate(values) if pattern.match(v)]
+        if fast_positions:
+            parsed = pd.to_datetime(pd.Series([values[i] for i in fast_positions], dtype=object),
+                                    format=fmt, errors='coerce')
+            formatted = parsed.dt.strftime(output_format)
+            # pandas接受第60秒并进位（23:59:60 -> 次日00:00:00），strptime不接受；
+            # 按原格式格式化后与输入不一致的值不采用快速结果
+            round_trip = parsed.dt.strftime(fmt)
+            for i, text, original in zip(fast_positions, formatted.tolist(), round_trip.tolist()):
+                # 格式不符的值（如2月30日）保持None，稍后走原有解析逻辑
+                if isinstance(text, str) and original == values[i]:
+                    results[i] = text
+
+    fallback_start = time.perf_counter()
+    fallback_count = 0
+    for i, v in enumerate(values):
+        if results[i] is None:
+            results[i] = fallback(v)
+            fallback_count += 1
+    end = time.perf_counter()
+
+    with _parse_stats_lock:
+        stats = _parse_stats.setdefault(kind, _empty_parse_stats())
+        stats["calls"] += 1
+        stats["values"] += len(values)
+        stats["fast_values"] += len(values) - fallback_count
+        stats["fallback_values"] += fallback_count
+        stats["fast_seconds"] += fallback_start - start
+        stats["fallback_seconds"] += end - fallback_start
+    return results
+
+
+def parse_date_values(values):
+    """
+    批量解析日期，结果与逐个调用parse_date一致
+    
+    先用样本探测整列的格式，符合该格式的值用pd.to_datetime(format=...)向量化解析，
+    其余值仍由parse_date（带缓存）解析。
+    
+    Args:
+        values: 去除首尾空格的字符串序列
+        
+    Returns:
+        list: 标准格式的日期字符串，无法解析的为None
+    """
+    return _parse_values(values, DATE_FORMATS, '%Y-%m-%d', parse_date, "date")
+
+
+def parse_time_values(values):
+    """
+    批量解析时间，结果与逐个调用parse_time一致（规则同parse_date_values）
+    
+    Args:
+        values: 去除首尾空格的字符串序列
+        
+    Returns:
+        list: 标准格式的时间字符串 (HH:MM:SS)，无法解析的为None
+    """
+    return _parse_values(values, TIME_FORMATS, '%H:%M:%S', parse_time, "time")
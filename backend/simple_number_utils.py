@@ -0,0 +1,142 @@
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
+
+# 金融数字格式：括号负数、正负号、千分位、百分号、末尾借贷标记（CR贷/DR借）
+# 例如: "1,234.56"、"(1,234.56)"、"-12.5%"、"1,234.56 DR"
+NUMBER_PATTERN = (
+    r'^(?P<open>\()?\s*(?P<sign>[+-])?\s*(?P<body>[\d,]*(?:\.[\d,]*)?)\s*'
+    r'(?P<percent>%)?\s*(?P<close>\))?\s*(?P<marker>CR|DR|Cr|Dr|cr|dr)?$'
+)
+NUMBER_RE = re.compile(NUMBER_PATTERN)
+_DIGIT_RE = re.compile(r'\d')
+
+
+def _normalize(value):
+    """全角字符（数字、逗号、小数点、百分号、括号、负号）转为半角"""
+    if value.isascii():
+        return value
+    return unicodedata.normalize('NFKC', value)
+
+
+def _is_negative(groups):
+    """
+    根据括号、负号和借贷标记判断正负
+
+    Returns:
+        bool: 是否为负数；同时出现多个负数标记时返回None（无法确定，交给原有逻辑处理）
+    """
+    negatives = sum([
+        groups["open"] is not None,
+        groups["sign"] == "-",
+        groups["marker"] is not None and groups["marker"].upper() == "DR"
+    ])
+    if negatives > 1:
+        return None
+    return negatives == 1
+
+
+def _match(value, allow_markers):
+    """匹配数字格式，返回分组字典，不符合时返回None"""
+    match = NUMBER_RE.match(_normalize(value) if allow_markers else value)
+    if not match:
+        return None
+    groups = match.groupdict()
+    if not _DIGIT_RE.search(groups["body"]):
+        return None
+    if (groups["open"] is None) != (groups["close"] is None):
+        return None
+    if not allow_markers and (groups["open"] or groups["percent"] or groups["marker"]):
+        return None
+    return groups
+
+
+def parse_number(value, allow_markers=True):
+    """
+    精确解析金融格式的数字
+
+    Args:
+        value: 去除首尾空格的字符串
+        allow_markers: 是否识别全角字符、括号负数、百分号和借贷标记（整数列不识别，保持原有解析规则）
+
+    Returns:
+        Decimal: 解析结果，格式不符时返回None（由调用方回退到Babel解析）
+    """
+    groups = _match(value, allow_markers)
+    if groups is None:
+        return None
+    negative = _is_negative(groups)
+    if negative is None:
+        return None
+
+    try:
+        number = Decimal(groups["body"].replace(',', ''))
+    except InvalidOperation:
+        return None
+    if groups["percent"]:
+        number = number / 100
+    return number.copy_negate() if negative else number
+
+
+def parse_number_values(values, target_type="float"):
+    """
+    批量解析一列数字字符串
+
+    用一次正则提取处理整列，浮点数直接由数字部分转换，百分比按Decimal精确计算；
+    千分位的处理与Babel非严格模式（去掉逗号后按Decimal解析）一致。
+
+    Args:
+        values: 去除首尾空格的非空字符串序列
+        target_type: "float" 或 "int"（整数不识别全角字符、括号、百分号和借贷标记）
+
+    Returns:
+        (results, unparsed): 结果列表（float或int，未解析的为None），以及未解析值的下标列表
+    """
+    values = list(values)
+    results = [None] * len(values)
+    if not values:
+        return results, []
+
+    if target_type == "int":
+        series = pd.Series(values, dtype=object)
+    else:
+        series = pd.Series([_normalize(v) for v in values], dtype=object)
+    parts = series.str.extract(NUMBER_PATTERN)
+
+    body = parts["body"].fillna("")
+    matched = body.str.contains(r'\d', regex=True)
+    matched &= parts["open"].isna() == parts["close"].isna()
+    negatives = (
+        parts["open"].notna().astype(int)
+        + (parts["sign"] == "-").astype(int)
+        + parts["marker"].fillna("").str.upper().eq("DR").astype(int)
+    )
+    matched &= negatives <= 1
+    if target_type == "int":
+        matched &= parts["open"].isna() & parts["percent"].isna() & parts["marker"].isna()
+
+    positions = np.flatnonzero(matched.to_numpy())
+    if positions.size:
+        clean = body.iloc[positions].str.replace(',', '', regex=False).tolist()
+        negative = (negatives.iloc[positions] == 1).tolist()
+        percent = parts["percent"].iloc[positions].notna().tolist()
+
+        if target_type == "int":
+            for pos, text, neg in zip(positions, clean, negative):
+                number = int(text) if '.' not in text else int(Decimal(text))
+                results[pos] = -number if neg else number
+        else:
+            numbers = np.array(clean, dtype=object).astype(np.float64)
+            numbers[negative] = -numbers[negative]
+            numbers = numbers.tolist()
+            for i, pos in enumerate(positions):
+                if percent[i]:
+                    number = Decimal(clean[i]) / 100
+                    numbers[i] = float(number.copy_negate() if negative[i] else number)
+                results[pos] = numbers[i]
+
+    unparsed = [i for i, matched_value in enumerate(matched.tolist()) if not matched_value]
+    return results, unparsed
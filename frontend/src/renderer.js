@@ -2065,6 +2065,14 @@ function displayProcessingStats(data) {
     statsEl.appendChild(totalProcessedEl);
     statsEl.appendChild(totalRejectedEl);
 
+    // 重试后仍无法写入数据库的行（与ID重复的行分开统计）
+    if (data.total_failed) {
+        const totalFailedEl = document.createElement('div');
+        totalFailedEl.className = 'stats-item';
+        totalFailedEl.innerHTML = `<strong>写入失败行数:</strong> <span class="error-message">${data.total_failed}</span>`;
+        statsEl.appendChild(totalFailedEl);
+    }
+
     // Add file stats
     if (data.file_stats && data.file_stats.length > 0) {
         const fileStatsEl = document.createElement('div');
@@ -2081,6 +2089,18 @@ function displayProcessingStats(data) {
             }
 
             fileStatsEl.appendChild(fileStatEl);
+
+            // 选择了工作表时逐个显示工作表的统计
+            (stat.sheets || []).forEach(sheet => {
+                const sheetStatEl = document.createElement('div');
+                sheetStatEl.className = 'file-stat-item sheet-stat-item';
+                if (sheet.error) {
+                    sheetStatEl.innerHTML = `<span>└ ${sheet.sheet_name}</span> <span class="error-message">${sheet.error}</span>`;
+                } else {
+                    sheetStatEl.innerHTML = `<span>└ ${sheet.sheet_name}</span> <span>处理: ${sheet.processed_rows} / 总行数: ${sheet.total_rows} / 需校对: ${sheet.rejected_rows}</span>`;
+                }
+                fileStatsEl.appendChild(sheetStatEl);
+            });
         });
 
         statsEl.appendChild(fileStatsEl);
@@ -176,6 +176,37 @@ function verifyHardwareId(currentId) {
 }
 
 // 启动Python后端
+// 处理后端stderr的一行输出
+// 进度行（"Progress: 12.50%"、"Export progress: 12.50%"）转发为进度事件；
+// INFO/DEBUG日志只写控制台，其余（警告、错误、验证信息）转发到渲染进程
+function handleBackendLine(line) {
+  if (!line.trim()) {
+    return;
+  }
+
+  const progressMatch = line.match(/^(Export progress|Progress): ([\d.]+)%\s*$/);
+  if (progressMatch) {
+    if (mainWindow) {
+      mainWindow.webContents.send('backend-progress', {
+        kind: progressMatch[1] === 'Progress' ? 'ingest' : 'export',
+        percent: parseFloat(progressMatch[2])
+      });
+    }
+    return;
+  }
+
+  if (line.startsWith('INFO ') || line.startsWith('DEBUG ')) {
+    console.log(`后端日志: ${line}`);
+    return;
+  }
+
+  console.error(`后端错误: ${line}`);
+  // 将重要错误信息转发到渲染进程显示给用户
+  if (mainWindow) {
+    mainWindow.webContents.send('backend-error', line);
+  }
+}
+
 function startBackend() {
   // 准备环境变量：加入硬件ID和过期日期
   const env = {
@@ -183,7 +214,9 @@ function startBackend() {
     HARDWARE_ID: hardwareId,
     EXPIRATION_DATE: expirationDate.toISOString(),
     TARGET_PORT: targetPort.toString(),
-    DEV_MODE: isDev ? "true" : "false"
+    DEV_MODE: isDev ? "true" : "false",
+    BACKEND_DATA_DIR: app.getPath('userData'),
+    BACKEND_LOG_FILE: path.join(app.getPath('userData'), 'logs', 'backend.log')
   };
   
   // 根据应用是否打包决定使用哪个后端可执行文件
@@ -224,13 +257,13 @@ function startBackend() {
     console.log(`后端输出: ${iconv.decode(data, 'gbk')}`);
   });
   
+  // stderr按行解析：数据块可能在行中间截断，未完成的行留到下次拼接
+  let stderrBuffer = '';
   backendProcess.stderr.on('data', (data) => {
-    console.error(`后端错误: ${iconv.decode(data, 'gbk')}`);
-    
-    // 将重要错误信息转发到渲染进程显示给用户
-    if (mainWindow) {
-      mainWindow.webContents.send('backend-error', iconv.decode(data, 'gbk'));
-    }
+    stderrBuffer += iconv.decode(data, 'gbk');
+    const lines = stderrBuffer.split(/\r?\n/);
+    stderrBuffer = lines.pop();
+    lines.forEach(handleBackendLine);
   });
   
   // 处理后端退出
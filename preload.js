@@ -31,6 +31,11 @@ contextBridge.exposeInMainWorld('electronAPI', {
         ipcRenderer.on('backend-error', (event, data) => callback(data));
     },
     
+    // 添加接收后端进度的监听器，data为 {kind: 'ingest' | 'export', percent}
+    onBackendProgress: (callback) => {
+        ipcRenderer.on('backend-progress', (event, data) => callback(data));
+    },
+    
     // 添加处理后端崩溃的监听器
     onBackendCrash: (callback) => {
         ipcRenderer.on('backend-crash', (event, data) => callback(data));